@@ -1,13 +1,83 @@
-from flask import Flask, render_template_string, request, jsonify, flash, redirect, url_for
+from flask import Flask, render_template_string, request, jsonify, flash, redirect, url_for, Response, stream_with_context, g, has_request_context, send_from_directory
 import joblib
 import numpy as np
 import pandas as pd
+import io
 import os
+import json
+import struct
+import zlib
+import mimetypes
+import hashlib
+import threading
+import time
+import atexit
+import sys
+import hmac
+import re
+import secrets
+import shutil
+import sqlite3
+import random
+import tempfile
+import zipfile
+from collections import OrderedDict, Counter, deque
+from datetime import datetime, timezone
+from sklearn.neighbors import KDTree
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from scipy.special import expit
 from werkzeug.utils import secure_filename
 
+import informes
+from esquema import CABECERA_TRAMA, COLUMNAS_MODELO, RANGOS_VALIDOS, TRAMA_ERROR
+from modelo_lineal import ModeloLinealCompilado
+
+# Compresores opcionales para Content-Encoding: br y zstd (gzip siempre disponible)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 app = Flask(__name__)
 app.secret_key = 'tu_clave_secreta_aqui'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max per request; larger files go through /api/cargas in chunks
+app.config['IDEMPOTENCIA_TTL'] = 300  # segundos que se conserva un resultado repetible
+app.config['IDEMPOTENCIA_MAX_ENTRADAS'] = 256
+app.config['TAMANO_BLOQUE_STREAMING'] = 10000  # filas puntuadas por bloque en respuestas en streaming
+app.config['TAMANO_MINIMO_COMPRESION'] = 1024  # bytes
+# Precisión por defecto de /api/procesar-csv; float32 usa la versión compilada del modelo (ver ModeloLinealCompilado)
+app.config['PRECISION_LOTES'] = 'float64'
+# Canal binario de scoring (POST /api/puntuar y servidor_binario.py): tramas de vectores float32 ya codificados
+app.config['CANAL_BINARIO_MAX_FILAS'] = 4096  # vectores por trama o por solicitud JSON
+# Intervalos de incertidumbre de los modelos con ensamble bootstrap (ver 'bootstrap' en MODELOS)
+app.config['INTERVALOS_NIVEL'] = 0.90  # cobertura del intervalo percentil
+app.config['INTERVALOS_BLOQUE_BYTES'] = 4 * 1024 * 1024  # tope de la matriz de logits (filas x réplicas) por bloque
+
+# Control de admisión: carriles separados para que los lotes no dejen sin workers a las evaluaciones individuales
+app.config['ADMISION_ACTIVA'] = True
+app.config['CARRILES'] = {
+    # concurrencia: solicitudes simultáneas; max_cola: en espera antes de rechazar (503); espera_max: segundos en cola
+    # tasa/rafaga: token bucket por cliente (solicitudes por segundo y ráfaga máxima) antes de responder 429
+    'interactivo': {'concurrencia': 8, 'max_cola': 32, 'espera_max': 5, 'tasa': 5.0, 'rafaga': 20},
+    'lotes': {'concurrencia': 2, 'max_cola': 4, 'espera_max': 30, 'tasa': 0.5, 'rafaga': 5},
+    # Fragmentos de cargas grandes: muchas solicitudes cortas por archivo
+    'cargas': {'concurrencia': 4, 'max_cola': 16, 'espera_max': 30, 'tasa': 20.0, 'rafaga': 50},
+    # Integraciones que puntúan de a un paciente con alta frecuencia (/api/puntuar)
+    'integraciones': {'concurrencia': 4, 'max_cola': 64, 'espera_max': 2, 'tasa': 200.0, 'rafaga': 400},
+}
+# Direcciones de los proxies propios: solo de ellas se acepta 'X-Client-Id' como identidad del cliente
+# (límite de tasa e idempotencia); el resto se identifica por su dirección
+app.config['PROXIES_CONFIABLES'] = [p for p in os.environ.get('PROXIES_CONFIABLES', '').split(',') if p]
+
+# Perfilado bajo demanda: sin token en el entorno al arrancar, los endpoints /admin/perfilado no se registran
+app.config['PERFILADO_TOKEN'] = os.environ.get('PERFILADO_TOKEN')
+app.config['PERFILADO_SEGUNDOS_MAX'] = 600
 
 # Configuración para archivos subidos
 UPLOAD_FOLDER = 'uploads'
@@ -17,55 +87,2183 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Crear carpeta de uploads si no existe
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Cargar el modelo entrenado
+# Hashes y probabilidades por fila de la última carga de cada cohorte (re-scoring incremental)
+COHORTES_FOLDER = os.path.join(UPLOAD_FOLDER, 'cohortes')
+os.makedirs(COHORTES_FOLDER, exist_ok=True)
+
+# Cargas por fragmentos (/api/cargas): cada fragmento es una solicitud, limitada por MAX_CONTENT_LENGTH
+app.config['CARGAS_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'cargas')
+app.config['CARGAS_TTL'] = 24 * 3600  # segundos sin actividad antes de borrar una carga abandonada
+app.config['CARGAS_MAX_FRAGMENTOS'] = 100_000
+app.config['CARGAS_MAX_BYTES'] = 20 * 1024 ** 3
+app.config['CARGAS_INTERVALO_ESTADO'] = 1.0  # segundos mínimos entre escrituras de estado.json por fragmento o tramo
+
+# Ingesta por carpeta compartida (ingesta_carpeta.py): el middleware deja CSV en <carpeta>/entrada
+# y los resultados aparecen en <carpeta>/salida
+app.config['BANDEJA_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'bandeja')
+
+# Informes por paciente de un lote puntuado (/informes/<hash>.zip), renderizados en un pool de procesos
+app.config['INFORMES_PROCESOS'] = os.cpu_count() or 1  # con 1 se renderiza en el proceso de la solicitud
+app.config['INFORMES_FILAS_POR_TAREA'] = 250
+
+# Assets con huella generados por construir_assets.py; se cachean como inmutables
+ASSETS_FOLDER = os.path.join('static', 'dist')
+app.config['ASSETS_MAX_AGE'] = 365 * 24 * 3600
+
+def cargar_manifiesto_assets(carpeta):
+    """Mapa nombre lógico -> archivo con huella; vacío si no se construyeron los assets"""
+    try:
+        with open(os.path.join(carpeta, 'manifiesto.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print("⚠️ Assets sin construir: se sirven desde /static sin huella (ejecute construir_assets.py)")
+        return {}
+
+manifiesto_assets = cargar_manifiesto_assets(ASSETS_FOLDER)
+
+def url_asset(nombre):
+    """URL del asset con huella, o del original en /static si no está en el manifiesto"""
+    entrada = manifiesto_assets.get(nombre)
+    if entrada is None:
+        return url_for('static', filename=nombre)
+    return url_for('servir_asset', archivo=entrada['archivo'])
+
+@app.context_processor
+def inyectar_assets():
+    return {'asset': url_asset, 'manifiesto_assets': manifiesto_assets}
+
+# Modelos registrados: 'trafico' es el peso relativo de tráfico A/B que recibe cada uno.
+# El pkl de stacking solo contiene el meta-modelo (entradas = salidas de los modelos base),
+# por eso el registro lo descarta hasta que exista un artefacto con los modelos base.
+# 'calibracion' (opcional): tabla generada con `python entrenar.py --calibracion isotonica`,
+# p. ej. 'CKD_LR_hp_calibracion.json'; se aplica con np.interp sobre predict_proba.
+# 'bootstrap' (opcional): réplicas generadas con `python entrenar.py --bootstrap 1000`,
+# p. ej. 'CKD_LR_hp_bootstrap.npz'; dan el intervalo percentil de cada probabilidad.
+app.config['MODELOS'] = [
+    {'nombre': 'lr', 'version': 'hp', 'ruta': 'CKD_LR_hp.pkl', 'trafico': 100, 'calibracion': None,
+     'bootstrap': None},
+    {'nombre': 'stacking', 'version': 'hp', 'ruta': 'CKD_Stacking_lstmtansformer_hp.pkl', 'trafico': 0},
+]
+app.config['MODELO_SOMBRA'] = None  # nombre del modelo retador que puntúa en sombra cada lote
+app.config['SOMBRA_MAX_FILAS_PENDIENTES'] = 1_000_000  # los lotes que no entran en la cola no se comparan
+
+# Auditoría de predicciones: buffer en memoria volcado en bloques columnares a segmentos append-only
+app.config['AUDITORIA_ACTIVA'] = True
+app.config['AUDITORIA_FOLDER'] = 'auditoria'
+app.config['AUDITORIA_MAX_FILAS_PENDIENTES'] = 500000  # límite de memoria; al llegar, los productores esperan
+app.config['AUDITORIA_ESPERA_MAX'] = 5  # segundos de espera antes de descartar un bloque (se registra el error)
+app.config['AUDITORIA_INTERVALO'] = 1.0  # segundos entre volcados
+app.config['AUDITORIA_SEGMENTO_BYTES'] = 64 * 1024 * 1024
+app.config['AUDITORIA_SEGMENTO_SEGUNDOS'] = 3600
+
+# Historial por paciente (SQLite): filas puntuadas con identificador de paciente, escritas en lotes
+app.config['HISTORIAL_ACTIVO'] = True
+app.config['HISTORIAL_RUTA'] = os.path.join(UPLOAD_FOLDER, 'historial.sqlite3')
+app.config['HISTORIAL_INTERVALO'] = 1.0  # segundos entre volcados
+app.config['HISTORIAL_MAX_FILAS_PENDIENTES'] = 200000  # al llegar, quien registra vuelca sin esperar al hilo
+
+# Cargar los modelos entrenados
 import pickle
 
-try:
-    with open('CKD_LR_hp.pkl', 'rb') as f:
-        modelo = pickle.load(f)
-    print("✅ Modelo cargado exitosamente")
-except Exception as e:
-    print(f"❌ Error al cargar el modelo: {e}")
-    modelo = None
 
+class AuditoriaPredicciones:
+    """Registro de cada predicción (entradas, modelo, probabilidad, instante) sin escribir en la solicitud.
+
+    Las entradas son las que vio el modelo, ya imputadas; una máscara aparte marca cuáles
+    faltaban en lo enviado y se completaron con la media de referencia.
+
+    Los productores solo encolan bloques en memoria; un hilo los agrupa y los escribe como
+    un bloque columnar (npz con longitud prefijada) al final del segmento actual, que rota
+    por tamaño o por antigüedad. Los lotes se encolan como un único bloque.
+    """
+
+    def __init__(self, carpeta, max_filas_pendientes, espera_max, intervalo, segmento_bytes, segmento_segundos):
+        self.carpeta = carpeta
+        self.max_filas_pendientes = max_filas_pendientes
+        self.espera_max = espera_max
+        self.intervalo = intervalo
+        self.segmento_bytes = segmento_bytes
+        self.segmento_segundos = segmento_segundos
+        self._condicion = threading.Condition()
+        self._escritura = threading.Lock()
+        self._pendientes = []
+        self._filas_pendientes = 0
+        self._archivo = None
+        self._segmento_inicio = 0.0
+        self._hilo = None
+        self.metricas = {'bloques_escritos': 0, 'filas_escritas': 0, 'bytes_escritos': 0, 'segmentos': 0,
+                         'esperas_backpressure': 0, 'filas_descartadas': 0, 'segundos_escritura': 0.0}
+
+    def iniciar(self):
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._hilo = threading.Thread(target=self._bucle, name='auditoria', daemon=True)
+        self._hilo.start()
+        atexit.register(self.volcar)
+
+    def registrar(self, X, probabilidades, modelo_usado, ruta, imputados=None):
+        filas = len(X)
+        bloque = {
+            'ts': np.full(filas, time.time()),
+            'entradas': np.array(X, dtype=np.float64, copy=True),
+            'imputados': np.zeros(X.shape, dtype=bool) if imputados is None else np.array(imputados, dtype=bool, copy=True),
+            'probabilidad': np.array(probabilidades, dtype=np.float64, copy=True),
+            'modelo': modelo_usado,
+            'ruta': ruta or '',
+        }
+        with self._condicion:
+            limite = time.monotonic() + self.espera_max
+            if self._filas_pendientes + filas > self.max_filas_pendientes:
+                self.metricas['esperas_backpressure'] += 1
+                self._condicion.notify_all()
+            while self._filas_pendientes + filas > self.max_filas_pendientes and self._filas_pendientes > 0:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.metricas['filas_descartadas'] += filas
+                    app.logger.error("Auditoría saturada: se descartan %d predicciones de %s", filas, ruta)
+                    return
+                self._condicion.wait(restante)
+            self._pendientes.append(bloque)
+            self._filas_pendientes += filas
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                self._condicion.wait(self.intervalo)
+            self.volcar()
+
+    def volcar(self):
+        """Escribe todo lo pendiente: un bloque columnar por (modelo, ruta)"""
+        with self._escritura:
+            self._volcar()
+
+    def _volcar(self):
+        with self._condicion:
+            pendientes, self._pendientes = self._pendientes, []
+            filas = self._filas_pendientes
+            self._filas_pendientes = 0
+            self._condicion.notify_all()
+        if not pendientes:
+            return
+        inicio = time.perf_counter()
+        grupos = OrderedDict()
+        for bloque in pendientes:
+            grupos.setdefault((bloque['modelo'], bloque['ruta']), []).append(bloque)
+        escritos = 0
+        for (modelo_usado, ruta), bloques in grupos.items():
+            buffer = io.BytesIO()
+            np.savez(buffer,
+                     ts=np.concatenate([b['ts'] for b in bloques]),
+                     entradas=np.concatenate([b['entradas'] for b in bloques]),
+                     imputados=np.concatenate([b['imputados'] for b in bloques]),
+                     probabilidad=np.concatenate([b['probabilidad'] for b in bloques]),
+                     modelo=np.array(modelo_usado), ruta=np.array(ruta),
+                     columnas=np.array(COLUMNAS_MODELO))
+            datos = buffer.getvalue()
+            archivo = self._segmento(len(datos))
+            archivo.write(struct.pack('<Q', len(datos)) + datos)
+            escritos += 8 + len(datos)
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self.metricas['bloques_escritos'] += len(grupos)
+        self.metricas['filas_escritas'] += filas
+        self.metricas['bytes_escritos'] += escritos
+        self.metricas['segundos_escritura'] += time.perf_counter() - inicio
+
+    def _segmento(self, bytes_nuevos):
+        """Segmento abierto, rotando si superaría el tamaño máximo o ya es demasiado antiguo"""
+        if self._archivo is not None and (
+                self._archivo.tell() + bytes_nuevos > self.segmento_bytes
+                or time.time() - self._segmento_inicio > self.segmento_segundos):
+            self._archivo.close()
+            self._archivo = None
+        if self._archivo is None:
+            self._segmento_inicio = time.time()
+            nombre = time.strftime('segmento-%Y%m%d-%H%M%S', time.gmtime(self._segmento_inicio))
+            ruta = os.path.join(self.carpeta, f'{nombre}-{os.getpid()}.auditoria')
+            self._archivo = open(ruta, 'ab')
+            self.metricas['segmentos'] += 1
+        return self._archivo
+
+    def estado(self):
+        with self._condicion:
+            return dict(self.metricas, filas_pendientes=self._filas_pendientes,
+                        segmento=self._archivo.name if self._archivo else None)
+
+
+def leer_auditoria(ruta):
+    """Lee un segmento de auditoría como un DataFrame (una fila por predicción), con una columna
+    booleana imputado_<variable> por cada variable del modelo"""
+    partes = []
+    with open(ruta, 'rb') as f:
+        while True:
+            cabecera = f.read(8)
+            if len(cabecera) < 8:
+                break
+            (longitud,) = struct.unpack('<Q', cabecera)
+            with np.load(io.BytesIO(f.read(longitud)), allow_pickle=False) as bloque:
+                parte = pd.DataFrame(bloque['entradas'], columns=bloque['columnas'])
+                parte.insert(0, 'ts', pd.to_datetime(bloque['ts'], unit='s'))
+                parte['probabilidad'] = bloque['probabilidad']
+                parte['modelo'] = str(bloque['modelo'])
+                parte['ruta'] = str(bloque['ruta'])
+                # Los segmentos escritos antes de la máscara no distinguen imputados: se leen como medidos
+                if 'imputados' in bloque.files:
+                    imputados = bloque['imputados']
+                else:
+                    imputados = np.zeros((len(parte), len(bloque['columnas'])), dtype=bool)
+                parte[[f'imputado_{c}' for c in bloque['columnas']]] = imputados
+            partes.append(parte)
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+class HistorialPacientes:
+    """Predicciones por paciente y fecha de panel en SQLite, para seguir la trayectoria de riesgo.
+
+    Las solicitudes solo encolan filas; un hilo las escribe en lotes, una transacción por
+    volcado y ordenadas por clave. La clave primaria (paciente, ts) sirve el historial de un
+    paciente por rango de fechas y dos índices cubrientes, por fecha y por probabilidad, el
+    ranking de mayor riesgo en una ventana. En modo WAL las lecturas no esperan a las
+    escrituras. Cada paciente conserva una predicción por fecha de panel: volver a puntuar
+    el mismo panel la reemplaza.
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS predicciones (
+            paciente TEXT NOT NULL,
+            ts REAL NOT NULL,
+            probabilidad REAL NOT NULL,
+            modelo TEXT NOT NULL,
+            origen TEXT NOT NULL,
+            PRIMARY KEY (paciente, ts)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS predicciones_ts ON predicciones (ts, probabilidad, paciente);
+        CREATE INDEX IF NOT EXISTS predicciones_probabilidad ON predicciones (probabilidad, ts, paciente);
+    """
+
+    # Con pocas filas en la ventana conviene recorrerla por fecha y agrupar por paciente; con
+    # muchas, recorrer por probabilidad descendente y cortar al juntar `limite` pacientes
+    FILAS_VENTANA_CORTA = 5000
+
+    def __init__(self, ruta, intervalo, max_filas_pendientes):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.max_filas_pendientes = max_filas_pendientes
+        self._condicion = threading.Condition()
+        self._escritura = threading.Lock()
+        self._pendientes = []
+        self._filas_pendientes = 0
+        self._local = threading.local()
+        self._escritor = None
+        self.metricas = {'lotes_escritos': 0, 'filas_escritas': 0, 'segundos_escritura': 0.0,
+                         'volcados_sincronicos': 0}
+
+    def _conectar(self, check_same_thread=True):
+        conexion = sqlite3.connect(self.ruta, check_same_thread=check_same_thread)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        return conexion
+
+    def iniciar(self):
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        # El escritor se usa desde el hilo de volcado y desde atexit, siempre con _escritura tomado
+        self._escritor = self._conectar(check_same_thread=False)
+        self._escritor.executescript(self.ESQUEMA)
+        threading.Thread(target=self._bucle, name='historial', daemon=True).start()
+        atexit.register(self.volcar)
+
+    def _lector(self):
+        """Conexión de lectura propia de cada hilo"""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = self._local.conexion = self._conectar()
+        return conexion
+
+    def registrar(self, pacientes, ts, probabilidades, modelo_usado, origen):
+        if not len(pacientes):
+            return
+        bloque = (np.asarray(pacientes, dtype=str), np.asarray(ts, dtype=np.float64),
+                  np.asarray(probabilidades, dtype=np.float64), modelo_usado, origen)
+        with self._condicion:
+            self._pendientes.append(bloque)
+            self._filas_pendientes += len(pacientes)
+            lleno = self._filas_pendientes >= self.max_filas_pendientes
+            if lleno:
+                self.metricas['volcados_sincronicos'] += 1
+        if lleno:
+            self.volcar()
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                self._condicion.wait(self.intervalo)
+            self.volcar()
+
+    def volcar(self):
+        with self._escritura:
+            self._volcar()
+
+    def _volcar(self):
+        with self._condicion:
+            pendientes, self._pendientes = self._pendientes, []
+            filas, self._filas_pendientes = self._filas_pendientes, 0
+        if not pendientes:
+            return
+        inicio = time.perf_counter()
+        pacientes = np.concatenate([b[0] for b in pendientes])
+        ts = np.concatenate([b[1] for b in pendientes])
+        probabilidades = np.concatenate([b[2] for b in pendientes])
+        tamanos = [len(b[0]) for b in pendientes]
+        modelos = np.repeat([b[3] for b in pendientes], tamanos)
+        origenes = np.repeat([b[4] for b in pendientes], tamanos)
+        # En orden de clave las inserciones recorren el árbol B de forma secuencial; lexsort es
+        # estable, así que si un panel se repite en el lote queda el registrado último
+        orden = np.lexsort((ts, pacientes))
+        with self._escritor:
+            self._escritor.executemany(
+                'INSERT OR REPLACE INTO predicciones VALUES (?, ?, ?, ?, ?)',
+                zip(pacientes[orden].tolist(), ts[orden].tolist(), probabilidades[orden].tolist(),
+                    modelos[orden].tolist(), origenes[orden].tolist()))
+        with self._condicion:
+            self.metricas['lotes_escritos'] += 1
+            self.metricas['filas_escritas'] += filas
+            self.metricas['segundos_escritura'] += time.perf_counter() - inicio
+
+    def historial(self, paciente, desde, hasta):
+        """[(ts, probabilidad, modelo, origen)] del paciente entre desde y hasta, en orden cronológico"""
+        return self._lector().execute(
+            'SELECT ts, probabilidad, modelo, origen FROM predicciones '
+            'WHERE paciente = ? AND ts BETWEEN ? AND ? ORDER BY ts', (paciente, desde, hasta)).fetchall()
+
+    def mayor_riesgo(self, desde, limite):
+        """[(paciente, probabilidad, ts)] de los `limite` pacientes con la mayor probabilidad desde `desde`"""
+        conexion = self._lector()
+        en_ventana = conexion.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM predicciones INDEXED BY predicciones_ts WHERE ts >= ? LIMIT ?)',
+            (desde, self.FILAS_VENTANA_CORTA + 1)).fetchone()[0]
+        if en_ventana <= self.FILAS_VENTANA_CORTA:
+            return conexion.execute(
+                'SELECT paciente, MAX(probabilidad), ts FROM predicciones INDEXED BY predicciones_ts '
+                'WHERE ts >= ? GROUP BY paciente ORDER BY 2 DESC LIMIT ?', (desde, limite)).fetchall()
+        maximos = OrderedDict()
+        cursor = conexion.execute(
+            'SELECT paciente, probabilidad, ts FROM predicciones INDEXED BY predicciones_probabilidad '
+            'WHERE ts >= ? ORDER BY probabilidad DESC', (desde,))
+        try:
+            for paciente, probabilidad, ts in cursor:
+                if paciente not in maximos:
+                    maximos[paciente] = (paciente, probabilidad, ts)
+                    if len(maximos) == limite:
+                        break
+        finally:
+            cursor.close()
+        return list(maximos.values())
+
+    def estado(self):
+        with self._condicion:
+            return dict(self.metricas, filas_pendientes=self._filas_pendientes, ruta=self.ruta)
+
+
+class RegistroModelos:
+    """Modelos con nombre y versión, ruteo A/B por porcentaje de tráfico y scoring en sombra.
+
+    El preprocesamiento se hace una vez por lote fuera del registro; cada modelo solo
+    paga su propio predict_proba sobre la misma matriz. El modelo en sombra puntúa en un
+    hilo aparte, fuera de la solicitud, con una cola acotada por filas: si está llena el
+    lote no se compara y se cuenta como descartado.
+    """
+
+    def __init__(self, max_filas_sombra=1_000_000):
+        self.modelos = OrderedDict()
+        self.sombra = None
+        self.auditoria = None
+        self.cubo = None
+        self.max_filas_sombra = max_filas_sombra
+        self._lock = threading.Lock()
+        self._condicion_sombra = threading.Condition()
+        self._sombra_pendientes = deque()
+        self._filas_sombra_pendientes = 0
+        self._sombra_en_curso = 0
+        self._hilo_sombra = None
+
+    def registrar(self, nombre, version, estimador, trafico=0, calibracion=None, bootstrap=None):
+        self.modelos[nombre] = {
+            'nombre': nombre,
+            'version': version,
+            'estimador': estimador,
+            'estimador_float32': compilar_float32(estimador),
+            'trafico': trafico,
+            'calibracion': calibracion,
+            'bootstrap': bootstrap,
+            'huella': huella_modelo(estimador, calibracion),
+            'metricas': {'lotes': 0, 'filas': 0, 'segundos': 0.0,
+                         'lotes_sombra': 0, 'filas_sombra': 0, 'segundos_sombra': 0.0,
+                         'acuerdo_sombra': None, 'lotes_sombra_descartados': 0,
+                         'lotes_intervalos': 0, 'filas_intervalos': 0, 'segundos_intervalos': 0.0},
+        }
+
+    def principal(self):
+        """Modelo con más tráfico asignado (el primero registrado si ninguno tiene tráfico)"""
+        if not self.modelos:
+            return None
+        return max(self.modelos.values(), key=lambda m: m['trafico'])
+
+    def elegir(self, clave_ruteo):
+        """Elige el modelo de forma determinista a partir de la clave: el mismo lote siempre va al mismo modelo"""
+        con_trafico = [m for m in self.modelos.values() if m['trafico'] > 0]
+        if not con_trafico:
+            return self.principal()
+        total = sum(m['trafico'] for m in con_trafico)
+        cubeta = int.from_bytes(hashlib.sha1(clave_ruteo).digest()[:8], 'big') % 10000 / 10000 * total
+        acumulado = 0
+        for m in con_trafico:
+            acumulado += m['trafico']
+            if cubeta < acumulado:
+                return m
+        return con_trafico[-1]
+
+    def _medir(self, entrada, X, sufijo):
+        # Las matrices float32 van a la versión compilada en float32 si el modelo la tiene
+        estimador = entrada['estimador']
+        if X.dtype == np.float32 and entrada['estimador_float32'] is not None:
+            estimador = entrada['estimador_float32']
+        inicio = time.perf_counter()
+        p = estimador.predict_proba(X)[:, 1]
+        if entrada['calibracion'] is not None:
+            p = calibrar(p, entrada['calibracion'])
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            metricas = entrada['metricas']
+            metricas['lotes' + sufijo] += 1
+            metricas['filas' + sufijo] += len(X)
+            metricas['segundos' + sufijo] += duracion
+        return p
+
+    def puntuar(self, X, clave_ruteo=None, hipotetico=False, imputados=None):
+        """Probabilidad de ERC de la matriz ya preprocesada; devuelve (probabilidades, modelo usado).
+
+        `imputados` es la máscara de los valores que preparar_matriz completó, para la auditoría.
+        Las filas hipotéticas (barridos de sensibilidad) no se auditan, no entran al cubo de
+        analítica ni se comparan contra el modelo en sombra.
+        """
+        if clave_ruteo is None:
+            clave_ruteo = X.tobytes()
+        entrada = self.elegir(clave_ruteo)
+        p = self._medir(entrada, X, '')
+        if hipotetico:
+            return p, entrada
+        if self.auditoria is not None:
+            self.auditoria.registrar(X, p, f"{entrada['nombre']}:{entrada['version']}",
+                                     request.endpoint if has_request_context() else None, imputados)
+        if self.cubo is not None:
+            self.cubo.agregar(X, p, imputados=imputados)
+
+        sombra = self.modelos.get(self.sombra)
+        if sombra is not None and sombra is not entrada:
+            self._encolar_sombra(sombra, entrada, X, p)
+        return p, entrada
+
+    def _encolar_sombra(self, sombra, entrada, X, p):
+        with self._condicion_sombra:
+            if self._filas_sombra_pendientes + len(X) > self.max_filas_sombra and self._sombra_pendientes:
+                with self._lock:
+                    sombra['metricas']['lotes_sombra_descartados'] += 1
+                return
+            if self._hilo_sombra is None:
+                self._hilo_sombra = threading.Thread(target=self._bucle_sombra, name='sombra', daemon=True)
+                self._hilo_sombra.start()
+            self._sombra_pendientes.append((sombra, entrada, X, p))
+            self._filas_sombra_pendientes += len(X)
+            self._condicion_sombra.notify_all()
+
+    def _bucle_sombra(self):
+        while True:
+            with self._condicion_sombra:
+                while not self._sombra_pendientes:
+                    self._condicion_sombra.wait()
+                sombra, entrada, X, p = self._sombra_pendientes.popleft()
+                self._filas_sombra_pendientes -= len(X)
+                self._sombra_en_curso += 1
+            try:
+                self._comparar_sombra(sombra, entrada, X, p)
+            except Exception:
+                app.logger.exception("Error al puntuar en sombra con %s:%s", sombra['nombre'], sombra['version'])
+            finally:
+                with self._condicion_sombra:
+                    self._sombra_en_curso -= 1
+                    self._condicion_sombra.notify_all()
+
+    def _comparar_sombra(self, sombra, entrada, X, p):
+        p_sombra = self._medir(sombra, X, '_sombra')
+        acuerdo = float(np.mean((p > 0.5) == (p_sombra > 0.5)))
+        with self._lock:
+            sombra['metricas']['acuerdo_sombra'] = acuerdo
+        app.logger.info("Sombra %s:%s vs %s:%s en %d filas: acuerdo %.4f, prob. media %.4f vs %.4f",
+                        sombra['nombre'], sombra['version'], entrada['nombre'], entrada['version'],
+                        len(X), acuerdo, float(p_sombra.mean()), float(p.mean()))
+
+    def esperar_sombra(self, timeout=None):
+        """Espera a que el modelo en sombra termine los lotes encolados; False si vence el timeout"""
+        with self._condicion_sombra:
+            return self._condicion_sombra.wait_for(
+                lambda: not self._sombra_pendientes and not self._sombra_en_curso, timeout)
+
+    def registrar_reutilizadas(self, X, p, entrada, imputados=None):
+        """Audita y agrega al cubo filas cuya probabilidad se reutilizó de un scoring anterior,
+        igual que si las hubiera puntuado puntuar()"""
+        if self.auditoria is not None:
+            self.auditoria.registrar(X, p, f"{entrada['nombre']}:{entrada['version']}",
+                                     request.endpoint if has_request_context() else None, imputados)
+        if self.cubo is not None:
+            self.cubo.agregar(X, p, imputados=imputados)
+
+    def intervalos(self, X, entrada, nivel=None):
+        """Intervalo percentil (n, 2) de la probabilidad entre las réplicas bootstrap del modelo
+        que puntuó X, o None si ese modelo no tiene ensamble"""
+        ensamble = entrada['bootstrap']
+        if ensamble is None:
+            return None
+        inicio = time.perf_counter()
+        intervalos = intervalos_bootstrap(X, ensamble, app.config['INTERVALOS_NIVEL'] if nivel is None else nivel)
+        if entrada['calibracion'] is not None:
+            # La calibración es monótona: los percentiles de las probabilidades calibradas son los extremos calibrados
+            intervalos = calibrar(intervalos, entrada['calibracion'])
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            metricas = entrada['metricas']
+            metricas['lotes_intervalos'] += 1
+            metricas['filas_intervalos'] += len(X)
+            metricas['segundos_intervalos'] += duracion
+        return intervalos
+
+    def estado(self):
+        with self._lock:
+            return {
+                'principal': self.principal()['nombre'] if self.modelos else None,
+                'sombra': self.sombra,
+                'filas_sombra_pendientes': self._filas_sombra_pendientes,
+                'modelos': [{'nombre': m['nombre'], 'version': m['version'], 'trafico': m['trafico'],
+                             'calibracion': m['calibracion']['metodo'] if m['calibracion'] else None,
+                             'float32': m['estimador_float32'] is not None,
+                             'replicas_bootstrap': len(m['bootstrap']['b']) if m['bootstrap'] else None,
+                             'metricas': dict(m['metricas'])} for m in self.modelos.values()],
+            }
+
+
+def huella_modelo(estimador, calibracion):
+    """Hash de los parámetros ajustados del modelo y de la tabla de calibración: cambia cuando
+    entrenar.py reescribe el artefacto aunque el nombre y la versión sigan iguales"""
+    h = hashlib.sha256(pickle.dumps(estimador))
+    if calibracion is not None:
+        h.update(np.asarray(calibracion['x']).tobytes() + np.asarray(calibracion['y']).tobytes())
+    return h.hexdigest()[:16]
+
+def compilar_float32(estimador):
+    """Versión float32 del modelo, o None si no es un Pipeline(StandardScaler, LogisticRegression) binario"""
+    if (isinstance(estimador, Pipeline) and len(estimador.steps) == 2
+            and isinstance(estimador.steps[0][1], StandardScaler)
+            and isinstance(estimador.steps[1][1], LogisticRegression)
+            and estimador.steps[1][1].coef_.shape[0] == 1):
+        return ModeloLinealCompilado(estimador, np.float32)
+    return None
+
+def cargar_calibracion(ruta):
+    """Tabla de calibración compilada: nodos crecientes (x, y) de una función lineal por tramos"""
+    with open(ruta) as f:
+        tabla = json.load(f)
+    return {'metodo': tabla['metodo'], 'x': np.asarray(tabla['x']), 'y': np.asarray(tabla['y'])}
+
+def calibrar(p, calibracion):
+    """Probabilidad calibrada: una sola interpolación vectorizada sobre la tabla"""
+    return np.interp(p, calibracion['x'], calibracion['y'])
+
+def cargar_bootstrap(ruta):
+    """Ensamble bootstrap plegado: W (17 x B) en float32 para un único producto por bloque, y b (B)"""
+    with np.load(ruta, allow_pickle=False) as datos:
+        coeficientes, interceptos = datos['coeficientes'], datos['interceptos']
+    if coeficientes.ndim != 2 or coeficientes.shape[1] != len(COLUMNAS_MODELO) or len(interceptos) != len(coeficientes):
+        raise ValueError(f'{ruta}: se esperaban coeficientes B x {len(COLUMNAS_MODELO)} e interceptos B')
+    return {'W': np.ascontiguousarray(coeficientes.T, dtype=np.float32), 'b': interceptos.astype(np.float32)}
+
+def intervalos_bootstrap(X, ensamble, nivel, bloque_bytes=None):
+    """Percentiles (1 - nivel) / 2 y (1 + nivel) / 2 de la probabilidad entre las B réplicas, (n, 2).
+
+    Cada réplica es un Pipeline(StandardScaler, LogisticRegression) plegado a X @ w + b, así que
+    los logits de todas salen de un único producto X @ W por bloque de filas. Cada fila se ordena
+    en su lugar (el sort de numpy sobre float32 es vectorizado y resulta varias veces más rápido
+    que np.partition con los cuatro órdenes), se toman los órdenes que necesitan los percentiles
+    (interpolación lineal, como np.percentile) y expit, que es monótona, se aplica solo a esos.
+    """
+    W, b = ensamble['W'], ensamble['b']
+    replicas = len(b)
+    posiciones = np.array([(1 - nivel) / 2, (1 + nivel) / 2]) * (replicas - 1)
+    abajo = np.floor(posiciones).astype(np.intp)
+    arriba = np.minimum(abajo + 1, replicas - 1)
+    fraccion = posiciones - abajo
+    filas_bloque = max(1, (bloque_bytes or app.config['INTERVALOS_BLOQUE_BYTES']) // (4 * replicas))
+    salida = np.empty((len(X), 2))
+    for inicio in range(0, len(X), filas_bloque):
+        logits = np.asarray(X[inicio:inicio + filas_bloque], dtype=np.float32) @ W
+        logits += b
+        logits.sort(axis=1)
+        p_abajo = expit(logits[:, abajo].astype(np.float64))
+        p_arriba = expit(logits[:, arriba].astype(np.float64))
+        salida[inicio:inicio + filas_bloque] = p_abajo + fraccion * (p_arriba - p_abajo)
+    return salida
+
+registro_modelos = RegistroModelos(app.config['SOMBRA_MAX_FILAS_PENDIENTES'])
+for config_modelo in app.config['MODELOS']:
+    try:
+        with open(config_modelo['ruta'], 'rb') as f:
+            estimador = pickle.load(f)
+        entradas = getattr(estimador, 'n_features_in_', len(COLUMNAS_MODELO))
+        if entradas != len(COLUMNAS_MODELO):
+            print(f"⚠️ Modelo {config_modelo['nombre']} no registrado: espera {entradas} entradas, no {len(COLUMNAS_MODELO)}")
+            continue
+        calibracion = config_modelo.get('calibracion')
+        bootstrap = config_modelo.get('bootstrap')
+        registro_modelos.registrar(config_modelo['nombre'], config_modelo['version'], estimador,
+                                   config_modelo['trafico'], cargar_calibracion(calibracion) if calibracion else None,
+                                   cargar_bootstrap(bootstrap) if bootstrap else None)
+        print(f"✅ Modelo {config_modelo['nombre']}:{config_modelo['version']} cargado exitosamente")
+    except Exception as e:
+        print(f"❌ Error al cargar el modelo {config_modelo['nombre']}: {e}")
+registro_modelos.sombra = app.config['MODELO_SOMBRA']
+
+modelo = registro_modelos.principal()['estimador'] if registro_modelos.modelos else None
+
+if app.config['AUDITORIA_ACTIVA']:
+    registro_modelos.auditoria = AuditoriaPredicciones(
+        app.config['AUDITORIA_FOLDER'], app.config['AUDITORIA_MAX_FILAS_PENDIENTES'],
+        app.config['AUDITORIA_ESPERA_MAX'], app.config['AUDITORIA_INTERVALO'],
+        app.config['AUDITORIA_SEGMENTO_BYTES'], app.config['AUDITORIA_SEGMENTO_SEGUNDOS'])
+    registro_modelos.auditoria.iniciar()
+
+historial_pacientes = None
+if app.config['HISTORIAL_ACTIVO']:
+    historial_pacientes = HistorialPacientes(app.config['HISTORIAL_RUTA'], app.config['HISTORIAL_INTERVALO'],
+                                             app.config['HISTORIAL_MAX_FILAS_PENDIENTES'])
+    historial_pacientes.iniciar()
 
 # Cargar dataset de referencia
+DATASET_REF_PATH = 'kidney_disease.csv'
 try:
-    dataset_ref = pd.read_csv('kidney_disease.csv')
+    dataset_ref = pd.read_csv(DATASET_REF_PATH, sep=';')
     print("Dataset de referencia cargado exitosamente")
 except Exception as e:
     print(f"Error al cargar dataset de referencia: {e}")
     dataset_ref = None
 
+# Medias del dataset de referencia para imputar valores faltantes (igual que el notebook)
+if dataset_ref is not None:
+    medias_ref = dataset_ref[COLUMNAS_MODELO].apply(pd.to_numeric, errors='coerce').mean()
+else:
+    medias_ref = pd.Series(0.0, index=COLUMNAS_MODELO)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def validar_datos(datos):
-    """Valida que los datos estén en rangos apropiados basados en el dataset de entrenamiento"""
-    validaciones = {
-        'age': (1, 120),
-        'sg': (1.005, 1.025),
-        'al': (0, 5),
-        'su': (0, 5),
-        'sc': (0.1, 20.0),
-        'bu': (1.0, 200.0),
-        'bgr': (50, 500),
-        'hemo': (3.0, 20.0),
-        'pcv': (10, 60),
-        'rc': (2.0, 8.0),
-        'wc': (2000, 30000)
-    }
-    
+    """Valida que los datos estén en rangos apropiados basados en el dataset de entrenamiento
+    y que las categóricas valgan 0 o 1, como exige filas_validas a las matrices codificadas"""
     errores = []
     
-    for campo, (min_val, max_val) in validaciones.items():
+    for campo, (min_val, max_val) in RANGOS_VALIDOS.items():
         if campo in datos:
             valor = float(datos[campo])
             if valor < min_val or valor > max_val:
                 errores.append(f"{campo}: valor {valor} fuera del rango válido ({min_val}-{max_val})")
     
+    for campo in COLUMNAS_MODELO:
+        if campo not in RANGOS_VALIDOS and campo in datos:
+            valor = float(datos[campo])
+            if valor not in (0, 1):
+                errores.append(f"{campo}: valor {valor} no válido (debe ser 0 o 1)")
+    
     return errores
 
+# Límites por columna en el orden del modelo, para validar matrices ya codificadas: las
+# variables de RANGOS_VALIDOS con su rango y las categóricas, que solo pueden valer 0 o 1
+LIMITES_MODELO = np.array([RANGOS_VALIDOS.get(col, (0, 1)) for col in COLUMNAS_MODELO], dtype=np.float64).T
+COLUMNAS_CATEGORICAS = np.array([col not in RANGOS_VALIDOS for col in COLUMNAS_MODELO])
+
+def filas_validas(X):
+    """Máscara de las filas que validar_datos aceptaría, completas y con las categóricas en 0 o 1"""
+    # Límites en el dtype de X: 1.005 en float32 es menor que 1.005 en float64
+    minimo, maximo = LIMITES_MODELO.astype(X.dtype)
+    validas = np.all((X >= minimo) & (X <= maximo), axis=1)  # NaN no cumple ninguna de las dos
+    categoricas = X[:, COLUMNAS_CATEGORICAS]
+    return validas & np.all((categoricas == 0) | (categoricas == 1), axis=1)
+
+def separador_csv(contenido):
+    """';' o ',' según cuál aparezca más en la primera línea"""
+    cabecera = contenido[:contenido.find(b'\n')] if b'\n' in contenido else contenido
+    return ';' if cabecera.count(b';') > cabecera.count(b',') else ','
+
+def leer_csv(contenido):
+    """Lee un CSV en bytes detectando si el separador es ';' o ','"""
+    return pd.read_csv(io.BytesIO(contenido), sep=separador_csv(contenido))
+
+def preparar_matriz(df, dtype=np.float64, con_imputados=False):
+    """Convierte las columnas del modelo a una matriz numérica, imputando faltantes con las medias de referencia.
+    Con con_imputados=True devuelve también la máscara de los valores imputados."""
+    X = df[COLUMNAS_MODELO].apply(pd.to_numeric, errors='coerce')
+    matriz = X.fillna(medias_ref).to_numpy(dtype=dtype)
+    if con_imputados:
+        return matriz, X.isna().to_numpy()
+    return matriz
+
+def ids_filas(df):
+    """Identificador de cada paciente: columna 'id' si existe y es única, si no la posición de la fila"""
+    if 'id' in df.columns and df['id'].is_unique:
+        return df['id'].astype(str).to_numpy(dtype=str)
+    return np.arange(len(df)).astype(str)
+
+def fechas_panel(valores, filas, ahora=None):
+    """Segundos epoch (UTC) de la fecha de cada panel; sin fecha, o si no se entiende, `ahora` (por defecto, el momento actual)"""
+    ahora = time.time() if ahora is None else ahora
+    if valores is None:
+        return np.full(filas, ahora)
+    fechas = pd.to_datetime(pd.Series(valores), errors='coerce', utc=True)
+    segundos = ((fechas - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+    return np.where(np.isnan(segundos), ahora, segundos)
+
+def registrar_historial(df, probabilidades, modelo_usado, origen, ahora=None):
+    """Guarda en el historial las filas con identificador de paciente (columna 'id'),
+    fechadas con la columna 'fecha' si el archivo la trae (si no, con `ahora`)"""
+    if historial_pacientes is None or 'id' not in df.columns:
+        return
+    pacientes = df['id'].astype(str).str.strip().to_numpy(dtype=str)
+    validas = df['id'].notna().to_numpy() & (pacientes != '')
+    ts = fechas_panel(df['fecha'] if 'fecha' in df.columns else None, len(df), ahora)
+    historial_pacientes.registrar(pacientes[validas], ts[validas], probabilidades[validas], modelo_usado, origen)
+
+def obtener_etiquetas(df):
+    """Devuelve las etiquetas reales (1 = ERC) de un dataset etiquetado, o None si no tiene columna objetivo"""
+    for columna in ('classification', 'class'):
+        if columna in df.columns:
+            etiquetas = df[columna].astype(str).str.strip().str.lower()
+            etiquetas = etiquetas.replace({'ckd': '1', 'notckd': '0'})
+            return pd.to_numeric(etiquetas, errors='coerce').to_numpy()
+    return None
+
+def barrido_umbrales(y, p):
+    """Calcula TP/FP para todos los umbrales posibles con una sola pasada ordenada sobre las probabilidades"""
+    orden = np.argsort(-p, kind='mergesort')
+    p_ord = p[orden]
+    y_ord = y[orden]
+    # Último índice de cada bloque de probabilidades iguales
+    cortes = np.r_[np.flatnonzero(np.diff(p_ord)), len(p_ord) - 1]
+    tp = np.cumsum(y_ord)[cortes]
+    fp = cortes + 1 - tp
+    return {
+        'umbrales': p_ord[cortes],
+        'tp': tp,
+        'fp': fp,
+        'positivos': int(y.sum()),
+        'negativos': int(len(y) - y.sum()),
+    }
+
+def metricas_en_umbral(barrido, umbral):
+    """Matriz de confusión y métricas para un umbral (predice ERC si probabilidad >= umbral)"""
+    k = int(np.searchsorted(-barrido['umbrales'], -umbral, side='right'))
+    tp = int(barrido['tp'][k - 1]) if k > 0 else 0
+    fp = int(barrido['fp'][k - 1]) if k > 0 else 0
+    fn = barrido['positivos'] - tp
+    tn = barrido['negativos'] - fp
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'umbral': umbral,
+        'matriz_confusion': {'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn},
+        'precision': precision,
+        'recall': recall,
+        'especificidad': tn / (tn + fp) if tn + fp else 0.0,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'exactitud': (tp + tn) / (tp + fp + fn + tn),
+    }
+
+def curvas_desde_barrido(barrido):
+    """Curvas ROC y Precision-Recall (con AUC y AP) a partir del barrido de umbrales"""
+    tp, fp = barrido['tp'], barrido['fp']
+    pos, neg = max(barrido['positivos'], 1), max(barrido['negativos'], 1)
+    tpr = np.r_[0.0, tp / pos]
+    fpr = np.r_[0.0, fp / neg]
+    precision = tp / (tp + fp)
+    recall = tp / pos
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    ap = float(np.sum(np.diff(np.r_[0.0, recall]) * precision))
+    return {
+        'auc_roc': auc,
+        'average_precision': ap,
+        'roc': {'fpr': fpr.tolist(), 'tpr': tpr.tolist()},
+        'pr': {'precision': precision.tolist(), 'recall': recall.tolist()},
+        'umbrales': barrido['umbrales'].tolist(),
+    }
+
+# Caché de evaluaciones por hash del dataset: las consultas de umbral posteriores no vuelven a puntuar
+MAX_EVALUACIONES_CACHE = 32
+cache_evaluaciones = OrderedDict()
+cache_evaluaciones_lock = threading.Lock()
+
+def evaluar_dataset(contenido):
+    """Puntúa una sola vez un dataset etiquetado y guarda su barrido de umbrales en caché"""
+    hash_dataset = hashlib.sha256(contenido).hexdigest()
+    with cache_evaluaciones_lock:
+        if hash_dataset in cache_evaluaciones:
+            cache_evaluaciones.move_to_end(hash_dataset)
+            return hash_dataset, cache_evaluaciones[hash_dataset]
+
+    df = leer_csv(contenido)
+    columnas_faltantes = [col for col in COLUMNAS_MODELO if col not in df.columns]
+    if columnas_faltantes:
+        raise ValueError(f"Columnas faltantes: {', '.join(columnas_faltantes)}")
+    y = obtener_etiquetas(df)
+    if y is None:
+        raise ValueError("El dataset no tiene columna 'classification' o 'class'")
+    validas = ~np.isnan(y)
+    # Mismo ruteo, calibración, auditoría y cubo que /procesar-csv con el mismo archivo
+    X, imputados = preparar_matriz(df[validas], con_imputados=True)
+    p, entrada = registro_modelos.puntuar(X, hashlib.sha256(contenido).digest(), imputados=imputados)
+    barrido = barrido_umbrales(y[validas].astype(np.int64), p)
+    evaluacion = {'barrido': barrido, 'curvas': curvas_desde_barrido(barrido), 'total_filas': int(validas.sum()),
+                  'modelo': f"{entrada['nombre']}:{entrada['version']}"}
+
+    with cache_evaluaciones_lock:
+        cache_evaluaciones[hash_dataset] = evaluacion
+        while len(cache_evaluaciones) > MAX_EVALUACIONES_CACHE:
+            cache_evaluaciones.popitem(last=False)
+    return hash_dataset, evaluacion
+
+# === Analítica de cohortes: cubos pre-agregados por edad, htn, dm y ane ===
+
+BORDES_EDAD = [20, 40, 60, 80]
+ETIQUETAS_EDAD = ['<20', '20-39', '40-59', '60-79', '80+']
+# Valor faltante en lo enviado: la matriz lo trae imputado con la media, pero en el cubo va
+# a su propia celda en vez de contarse en la banda o como 0/1
+SIN_DATO = 'sin_dato'
+DIMENSIONES_CUBO = OrderedDict([
+    ('edad', ETIQUETAS_EDAD + [SIN_DATO]),
+    ('htn', ['0', '1', SIN_DATO]),
+    ('dm', ['0', '1', SIN_DATO]),
+    ('ane', ['0', '1', SIN_DATO]),
+])
+
+class CuboRiesgo:
+    """Conteos y sumas por celda (banda de edad x htn x dm x ane), actualizables por lotes.
+
+    Las consultas suman sobre las celdas (162 en total), nunca sobre las filas originales.
+    """
+
+    def __init__(self):
+        forma = tuple(len(v) for v in DIMENSIONES_CUBO.values())
+        self._lock = threading.Lock()
+        self.conteo = np.zeros(forma, dtype=np.int64)
+        self.suma_probabilidad = np.zeros(forma)
+        self.alto_riesgo = np.zeros(forma, dtype=np.int64)
+        self.con_etiqueta = np.zeros(forma, dtype=np.int64)
+        self.positivos_reales = np.zeros(forma, dtype=np.int64)
+
+    @staticmethod
+    def celdas(X, imputados=None):
+        """Índice plano de celda para cada fila de la matriz preprocesada; los valores marcados
+        en `imputados` (ver preparar_matriz) van a la celda SIN_DATO de su dimensión"""
+        indice = np.zeros(len(X), dtype=np.intp)
+        for dimension, valores in DIMENSIONES_CUBO.items():
+            columna = COLUMNAS_MODELO.index('age' if dimension == 'edad' else dimension)
+            if dimension == 'edad':
+                valor = np.digitize(X[:, columna], BORDES_EDAD)
+            else:
+                valor = (X[:, columna] >= 0.5).astype(np.intp)
+            if imputados is not None:
+                valor[imputados[:, columna]] = len(valores) - 1
+            indice = indice * len(valores) + valor
+        return indice
+
+    def agregar(self, X, probabilidades, etiquetas=None, imputados=None):
+        indice = self.celdas(X, imputados)
+        n = self.conteo.size
+        conteo = np.bincount(indice, minlength=n)
+        suma = np.bincount(indice, weights=probabilidades, minlength=n)
+        alto = np.bincount(indice, weights=probabilidades > 0.5, minlength=n).astype(np.int64)
+        if etiquetas is not None:
+            validas = ~np.isnan(etiquetas)
+            con_etiqueta = np.bincount(indice[validas], minlength=n)
+            positivos = np.bincount(indice[validas], weights=etiquetas[validas], minlength=n).astype(np.int64)
+        with self._lock:
+            self.conteo.flat[:] += conteo
+            self.suma_probabilidad.flat[:] += suma
+            self.alto_riesgo.flat[:] += alto
+            if etiquetas is not None:
+                self.con_etiqueta.flat[:] += con_etiqueta
+                self.positivos_reales.flat[:] += positivos
+
+    def consultar(self, por, filtros):
+        """Agrupa por las dimensiones de 'por' tras filtrar por valores de otras (p. ej. {'htn': '1'})"""
+        seleccion = []
+        for dimension, valores in DIMENSIONES_CUBO.items():
+            if dimension in filtros:
+                i = valores.index(filtros[dimension])
+                seleccion.append(slice(i, i + 1))
+            else:
+                seleccion.append(slice(None))
+        ejes = tuple(i for i, d in enumerate(DIMENSIONES_CUBO) if d not in por)
+        with self._lock:
+            medidas = {nombre: getattr(self, nombre)[tuple(seleccion)].sum(axis=ejes)
+                       for nombre in ('conteo', 'suma_probabilidad', 'alto_riesgo', 'con_etiqueta', 'positivos_reales')}
+        dimensiones = [d for d in DIMENSIONES_CUBO if d in por]
+        grupos = []
+        for posicion in np.ndindex(medidas['conteo'].shape):
+            conteo = int(medidas['conteo'][posicion])
+            if conteo == 0:
+                continue
+            grupo = {}
+            for d, i in zip(dimensiones, posicion):
+                desplazamiento = seleccion[list(DIMENSIONES_CUBO).index(d)].start or 0
+                grupo[d] = DIMENSIONES_CUBO[d][i + desplazamiento]
+            grupo['conteo'] = conteo
+            grupo['riesgo_medio'] = float(medidas['suma_probabilidad'][posicion]) / conteo
+            grupo['tasa_alto_riesgo'] = int(medidas['alto_riesgo'][posicion]) / conteo
+            con_etiqueta = int(medidas['con_etiqueta'][posicion])
+            if con_etiqueta:
+                grupo['tasa_erc_real'] = int(medidas['positivos_reales'][posicion]) / con_etiqueta
+            grupos.append(grupo)
+        return grupos
+
+# Cubo del dataset de referencia (una sola vez al iniciar) y cubo de todo lo puntuado desde entonces
+cubos = {'referencia': CuboRiesgo(), 'puntuados': CuboRiesgo()}
+if dataset_ref is not None and modelo is not None:
+    X_ref, imputados_ref = preparar_matriz(dataset_ref, con_imputados=True)
+    # Misma salida calibrada del registro que los lotes puntuados, sin auditarla ni sumarla al cubo 'puntuados'
+    cubos['referencia'].agregar(X_ref, registro_modelos.puntuar(X_ref, hipotetico=True)[0], obtener_etiquetas(dataset_ref),
+                                imputados_ref)
+registro_modelos.cubo = cubos['puntuados']
+
+# === Pacientes similares: k-NN sobre el espacio estandarizado con el scaler del modelo ===
+
+def knn_por_bloques(Q, Z, k, elementos_bloque=4_000_000):
+    """k-NN exacto por fuerza bruta, por bloques de consultas para acotar la memoria"""
+    k = min(k, len(Z))
+    z2 = (Z ** 2).sum(axis=1)
+    filas_bloque = max(1, elementos_bloque // max(len(Z), 1))
+    distancias = np.empty((len(Q), k))
+    indices = np.empty((len(Q), k), dtype=np.intp)
+    for inicio in range(0, len(Q), filas_bloque):
+        q = Q[inicio:inicio + filas_bloque]
+        d2 = (q ** 2).sum(axis=1)[:, None] + z2[None, :] - 2 * (q @ Z.T)
+        candidatos = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < len(Z) else np.broadcast_to(np.arange(len(Z)), d2.shape)
+        d_candidatos = np.take_along_axis(d2, candidatos, axis=1)
+        orden = np.argsort(d_candidatos, axis=1)
+        indices[inicio:inicio + len(q)] = np.take_along_axis(candidatos, orden, axis=1)
+        distancias[inicio:inicio + len(q)] = np.sqrt(np.maximum(np.take_along_axis(d_candidatos, orden, axis=1), 0))
+    return distancias, indices
+
+class IndiceSimilares:
+    """KD-tree sobre el dataset de referencia estandarizado, con un delta de altas recientes.
+
+    Las altas son los pacientes con id y diagnóstico de los CSV subidos (ver agregar_similares);
+    un id que ya está en el índice no se vuelve a agregar. Las filas nuevas se buscan por fuerza bruta vectorizada en el delta hasta que este
+    supera una fracción del árbol; entonces el árbol se reconstruye fuera del lock y se
+    reemplaza, sin bloquear las consultas.
+    """
+
+    def __init__(self, scaler, X, ids, etiquetas, fraccion_delta=0.1, delta_minimo=1000):
+        self.scaler = scaler
+        self.fraccion_delta = fraccion_delta
+        self.delta_minimo = delta_minimo
+        self._lock = threading.Lock()
+        self._Z = scaler.transform(X)
+        self._ids = np.asarray(ids)
+        self._conjunto_ids = set(self._ids.tolist())
+        self._etiquetas = np.asarray(etiquetas, dtype=np.float64)
+        self._arbol = KDTree(self._Z)
+        self._n_arbol = len(self._Z)
+        self.reconstrucciones = 0
+
+    def agregar(self, X, ids, etiquetas):
+        """Agrega al delta las filas cuyos ids no están en el índice; devuelve cuántas agregó"""
+        ids = np.asarray(ids)
+        Z = self.scaler.transform(X)
+        with self._lock:
+            nuevas = np.array([i not in self._conjunto_ids for i in ids.tolist()], dtype=bool)
+            if not nuevas.any():
+                return 0
+            self._conjunto_ids.update(ids[nuevas].tolist())
+            self._Z = np.vstack([self._Z, Z[nuevas]])
+            self._ids = np.concatenate([self._ids, ids[nuevas]])
+            self._etiquetas = np.concatenate([self._etiquetas, np.asarray(etiquetas, dtype=np.float64)[nuevas]])
+            reconstruir = len(self._Z) - self._n_arbol > max(self.delta_minimo, self.fraccion_delta * self._n_arbol)
+            Z_total = self._Z
+        if reconstruir:
+            arbol = KDTree(Z_total)
+            with self._lock:
+                self._arbol, self._n_arbol = arbol, len(Z_total)
+                self.reconstrucciones += 1
+        return int(nuevas.sum())
+
+    def consultar(self, X, k=5):
+        """Distancias e índices de los k vecinos más cercanos de cada fila de X (matriz preprocesada)"""
+        Q = self.scaler.transform(X)
+        with self._lock:
+            arbol, n_arbol, Z = self._arbol, self._n_arbol, self._Z
+        k = min(k, len(Z))
+        distancias, indices = arbol.query(Q, k=min(k, n_arbol))
+        if len(Z) > n_arbol:
+            # Delta: distancias por bloques y fusión con los candidatos del árbol
+            d_delta, i_delta = knn_por_bloques(Q, Z[n_arbol:], k)
+            distancias = np.hstack([distancias, d_delta])
+            indices = np.hstack([indices, i_delta + n_arbol])
+            orden = np.argsort(distancias, axis=1, kind='stable')[:, :k]
+            distancias = np.take_along_axis(distancias, orden, axis=1)
+            indices = np.take_along_axis(indices, orden, axis=1)
+        return distancias, indices
+
+    def vecinos(self, X, k=5):
+        """Lista de vecinos (id, distancia, resultado real) por cada fila de X"""
+        distancias, indices = self.consultar(X, k)
+        with self._lock:
+            ids, etiquetas = self._ids, self._etiquetas
+        return [[{'id': ids[j].item(),
+                  'distancia': float(d),
+                  'erc': None if np.isnan(etiquetas[j]) else int(etiquetas[j])}
+                 for d, j in zip(fila_d, fila_i)]
+                for fila_d, fila_i in zip(distancias, indices)]
+
+indice_similares = None
+if dataset_ref is not None and modelo is not None and 'scaler' in getattr(modelo, 'named_steps', {}):
+    indice_similares = IndiceSimilares(modelo.named_steps['scaler'], X_ref,
+                                       ids_filas(dataset_ref), obtener_etiquetas(dataset_ref))
+
+def agregar_similares(df, X):
+    """Suma al índice de similares los pacientes de un CSV con 'id' único y diagnóstico conocido"""
+    if indice_similares is None or 'id' not in df.columns or not df['id'].is_unique:
+        return 0
+    etiquetas = obtener_etiquetas(df)
+    if etiquetas is None:
+        return 0
+    conocidas = ~np.isnan(etiquetas)
+    if not conocidas.any():
+        return 0
+    return indice_similares.agregar(X[conocidas], ids_filas(df)[conocidas], etiquetas[conocidas])
+
+# Lotes puntuados recientes por hash del CSV: los informes por paciente se generan sin volver a puntuar
+MAX_LOTES_CACHE = 8
+cache_lotes = OrderedDict()
+cache_lotes_lock = threading.Lock()
+
+def guardar_lote(contenido, df, probabilidades, modelo_usado):
+    hash_lote = hashlib.sha256(contenido).hexdigest()
+    with cache_lotes_lock:
+        cache_lotes[hash_lote] = (df, probabilidades, modelo_usado)
+        cache_lotes.move_to_end(hash_lote)
+        while len(cache_lotes) > MAX_LOTES_CACHE:
+            cache_lotes.popitem(last=False)
+    return hash_lote
+
+def pacientes_informe(df, probabilidades, todos=False):
+    """Datos de cada informe: valores tal como llegaron en el CSV, riesgo y los avisos de validar_datos.
+    Por defecto solo los pacientes de alto riesgo."""
+    indices = np.arange(len(df)) if todos else np.flatnonzero(probabilidades > 0.5)
+    valores = df[COLUMNAS_MODELO].iloc[indices].apply(pd.to_numeric, errors='coerce')
+    valores = valores.astype(object).where(valores.notna(), None).to_dict('records')
+    ids = df['id'].astype(str).to_numpy()[indices] if 'id' in df.columns and df['id'].is_unique else None
+    fechas = df['fecha'].astype(str).to_numpy()[indices] if 'fecha' in df.columns else None
+    pacientes = []
+    for k, i in enumerate(indices):
+        presentes = {col: v for col, v in valores[k].items() if v is not None}
+        errores = validar_datos(presentes)
+        pacientes.append({
+            'fila': int(i) + 1,
+            'id': None if ids is None else ids[k],
+            'fecha': None if fechas is None or fechas[k] == 'nan' else fechas[k],
+            'valores': valores[k],
+            'probabilidad': float(probabilidades[i]),
+            'errores': errores,
+            # validar_datos escribe cada aviso como "<campo>: ..."
+            'fuera_de_rango': [e.split(':', 1)[0] for e in errores],
+        })
+    return pacientes
+
+def contexto_informes(modelo_usado):
+    return {'modelo': modelo_usado, 'rangos': RANGOS_VALIDOS,
+            'generado': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')}
+
+def respuesta_evaluacion(hash_dataset, evaluacion):
+    """Arma la respuesta JSON de una evaluación para los umbrales pedidos en la query (?umbral=0.3&umbral=0.5)"""
+    umbrales = request.args.getlist('umbral', type=float) or [0.5]
+    respuesta = {
+        'dataset_hash': hash_dataset,
+        'modelo': evaluacion['modelo'],
+        'total_filas': evaluacion['total_filas'],
+        'positivos': evaluacion['barrido']['positivos'],
+        'negativos': evaluacion['barrido']['negativos'],
+        'metricas': [metricas_en_umbral(evaluacion['barrido'], u) for u in umbrales],
+    }
+    if request.args.get('curvas', '1') != '0':
+        respuesta.update(evaluacion['curvas'])
+    else:
+        respuesta['auc_roc'] = evaluacion['curvas']['auc_roc']
+        respuesta['average_precision'] = evaluacion['curvas']['average_precision']
+    return jsonify(respuesta)
+
+# Etiquetas de predicción; el formato binario las envía una sola vez como diccionario
+ETIQUETAS_RIESGO = ['Sin indicios de ERC', 'Alto riesgo de ERC']
+CABECERA_RESULTADOS_CSV = b'fila,prediccion,probabilidad\n'
+CABECERA_RESULTADOS_INTERVALOS_CSV = b'fila,prediccion,probabilidad,ic_inferior,ic_superior\n'
+CODIFICACIONES_PREFERIDAS = ['zstd', 'br', 'gzip']
+PRECISIONES = {'float64': np.float64, 'float32': np.float32}
+
+def codificaciones_disponibles():
+    return {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+
+def negociar_codificacion(accept_encoding, disponibles=None):
+    """Elige la mejor codificación aceptada por el cliente (mayor q; a igual q, zstd > br > gzip)"""
+    if disponibles is None:
+        disponibles = codificaciones_disponibles()
+    calidades = {}
+    for parte in accept_encoding.split(','):
+        token, _, params = parte.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        calidades[token] = q
+    candidatas = [c for c in CODIFICACIONES_PREFERIDAS
+                  if disponibles[c] and calidades.get(c, calidades.get('*', 0)) > 0]
+    if not candidatas:
+        return None
+    return max(candidatas, key=lambda c: calidades.get(c, calidades.get('*', 0)))
+
+def crear_compresor(codificacion):
+    """Devuelve (comprimir, vaciar, finalizar) para la codificación indicada"""
+    if codificacion == 'gzip':
+        c = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+    if codificacion == 'br':
+        c = brotli.Compressor(quality=5)
+        return c.process, c.flush, c.finish
+    if codificacion == 'zstd':
+        c = zstandard.ZstdCompressor(level=3).compressobj()
+        return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+    raise ValueError(f'Codificación no soportada: {codificacion}')
+
+def comprimir_stream(bloques, codificacion):
+    """Comprime un iterable de bloques de bytes, emitiendo cada bloque comprimido en cuanto está listo"""
+    if codificacion is None:
+        yield from bloques
+        return
+    comprimir, vaciar, finalizar = crear_compresor(codificacion)
+    for bloque in bloques:
+        salida = comprimir(bloque) + vaciar()
+        if salida:
+            yield salida
+    yield finalizar()
+
+def puntuar_por_bloques(df, tamano_bloque, clave_ruteo, dtype=np.float64, intervalos=False):
+    """Puntúa el DataFrame por bloques para que la codificación y compresión se solapen con el scoring.
+    Produce (inicio, probabilidades, intervalos); los intervalos son None si no se piden."""
+    for inicio in range(0, len(df), tamano_bloque):
+        X, imputados = preparar_matriz(df.iloc[inicio:inicio + tamano_bloque], dtype, con_imputados=True)
+        p, entrada = registro_modelos.puntuar(X, clave_ruteo, imputados=imputados)
+        yield inicio, p, registro_modelos.intervalos(X, entrada) if intervalos else None
+
+def tabla_textos(textos):
+    """Textos ASCII como matriz de bytes rellena con ceros: una fila por texto, indexable con numpy"""
+    tabla = np.zeros((len(textos), max(map(len, textos))), dtype=np.uint8)
+    for i, texto in enumerate(textos):
+        tabla[i, :len(texto)] = np.frombuffer(texto.encode('ascii'), dtype=np.uint8)
+    return tabla
+
+# Texto de cada probabilidad redondeada a 4 decimales y de cada etiqueta, tal como los escribe to_csv
+TEXTOS_PROBABILIDAD = tabla_textos([str(k / 10000) for k in range(10001)])
+TEXTOS_ETIQUETA = tabla_textos(ETIQUETAS_RIESGO)
+
+def digitos_ascii(enteros):
+    """Dígitos de enteros no negativos como matriz de bytes alineada a la derecha, rellena con ceros"""
+    ancho = len(str(int(enteros.max()))) if len(enteros) else 1
+    potencias = 10 ** np.arange(ancho - 1, -1, -1, dtype=np.int64)
+    matriz = (enteros[:, None] // potencias % 10 + ord('0')).astype(np.uint8)
+    matriz[(enteros[:, None] < potencias) & (potencias > 1)] = 0
+    return matriz
+
+def csv_resultados(inicio, p, intervalos=None):
+    """Líneas 'fila,prediccion,probabilidad' de un bloque puntuado (filas desde inicio + 1),
+    más ',ic_inferior,ic_superior' si se pasan los intervalos.
+
+    Mismo texto que DataFrame.to_csv, pero armado indexando tablas de textos y quitando
+    los bytes de relleno, sin formatear valor por valor.
+    """
+    separador = np.full((len(p), 1), ord(','), dtype=np.uint8)
+    columnas = [
+        digitos_ascii(np.arange(inicio + 1, inicio + len(p) + 1, dtype=np.int64)), separador,
+        TEXTOS_ETIQUETA[(p > 0.5).astype(np.intp)], separador,
+        TEXTOS_PROBABILIDAD[np.rint(p * 10000).astype(np.intp)],
+    ]
+    if intervalos is not None:
+        columnas += [separador, TEXTOS_PROBABILIDAD[np.rint(intervalos[:, 0] * 10000).astype(np.intp)],
+                     separador, TEXTOS_PROBABILIDAD[np.rint(intervalos[:, 1] * 10000).astype(np.intp)]]
+    matriz = np.concatenate(columnas + [np.full((len(p), 1), ord('\n'), dtype=np.uint8)], axis=1).ravel()
+    return matriz[matriz != 0].tobytes()
+
+def bloques_resultados_csv(df, tamano_bloque, clave_ruteo, dtype=np.float64, intervalos=False):
+    yield CABECERA_RESULTADOS_INTERVALOS_CSV if intervalos else CABECERA_RESULTADOS_CSV
+    for inicio, p, extremos in puntuar_por_bloques(df, tamano_bloque, clave_ruteo, dtype, intervalos):
+        yield csv_resultados(inicio, p, extremos)
+
+def bloques_resultados_binarios(df, tamano_bloque, clave_ruteo, dtype=np.float64):
+    """Formato compacto 'ERC1': cabecera JSON con el diccionario de etiquetas y luego
+    bloques <uint32 n><uint8 etiqueta[n]><float32 probabilidad[n]> en little-endian"""
+    cabecera = json.dumps({
+        'etiquetas': ETIQUETAS_RIESGO,
+        'columnas': ['etiqueta:uint8', 'probabilidad:float32'],
+        'total_filas': len(df),
+    }).encode()
+    yield b'ERC1' + struct.pack('<I', len(cabecera)) + cabecera
+    for _, p, _ in puntuar_por_bloques(df, tamano_bloque, clave_ruteo, dtype):
+        yield (struct.pack('<I', len(p))
+               + (p > 0.5).astype(np.uint8).tobytes()
+               + p.astype('<f4').tobytes())
+
+# Canal binario: formato de tramas en esquema.py (CABECERA_TRAMA, TRAMA_ERROR)
+
+def leer_tramas(buffer, max_filas):
+    """Tramas completas al inicio del buffer: (matriz float32 de todas sus filas, filas de cada
+    trama, bytes consumidos). Lo que queda es una trama a medio llegar."""
+    ancho = 4 * len(COLUMNAS_MODELO)
+    filas, partes, posicion = [], [], 0
+    with memoryview(buffer) as vista:
+        while len(vista) - posicion >= CABECERA_TRAMA.size:
+            (n,) = CABECERA_TRAMA.unpack_from(vista, posicion)
+            if n > max_filas:
+                raise ValueError(f'La trama declara {n} vectores; el máximo es {max_filas}')
+            fin = posicion + CABECERA_TRAMA.size + n * ancho
+            if fin > len(vista):
+                break
+            filas.append(n)
+            partes.append(vista[posicion + CABECERA_TRAMA.size:fin].tobytes())
+            posicion = fin
+    X = np.frombuffer(b''.join(partes), dtype='<f4').reshape(-1, len(COLUMNAS_MODELO))
+    return X, filas, posicion
+
+def responder_tramas(p, filas):
+    """Una trama de respuesta por trama de solicitud, en el mismo orden"""
+    p = p.astype('<f4')
+    partes, inicio = [], 0
+    for n in filas:
+        partes.append(CABECERA_TRAMA.pack(n))
+        partes.append(p[inicio:inicio + n].tobytes())
+        inicio += n
+    return b''.join(partes)
+
+def trama_error(mensaje):
+    mensaje = mensaje.encode()
+    return CABECERA_TRAMA.pack(TRAMA_ERROR) + CABECERA_TRAMA.pack(len(mensaje)) + mensaje
+
+def puntuar_vectores(X, intervalos=False):
+    """Probabilidad de ERC de vectores ya codificados en el orden del modelo, con el mismo
+    registro que el formulario; NaN en los que no pasan la validación. Con intervalos=True
+    devuelve (probabilidades, intervalos (n, 2)), con NaN también si el modelo no tiene ensamble."""
+    p = np.full(len(X), np.nan, dtype=np.float32)
+    extremos = np.full((len(X), 2), np.nan)
+    validas = filas_validas(X)
+    if validas.any():
+        X_validas = X[validas].astype(np.float64)
+        p[validas], entrada = registro_modelos.puntuar(X_validas)
+        if intervalos:
+            calculados = registro_modelos.intervalos(X_validas, entrada)
+            if calculados is not None:
+                extremos[validas] = calculados
+    return (p, extremos) if intervalos else p
+
+class ConflictoIdempotencia(Exception):
+    """La misma clave de idempotencia llegó con otro cuerpo"""
+
+
+class NoCacheable:
+    """Resultado que se entrega a quien lo pidió (y a las solicitudes idénticas en vuelo) pero no se guarda"""
+
+    def __init__(self, valor):
+        self.valor = valor
+
+
+class AlmacenIdempotencia:
+    """Resultados recientes por clave de idempotencia, con TTL, tamaño acotado y single-flight.
+
+    Si llegan solicitudes idénticas mientras la primera se está calculando, esperan
+    su resultado en lugar de volver a procesar el mismo formulario o CSV. Cada entrada
+    guarda el sha256 del cuerpo: una clave repetida con otro cuerpo es un conflicto y no
+    devuelve el resultado de otra solicitud. Las páginas de error (NoCacheable) no se guardan.
+    """
+
+    def __init__(self, ttl, max_entradas):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._resultados = OrderedDict()  # clave -> (expira, valor, duracion, huella)
+        self._en_vuelo = {}
+        self.metricas = {
+            'solicitudes': 0,
+            'calculadas': 0,
+            'aciertos_cache': 0,
+            'compartidas_en_vuelo': 0,
+            'segundos_ahorrados': 0.0,
+        }
+
+    def ejecutar(self, clave, huella, funcion):
+        """Resultado de funcion() para la clave; huella es el sha256 del cuerpo de la solicitud"""
+        ahora = time.monotonic()
+        with self._lock:
+            self.metricas['solicitudes'] += 1
+            entrada = self._resultados.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                if entrada[3] != huella:
+                    raise ConflictoIdempotencia(clave)
+                self._resultados.move_to_end(clave)
+                self.metricas['aciertos_cache'] += 1
+                self.metricas['segundos_ahorrados'] += entrada[2]
+                return entrada[1]
+            vuelo = self._en_vuelo.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = {'evento': threading.Event(), 'huella': huella}
+                self._en_vuelo[clave] = vuelo
+            elif vuelo['huella'] != huella:
+                raise ConflictoIdempotencia(clave)
+            else:
+                self.metricas['compartidas_en_vuelo'] += 1
+
+        if not lider:
+            vuelo['evento'].wait()
+            if 'error' in vuelo:
+                raise vuelo['error']
+            with self._lock:
+                self.metricas['segundos_ahorrados'] += vuelo['duracion']
+            return vuelo['valor']
+
+        inicio = time.perf_counter()
+        try:
+            valor = funcion()
+        except Exception as e:
+            vuelo['error'] = e
+            with self._lock:
+                del self._en_vuelo[clave]
+            vuelo['evento'].set()
+            raise
+        duracion = time.perf_counter() - inicio
+        cacheable = not isinstance(valor, NoCacheable)
+        if not cacheable:
+            valor = valor.valor
+        vuelo['valor'] = valor
+        vuelo['duracion'] = duracion
+
+        with self._lock:
+            self.metricas['calculadas'] += 1
+            if cacheable:
+                self._resultados[clave] = (time.monotonic() + self.ttl, valor, duracion, huella)
+                self._resultados.move_to_end(clave)
+            while self._resultados and (len(self._resultados) > self.max_entradas
+                                        or next(iter(self._resultados.values()))[0] <= ahora):
+                self._resultados.popitem(last=False)
+            del self._en_vuelo[clave]
+        vuelo['evento'].set()
+        return valor
+
+    def estado(self):
+        with self._lock:
+            return dict(self.metricas, entradas=len(self._resultados), en_vuelo=len(self._en_vuelo))
+
+almacen_idempotencia = AlmacenIdempotencia(app.config['IDEMPOTENCIA_TTL'], app.config['IDEMPOTENCIA_MAX_ENTRADAS'])
+
+def ruta_cohorte(nombre):
+    return os.path.join(COHORTES_FOLDER, secure_filename(nombre) + '.npz')
+
+_locks_cohortes = {}
+_lock_cohortes = threading.Lock()
+
+def lock_cohorte(nombre):
+    """Lock por cohorte: dos cargas de la misma cohorte se puntúan y guardan de a una"""
+    with _lock_cohortes:
+        return _locks_cohortes.setdefault(secure_filename(nombre), threading.Lock())
+
+def cargar_cohorte(nombre):
+    try:
+        with np.load(ruta_cohorte(nombre), allow_pickle=False) as datos:
+            return {clave: datos[clave] for clave in datos.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+def guardar_cohorte(nombre, ids, hashes, probabilidades, modelo_usado):
+    ruta = ruta_cohorte(nombre)
+    descriptor, temporal = tempfile.mkstemp(dir=COHORTES_FOLDER, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            np.savez(f, ids=ids, hashes=hashes, probabilidades=probabilidades, modelo=np.array(modelo_usado))
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+def puntuar_cohorte(nombre, df, X, imputados=None):
+    """Puntúa solo las filas nuevas o modificadas respecto a la carga anterior de la cohorte.
+
+    Una fila se reutiliza si su id existía y el hash de sus variables (ya preprocesadas)
+    no cambió, y si la cohorte se puntuó con el mismo modelo y calibración (por el hash de
+    sus parámetros, no solo por la versión configurada). Las reutilizadas se auditan y
+    entran al cubo como las puntuadas.
+    """
+    with lock_cohorte(nombre):
+        return _puntuar_cohorte(nombre, df, X, imputados)
+
+def _puntuar_cohorte(nombre, df, X, imputados):
+    inicio = time.perf_counter()
+    clave_ruteo = f'cohorte:{nombre}'.encode()
+    entrada = registro_modelos.elegir(clave_ruteo)
+    modelo_usado = f"{entrada['nombre']}:{entrada['version']}:{entrada['huella']}"
+
+    ids = ids_filas(df)
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(X), index=False).to_numpy()
+    probabilidades = np.empty(len(X))
+    reutilizadas = np.zeros(len(X), dtype=bool)
+    anterior = cargar_cohorte(nombre)
+    if anterior is not None and str(anterior['modelo']) == modelo_usado:
+        posiciones = pd.Index(anterior['ids']).get_indexer(ids)
+        encontradas = posiciones >= 0
+        reutilizadas[encontradas] = anterior['hashes'][posiciones[encontradas]] == hashes[encontradas]
+        probabilidades[reutilizadas] = anterior['probabilidades'][posiciones[reutilizadas]]
+    if reutilizadas.any():
+        registro_modelos.registrar_reutilizadas(X[reutilizadas], probabilidades[reutilizadas], entrada,
+                                                None if imputados is None else imputados[reutilizadas])
+
+    nuevas = ~reutilizadas
+    segundos_scoring = 0.0
+    if nuevas.any():
+        inicio_scoring = time.perf_counter()
+        probabilidades[nuevas], _ = registro_modelos.puntuar(X[nuevas], clave_ruteo,
+                                                             imputados=None if imputados is None else imputados[nuevas])
+        segundos_scoring = time.perf_counter() - inicio_scoring
+    guardar_cohorte(nombre, ids, hashes, probabilidades, modelo_usado)
+    segundos = time.perf_counter() - inicio
+
+    # Tiempo que habría costado puntuar todo, con el costo por fila observado para este modelo
+    metricas = entrada['metricas']
+    costo_fila = segundos_scoring / nuevas.sum() if nuevas.any() else metricas['segundos'] / max(metricas['filas'], 1)
+    resumen = {
+        'cohorte': nombre,
+        'modelo': f"{entrada['nombre']}:{entrada['version']}",
+        'filas': len(X),
+        'reutilizadas': int(reutilizadas.sum()),
+        'puntuadas': int(nuevas.sum()),
+        'fraccion_omitida': float(reutilizadas.mean()) if len(X) else 0.0,
+        'segundos': segundos,
+        'segundos_ahorrados': max(0.0, costo_fila * len(X) - segundos),
+    }
+    app.logger.info("Cohorte %s: %d/%d filas reutilizadas (%.1f %%), %.3f s ahorrados", nombre,
+                    resumen['reutilizadas'], resumen['filas'], 100 * resumen['fraccion_omitida'],
+                    resumen['segundos_ahorrados'])
+    return probabilidades, resumen
+
+def clave_idempotencia(ruta, cuerpo):
+    """(clave, huella del cuerpo). La clave es la de 'Idempotency-Key', en el espacio de nombres
+    del cliente que la envía, o, si no hay, el hash del cuerpo de la solicitud"""
+    huella = hashlib.sha256(cuerpo).hexdigest()
+    clave_cliente = request.headers.get('Idempotency-Key')
+    if clave_cliente:
+        return f'{ruta}:cliente:{identidad_cliente()}:{clave_cliente}', huella
+    return f'{ruta}:{huella}', huella
+
+def ejecutar_idempotente(ruta, cuerpo, funcion):
+    clave, huella = clave_idempotencia(ruta, cuerpo)
+    try:
+        return almacen_idempotencia.ejecutar(clave, huella, funcion)
+    except ConflictoIdempotencia:
+        return jsonify({'error': 'La clave Idempotency-Key ya se usó con otro contenido'}), 422
+
+def leer_cabecera_csv(datos):
+    """(columnas, separador, bytes de la cabecera) de un CSV que empieza en datos; ValueError si faltan columnas del modelo"""
+    fin_cabecera = datos.find(b'\n') + 1 or len(datos)
+    sep = separador_csv(datos[:fin_cabecera])
+    columnas = [c.strip() for c in datos[:fin_cabecera].decode('utf-8-sig').strip().split(sep)]
+    faltantes = [col for col in COLUMNAS_MODELO if col not in columnas]
+    if faltantes:
+        raise ValueError(f"Columnas faltantes: {', '.join(faltantes)}")
+    return columnas, sep, fin_cabecera
+
+def puntuar_lineas_csv(datos, columnas, sep, clave_ruteo):
+    """Parsea y puntúa líneas completas de un CSV sin cabecera (un tramo de un archivo que sigue
+    llegando): (DataFrame, probabilidades, modelo usado), o None si no hay filas"""
+    if not datos.strip():
+        return None
+    df = pd.read_csv(io.BytesIO(datos), sep=sep, header=None, names=columnas, index_col=False)
+    if not len(df):
+        return None
+    X, imputados = preparar_matriz(df, con_imputados=True)
+    p, entrada = registro_modelos.puntuar(X, clave_ruteo, imputados=imputados)
+    return df, p, entrada
+
+def rangos_consecutivos(numeros):
+    """[[a, b], ...] con los tramos de enteros consecutivos de una lista ordenada"""
+    rangos = []
+    for n in numeros:
+        if rangos and n == rangos[-1][1] + 1:
+            rangos[-1][1] = n
+        else:
+            rangos.append([n, n])
+    return rangos
+
+class AlmacenCargas:
+    """Cargas de CSV grandes en fragmentos numerados, escritas directo a disco y reanudables.
+
+    Cada carga es una carpeta con sus fragmentos (verificados con SHA-256 al recibirlos),
+    el CSV de resultados y un estado.json. En cuanto hay un prefijo contiguo de fragmentos
+    se parsean y puntúan sus líneas completas, así que el scoring avanza durante la subida
+    y la memoria depende del tamaño del fragmento, no del archivo. El estado guarda hasta
+    qué byte del CSV de resultados está confirmado: si el proceso se interrumpe a mitad de
+    un fragmento, al reanudar se descarta lo no confirmado y ese tramo se vuelve a puntuar.
+    El estado se reescribe como mucho cada intervalo_estado segundos mientras llegan
+    fragmentos; perder lo no escrito solo hace que el cliente reenvíe fragmentos (ver
+    los rangos recibidos) o que se vuelva a puntuar un tramo.
+    """
+
+    PATRON_ID = re.compile(r'^[0-9a-f]{32}$')
+    BLOQUE_LECTURA = 1024 * 1024
+
+    def __init__(self, carpeta, ttl, max_fragmentos, max_bytes, intervalo_estado):
+        self.carpeta = carpeta
+        self.ttl = ttl
+        self.max_fragmentos = max_fragmentos
+        self.max_bytes = max_bytes
+        self.intervalo_estado = intervalo_estado
+        self._lock = threading.Lock()
+        self._cargas = {}  # id -> {'estado', 'lock', 'puntuando', 'guardado', 'sucio'}
+        self.metricas = {'cargas_creadas': 0, 'cargas_completadas': 0, 'fragmentos_recibidos': 0,
+                         'fragmentos_repetidos': 0, 'checksums_invalidos': 0, 'bytes_recibidos': 0,
+                         'filas_puntuadas': 0, 'segundos_scoring': 0.0}
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _ruta(self, id_carga, archivo=''):
+        return os.path.join(self.carpeta, id_carga, archivo)
+
+    def _ruta_fragmento(self, id_carga, numero):
+        return self._ruta(id_carga, f'{numero:06d}.parte')
+
+    @staticmethod
+    def _nueva_carga(estado):
+        return {'estado': estado, 'lock': threading.Lock(), 'puntuando': threading.Lock(),
+                'guardado': time.monotonic(), 'sucio': False}
+
+    def _guardar_estado(self, id_carga, carga, forzar=True):
+        """Escribe estado.json. Sin forzar, si la última escritura fue hace menos de
+        intervalo_estado solo lo marca pendiente para la siguiente o para volcar().
+        Se llama con carga['lock'] tomado."""
+        if not forzar and time.monotonic() - carga['guardado'] < self.intervalo_estado:
+            carga['sucio'] = True
+            return
+        ruta = self._ruta(id_carga, 'estado.json')
+        with open(ruta + '.tmp', 'w') as f:
+            json.dump(carga['estado'], f)
+        os.replace(ruta + '.tmp', ruta)
+        carga['guardado'], carga['sucio'] = time.monotonic(), False
+
+    def volcar(self):
+        """Escribe el estado pendiente de todas las cargas"""
+        with self._lock:
+            cargas = list(self._cargas.items())
+        for id_carga, carga in cargas:
+            with carga['lock']:
+                if carga['sucio']:
+                    try:
+                        self._guardar_estado(id_carga, carga)
+                    except FileNotFoundError:
+                        pass  # eliminada mientras tanto
+
+    def _carga(self, id_carga):
+        """Carga en memoria (leída de disco si el proceso se reinició); KeyError si no existe"""
+        if not self.PATRON_ID.match(id_carga):
+            raise KeyError(id_carga)
+        with self._lock:
+            carga = self._cargas.get(id_carga)
+            if carga is None:
+                try:
+                    with open(self._ruta(id_carga, 'estado.json')) as f:
+                        estado = json.load(f)
+                except OSError:
+                    raise KeyError(id_carga) from None
+                carga = self._nueva_carga(estado)
+                self._cargas[id_carga] = carga
+            return carga
+
+    def crear(self, nombre, sha256=None):
+        self.limpiar_expiradas()
+        id_carga = secrets.token_hex(16)
+        os.makedirs(self._ruta(id_carga))
+        with open(self._ruta(id_carga, 'resultados.csv'), 'wb') as f:
+            f.write(CABECERA_RESULTADOS_CSV)
+        estado = {
+            'id': id_carga, 'nombre': nombre, 'sha256': sha256, 'creada': time.time(),
+            'fragmentos': {},  # número -> {'bytes', 'sha256'}
+            'total_fragmentos': None, 'completada': False, 'error': None,
+            # Posición del siguiente byte sin parsear, filas puntuadas y resultados confirmados
+            'siguiente': 0, 'desplazamiento': 0, 'filas': 0,
+            'bytes_resultados': len(CABECERA_RESULTADOS_CSV),
+            'columnas': None, 'sep': None,
+        }
+        carga = self._nueva_carga(estado)
+        with carga['lock']:
+            self._guardar_estado(id_carga, carga)
+        with self._lock:
+            self._cargas[id_carga] = carga
+            self.metricas['cargas_creadas'] += 1
+        return id_carga
+
+    def guardar_fragmento(self, id_carga, numero, stream, sha256):
+        """Escribe el fragmento a disco mientras llega, verificando su SHA-256.
+
+        Reenviar un fragmento ya recibido con el mismo checksum no hace nada (reintentos
+        seguros); un fragmento recibido no se puede reemplazar por otro contenido.
+        """
+        carga = self._carga(id_carga)
+        estado = carga['estado']
+        if not 0 <= numero < self.max_fragmentos:
+            raise ValueError(f'El número de fragmento debe estar entre 0 y {self.max_fragmentos - 1}')
+        with carga['lock']:
+            if estado['total_fragmentos'] is not None:
+                raise ValueError('La carga ya fue completada')
+            previo = estado['fragmentos'].get(str(numero))
+        if previo is not None:
+            if previo['sha256'] != sha256:
+                raise ValueError(f'El fragmento {numero} ya fue recibido con otro contenido')
+            with self._lock:
+                self.metricas['fragmentos_repetidos'] += 1
+            return False
+
+        ruta = self._ruta_fragmento(id_carga, numero)
+        temporal = f'{ruta}.{secrets.token_hex(4)}.tmp'
+        resumen = hashlib.sha256()
+        escritos = 0
+        try:
+            with open(temporal, 'wb') as f:
+                while True:
+                    bloque = stream.read(self.BLOQUE_LECTURA)
+                    if not bloque:
+                        break
+                    resumen.update(bloque)
+                    f.write(bloque)
+                    escritos += len(bloque)
+            if resumen.hexdigest() != sha256:
+                with self._lock:
+                    self.metricas['checksums_invalidos'] += 1
+                raise ValueError(f'El SHA-256 del fragmento {numero} no coincide: se recibió {resumen.hexdigest()}')
+            with carga['lock']:
+                previo = estado['fragmentos'].get(str(numero))
+                if previo is not None and previo['sha256'] != sha256:
+                    raise ValueError(f'El fragmento {numero} ya fue recibido con otro contenido')
+                total = sum(fr['bytes'] for fr in estado['fragmentos'].values()) + escritos
+                if total > self.max_bytes:
+                    raise ValueError(f'La carga supera el máximo de {self.max_bytes} bytes')
+                os.replace(temporal, ruta)
+                estado['fragmentos'][str(numero)] = {'bytes': escritos, 'sha256': sha256}
+                self._guardar_estado(id_carga, carga, forzar=False)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        with self._lock:
+            self.metricas['fragmentos_recibidos'] += 1
+            self.metricas['bytes_recibidos'] += escritos
+        return True
+
+    def puntuar_pendientes(self, id_carga, esperar=False):
+        """Puntúa los fragmentos contiguos disponibles. Si otro hilo ya está puntuando esta
+        carga, no espera (salvo `esperar`): ese hilo vuelve a revisar antes de terminar."""
+        carga = self._carga(id_carga)
+        estado = carga['estado']
+        while True:
+            if not carga['puntuando'].acquire(blocking=esperar):
+                return
+            try:
+                vistos = self._puntuar(id_carga, carga)
+            finally:
+                carga['puntuando'].release()
+            # Un fragmento pudo registrarse después de la última revisión y antes de soltar el lock
+            with carga['lock']:
+                if estado['error'] or len(estado['fragmentos']) == vistos:
+                    return
+
+    def _tramo_pendiente(self, id_carga, carga):
+        """(bytes con líneas completas, siguiente, desplazamiento) desde la posición actual, o None,
+        junto con el número de fragmentos recibidos que se tuvo en cuenta"""
+        estado = carga['estado']
+        with carga['lock']:
+            disponibles = set(estado['fragmentos'])
+            numero, desplazamiento, total = estado['siguiente'], estado['desplazamiento'], estado['total_fragmentos']
+        return self._leer_tramo(id_carga, disponibles, numero, desplazamiento, total), len(disponibles)
+
+    def _leer_tramo(self, id_carga, disponibles, numero, desplazamiento, total):
+        partes = []
+        while str(numero) in disponibles:
+            with open(self._ruta_fragmento(id_carga, numero), 'rb') as f:
+                f.seek(desplazamiento)
+                partes.append(f.read())
+            corte = partes[-1].rfind(b'\n')
+            if total is not None and numero == total - 1:
+                # Último fragmento: la última línea puede no terminar en salto de línea
+                return b''.join(partes), total, 0
+            if corte >= 0:
+                datos = b''.join(partes[:-1]) + partes[-1][:corte + 1]
+                if corte + 1 == len(partes[-1]):
+                    return datos, numero + 1, 0
+                return datos, numero, desplazamiento + corte + 1
+            numero, desplazamiento = numero + 1, 0
+        return None
+
+    def _puntuar(self, id_carga, carga):
+        """Puntúa tramos hasta que no quede ninguno completo; devuelve los fragmentos vistos en la última revisión"""
+        estado = carga['estado']
+        vistos = 0
+        while not estado['error']:
+            tramo_pendiente, vistos = self._tramo_pendiente(id_carga, carga)
+            if tramo_pendiente is None:
+                break
+            datos, siguiente, desplazamiento = tramo_pendiente
+            inicio = time.perf_counter()
+            columnas, sep, error, resultados = estado['columnas'], estado['sep'], None, b''
+            try:
+                if columnas is None:
+                    columnas, sep, fin_cabecera = leer_cabecera_csv(datos)
+                    datos = datos[fin_cabecera:]
+                puntuado = puntuar_lineas_csv(datos, columnas, sep, id_carga.encode())
+                if puntuado is not None:
+                    resultados = csv_resultados(estado['filas'], puntuado[1])
+            except Exception as e:
+                error = f'Error al procesar el fragmento {estado["siguiente"]}: {e}'
+
+            with open(self._ruta(id_carga, 'resultados.csv'), 'r+b') as f:
+                # Descarta lo escrito y no confirmado por un intento anterior interrumpido
+                f.seek(estado['bytes_resultados'])
+                f.write(resultados)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+                bytes_resultados = f.tell()
+            filas = resultados.count(b'\n')
+            with carga['lock']:
+                if error:
+                    estado['error'] = error
+                else:
+                    estado.update(siguiente=siguiente, desplazamiento=desplazamiento, columnas=columnas, sep=sep,
+                                  filas=estado['filas'] + filas, bytes_resultados=bytes_resultados)
+                self._guardar_estado(id_carga, carga, forzar=bool(error))
+            with self._lock:
+                self.metricas['filas_puntuadas'] += filas
+                self.metricas['segundos_scoring'] += time.perf_counter() - inicio
+        return vistos
+
+    def completar(self, id_carga, total_fragmentos):
+        """Cierra la carga con `total_fragmentos` y termina de puntuarla.
+
+        Devuelve los números de fragmento que faltan (sin cerrar la carga) o [] si se completó.
+        """
+        carga = self._carga(id_carga)
+        estado = carga['estado']
+        with carga['lock']:
+            if estado['total_fragmentos'] is None:
+                recibidos = set(map(int, estado['fragmentos']))
+                faltantes = sorted(set(range(total_fragmentos)) - recibidos)
+                if faltantes:
+                    return faltantes
+                if recibidos - set(range(total_fragmentos)):
+                    raise ValueError(f'Se recibieron fragmentos más allá del {total_fragmentos - 1}')
+                estado['total_fragmentos'] = total_fragmentos
+                self._guardar_estado(id_carga, carga)
+            elif estado['total_fragmentos'] != total_fragmentos:
+                raise ValueError(f"La carga ya fue completada con {estado['total_fragmentos']} fragmentos")
+
+        self.puntuar_pendientes(id_carga, esperar=True)
+        with carga['puntuando']:
+            with carga['lock']:
+                terminada = estado['completada'] or estado['error']
+            if terminada:
+                return []
+            if estado['sha256'] and self._sha256_archivo(id_carga, total_fragmentos) != estado['sha256']:
+                error, completada = 'El SHA-256 del archivo completo no coincide', False
+            else:
+                error, completada = None, True
+            with carga['lock']:
+                estado.update(error=error, completada=completada)
+                self._guardar_estado(id_carga, carga)
+        if completada:
+            with self._lock:
+                self.metricas['cargas_completadas'] += 1
+        return []
+
+    def _sha256_archivo(self, id_carga, total_fragmentos):
+        resumen = hashlib.sha256()
+        for numero in range(total_fragmentos):
+            with open(self._ruta_fragmento(id_carga, numero), 'rb') as f:
+                while True:
+                    bloque = f.read(self.BLOQUE_LECTURA)
+                    if not bloque:
+                        break
+                    resumen.update(bloque)
+        return resumen.hexdigest()
+
+    def resultados(self, id_carga):
+        """(bytes confirmados, generador que los lee) del CSV de resultados, aunque la carga siga abierta"""
+        carga = self._carga(id_carga)
+        with carga['lock']:
+            longitud = carga['estado']['bytes_resultados']
+        ruta = self._ruta(id_carga, 'resultados.csv')
+
+        def leer():
+            with open(ruta, 'rb') as f:
+                restante = longitud
+                while restante > 0:
+                    bloque = f.read(min(self.BLOQUE_LECTURA, restante))
+                    if not bloque:
+                        break
+                    restante -= len(bloque)
+                    yield bloque
+        return longitud, leer()
+
+    def estado(self, id_carga):
+        carga = self._carga(id_carga)
+        with carga['lock']:
+            estado = carga['estado']
+            recibidos = sorted(map(int, estado['fragmentos']))
+            return {
+                'id': estado['id'], 'nombre': estado['nombre'],
+                'fragmentos_recibidos': rangos_consecutivos(recibidos),
+                'bytes_recibidos': sum(fr['bytes'] for fr in estado['fragmentos'].values()),
+                'fragmentos_puntuados': estado['siguiente'],
+                'filas_puntuadas': estado['filas'],
+                'total_fragmentos': estado['total_fragmentos'],
+                'completada': estado['completada'],
+                'error': estado['error'],
+            }
+
+    def eliminar(self, id_carga):
+        carga = self._carga(id_carga)
+        with carga['puntuando'], self._lock:
+            self._cargas.pop(id_carga, None)
+            shutil.rmtree(self._ruta(id_carga), ignore_errors=True)
+
+    def limpiar_expiradas(self):
+        """Borra las cargas sin actividad durante más de ttl segundos"""
+        limite = time.time() - self.ttl
+        for entrada in os.scandir(self.carpeta):
+            try:
+                expirada = os.path.getmtime(os.path.join(entrada.path, 'estado.json')) < limite
+            except OSError:
+                continue
+            if expirada:
+                with self._lock:
+                    self._cargas.pop(entrada.name, None)
+                shutil.rmtree(entrada.path, ignore_errors=True)
+
+    def estado_global(self):
+        with self._lock:
+            return dict(self.metricas, cargas_en_memoria=len(self._cargas))
+
+almacen_cargas = AlmacenCargas(app.config['CARGAS_FOLDER'], app.config['CARGAS_TTL'],
+                               app.config['CARGAS_MAX_FRAGMENTOS'], app.config['CARGAS_MAX_BYTES'],
+                               app.config['CARGAS_INTERVALO_ESTADO'])
+atexit.register(almacen_cargas.volcar)
+
+
+class LimitadorTasa:
+    """Token bucket por cliente: 'tasa' fichas por segundo hasta un máximo de 'rafaga'"""
+
+    def __init__(self, tasa, rafaga, max_clientes=10000):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.max_clientes = max_clientes
+        self._lock = threading.Lock()
+        self._cubetas = OrderedDict()  # cliente -> (fichas, instante)
+
+    def permitir(self, cliente):
+        """Consume una ficha; devuelve (permitido, segundos hasta la próxima ficha)"""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, instante = self._cubetas.pop(cliente, (self.rafaga, ahora))
+            fichas = min(self.rafaga, fichas + (ahora - instante) * self.tasa)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            self._cubetas[cliente] = (fichas, ahora)
+            if len(self._cubetas) > self.max_clientes:
+                self._cubetas.popitem(last=False)
+        return permitido, (1 - fichas) / self.tasa if not permitido else 0.0
+
+
+class CarrilAdmision:
+    """Pool de concurrencia con cola acotada; cuando la cola está llena se descarga carga en vez de esperar"""
+
+    def __init__(self, nombre, concurrencia, max_cola, espera_max):
+        self.nombre = nombre
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self._semaforo = threading.BoundedSemaphore(concurrencia)
+        self._lock = threading.Lock()
+        self.en_cola = 0
+        self.activas = 0
+        self.metricas = {'admitidas': 0, 'rechazadas_cola': 0, 'rechazadas_espera': 0, 'limitadas_tasa': 0}
+
+    def entrar(self):
+        with self._lock:
+            if self.en_cola >= self.max_cola:
+                self.metricas['rechazadas_cola'] += 1
+                return False
+            self.en_cola += 1
+        admitida = self._semaforo.acquire(timeout=self.espera_max)
+        with self._lock:
+            self.en_cola -= 1
+            if admitida:
+                self.activas += 1
+                self.metricas['admitidas'] += 1
+            else:
+                self.metricas['rechazadas_espera'] += 1
+        return admitida
+
+    def registrar_limitada(self):
+        with self._lock:
+            self.metricas['limitadas_tasa'] += 1
+
+    def salir(self):
+        with self._lock:
+            self.activas -= 1
+        self._semaforo.release()
+
+    def estado(self):
+        with self._lock:
+            return dict(self.metricas, en_cola=self.en_cola, activas=self.activas, max_cola=self.max_cola)
+
+
+carriles = {nombre: CarrilAdmision(nombre, c['concurrencia'], c['max_cola'], c['espera_max'])
+            for nombre, c in app.config['CARRILES'].items()}
+limitadores = {nombre: LimitadorTasa(c['tasa'], c['rafaga']) for nombre, c in app.config['CARRILES'].items()}
+
+# Rutas que pasan por control de admisión; el resto (páginas estáticas, métricas) no se limita
+CARRIL_POR_ENDPOINT = {
+    'procesar_evaluacion': 'interactivo',
+    'sensibilidad': 'interactivo',
+    'historial_paciente': 'interactivo',
+    'pacientes_riesgo_alto': 'interactivo',
+    'procesar_csv': 'lotes',
+    'api_procesar_csv': 'lotes',
+    'evaluar_cohorte': 'lotes',
+    'informes_lote': 'lotes',
+    'crear_carga': 'cargas',
+    'subir_fragmento': 'cargas',
+    'completar_carga': 'cargas',
+    'resultados_carga': 'cargas',
+    'api_puntuar': 'integraciones',
+    'pacientes_similares': 'integraciones',
+}
+
+def respuesta_rechazo(mensaje, status, reintentar_en):
+    """429/503 con Retry-After; JSON para la API y HTML simple para las páginas"""
+    if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'error': mensaje})
+    else:
+        response = Response(f"<h1>{mensaje}</h1><a href='/'>Volver al inicio</a>", mimetype='text/html')
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, int(np.ceil(reintentar_en))))
+    return response
+
+def identidad_cliente():
+    """Dirección del cliente, o 'X-Client-Id' si la solicitud llega desde un proxy configurado"""
+    if request.remote_addr in app.config['PROXIES_CONFIABLES'] and request.headers.get('X-Client-Id'):
+        return 'id:' + request.headers['X-Client-Id']
+    return request.remote_addr or 'anonimo'
+
+@app.before_request
+def admitir_solicitud():
+    nombre = CARRIL_POR_ENDPOINT.get(request.endpoint)
+    if nombre is None or not app.config['ADMISION_ACTIVA']:
+        return None
+    carril = carriles[nombre]
+    cliente = identidad_cliente()
+    permitido, reintentar_en = limitadores[nombre].permitir(cliente)
+    if not permitido:
+        carril.registrar_limitada()
+        return respuesta_rechazo('Demasiadas solicitudes, intente nuevamente en unos segundos', 429, reintentar_en)
+    if not carril.entrar():
+        return respuesta_rechazo('Servidor ocupado, intente nuevamente en unos segundos', 503, 1)
+    g.carril_admision = carril
+    return None
+
+@app.teardown_request
+def liberar_carril(exc):
+    carril = g.pop('carril_admision', None)
+    if carril is not None:
+        carril.salir()
+
+class PerfiladorMuestreo:
+    """Profiler por muestreo de las solicitudes en curso, activado por una ventana de tiempo.
+
+    Mientras está activo, un hilo toma cada `intervalo` segundos la pila de los hilos
+    que atienden solicitudes muestreadas (una fracción de ellas) y acumula pilas
+    colapsadas ("raiz;funcion;...  muestras"), el formato que leen flamegraph.pl,
+    speedscope e inferno. Las solicitudes muestreadas además miden sus etapas con
+    tramo(). Inactivo, solo cuesta leer un booleano por solicitud.
+    """
+
+    def __init__(self):
+        self.activo = False
+        self.fraccion = 1.0
+        self.intervalo = 0.005
+        self.fin = 0.0
+        self.pilas = Counter()
+        self.tramos = {}
+        self.muestras = 0
+        self.solicitudes = 0
+        self._hilos = {}
+        self._etiquetas = {}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def activar(self, segundos, fraccion=1.0, intervalo=0.005):
+        """Inicia una ventana de perfilado; descarta el perfil anterior"""
+        self.desactivar()
+        with self._lock:
+            self.pilas = Counter()
+            self.tramos = {}
+            self.muestras = 0
+            self.solicitudes = 0
+        self.fraccion, self.intervalo = fraccion, intervalo
+        self.fin = time.monotonic() + segundos
+        self._detener.clear()
+        self.activo = True
+        self._hilo = threading.Thread(target=self._muestrear, name='perfilador', daemon=True)
+        self._hilo.start()
+
+    def desactivar(self):
+        self._detener.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join()
+        self._hilo = None
+        self.activo = False
+
+    def entrar(self, endpoint):
+        """Decide si la solicitud actual se muestrea; devuelve True si se perfila"""
+        if random.random() >= self.fraccion:
+            return False
+        with self._lock:
+            self._hilos[threading.get_ident()] = endpoint or 'sin_endpoint'
+            self.solicitudes += 1
+        return True
+
+    def salir(self, endpoint, tramos):
+        with self._lock:
+            self._hilos.pop(threading.get_ident(), None)
+            for nombre, duracion in tramos:
+                acumulado = self.tramos.setdefault(f'{endpoint}.{nombre}', {'n': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                acumulado['n'] += 1
+                acumulado['total_ms'] += duracion * 1000
+                acumulado['max_ms'] = max(acumulado['max_ms'], duracion * 1000)
+
+    def _etiqueta(self, codigo):
+        etiqueta = self._etiquetas.get(codigo)
+        if etiqueta is None:
+            # ';' separa marcos en el formato colapsado
+            etiqueta = f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})".replace(';', ',')
+            self._etiquetas[codigo] = etiqueta
+        return etiqueta
+
+    def _muestrear(self):
+        while not self._detener.is_set() and time.monotonic() < self.fin:
+            marcos = sys._current_frames()
+            with self._lock:
+                hilos = list(self._hilos.items())
+            pilas = []
+            for ident, endpoint in hilos:
+                marco = marcos.get(ident)
+                pila = []
+                while marco is not None:
+                    pila.append(self._etiqueta(marco.f_code))
+                    marco = marco.f_back
+                if pila:
+                    pila.append(endpoint)
+                    pilas.append(';'.join(reversed(pila)))
+            with self._lock:
+                self.pilas.update(pilas)
+                self.muestras += len(pilas)
+            self._detener.wait(self.intervalo)
+        self.activo = False
+
+    def colapsado(self):
+        """Perfil en formato de pilas colapsadas, una pila por línea"""
+        with self._lock:
+            return ''.join(f'{pila} {n}\n' for pila, n in self.pilas.most_common())
+
+    def estado(self):
+        with self._lock:
+            return {
+                'activo': self.activo,
+                'segundos_restantes': round(max(0.0, self.fin - time.monotonic()), 1) if self.activo else 0,
+                'fraccion': self.fraccion,
+                'intervalo_ms': self.intervalo * 1000,
+                'solicitudes_perfiladas': self.solicitudes,
+                'muestras': self.muestras,
+                'pilas_distintas': len(self.pilas),
+                'tramos': {nombre: {'n': t['n'], 'media_ms': round(t['total_ms'] / t['n'], 3),
+                                    'max_ms': round(t['max_ms'], 3)}
+                           for nombre, t in sorted(self.tramos.items())},
+            }
+
+perfilador = PerfiladorMuestreo()
+
+class Tramo:
+    """Mide una etapa de la solicitud perfilada y la guarda en g.tramos"""
+    __slots__ = ('nombre', 'inicio')
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *exc):
+        g.tramos.append((self.nombre, time.perf_counter() - self.inicio))
+
+class TramoNulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+TRAMO_NULO = TramoNulo()
+
+def tramo(nombre):
+    """Context manager de una etapa; fuera de una solicitud perfilada no mide nada"""
+    if perfilador.activo and has_request_context() and 'tramos' in g:
+        return Tramo(nombre)
+    return TRAMO_NULO
+
+@app.before_request
+def iniciar_perfilado():
+    if perfilador.activo and perfilador.entrar(request.endpoint):
+        g.tramos = []
+
+@app.teardown_request
+def terminar_perfilado(exc):
+    tramos = g.pop('tramos', None)
+    if tramos is not None:
+        perfilador.salir(request.endpoint, tramos)
+
+@app.after_request
+def encabezado_server_timing(response):
+    """Tramos de la solicitud perfilada como Server-Timing (visibles en las herramientas del navegador)"""
+    tramos = g.get('tramos')
+    if tramos:
+        response.headers['Server-Timing'] = ', '.join(f'{nombre};dur={duracion * 1000:.2f}' for nombre, duracion in tramos)
+    return response
+
 # Template HTML principal
 html_template = """
 <!DOCTYPE html>
@@ -74,170 +2272,9 @@ html_template = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Diagnostico DE LA ENFERMEDAD RENAL CRONICA</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: Arial, sans-serif;
-            line-height: 1.6;
-            color: #333;
-        }
-        
-        .navbar {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1rem 2rem;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            position: fixed;
-            top: 0;
-            width: 100%;
-            z-index: 1000;
-        }
-        
-        .logo {
-            font-size: 1.5rem;
-            font-weight: bold;
-            color: white;
-        }
-        
-        .navbar ul {
-            display: flex;
-            list-style: none;
-            gap: 1.5rem;
-        }
-        
-        .navbar ul li a {
-            color: white;
-            text-decoration: none;
-            font-weight: 500;
-        }
-        
-        .navbar ul li a:hover {
-            color: #ffd700;
-        }
-        
-        .burguer {
-            display: none;
-            flex-direction: column;
-            cursor: pointer;
-            background: none;
-            border: none;
-        }
-        
-        .burguer span {
-            width: 25px;
-            height: 3px;
-            background: white;
-            margin: 3px 0;
-        }
-        
-        .hero-section {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            text-align: center;
-            padding: 120px 20px 80px;
-            margin-top: 60px;
-        }
-        
-        .hero-section h1 {
-            font-size: 2.5rem;
-            margin-bottom: 1rem;
-        }
-        
-        .hero-section p {
-            font-size: 1.2rem;
-            margin-bottom: 2rem;
-            max-width: 800px;
-            margin-left: auto;
-            margin-right: auto;
-        }
-        
-        .btn-primary {
-            display: inline-block;
-            background: #ffd700;
-            color: #333;
-            padding: 12px 30px;
-            text-decoration: none;
-            border-radius: 25px;
-            font-weight: bold;
-        }
-        
-        .btn-primary:hover {
-            background: #ffed4e;
-        }
-        
-        .cards-container {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 60px 20px;
-        }
-        
-        .cards-container h2 {
-            text-align: center;
-            font-size: 2.2rem;
-            margin-bottom: 2rem;
-            color: #333;
-        }
-        
-        .cards-container p {
-            font-size: 1.1rem;
-            text-align: justify;
-            margin-bottom: 1.5rem;
-            color: #555;
-        }
-        
-        .about-section {
-            background: white;
-            padding: 60px 20px;
-            max-width: 1200px;
-            margin: 0 auto;
-        }
-        
-        .about-section ul {
-            max-width: 600px;
-            margin: 0 auto;
-            background: #f8f9fa;
-            padding: 2rem;
-            border-radius: 10px;
-        }
-        
-        .about-section ul li {
-            padding: 10px 0;
-            border-bottom: 1px solid #ddd;
-        }
-        
-        footer {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            text-align: center;
-            padding: 40px 20px;
-        }
-        
-        footer img {
-            max-width: 300px;
-            border-radius: 10px;
-            margin-top: 20px;
-        }
-        
-        @media (max-width: 768px) {
-            .navbar ul {
-                display: none;
-            }
-            .burguer {
-                display: flex;
-            }
-            .hero-section h1 {
-                font-size: 1.8rem;
-            }
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset('css/principal.css') }}">
 </head>
-<body>
+<body class="pagina-inicio">
     <nav class="navbar">
         <div class="logo"> GRUPO 3 </div>
         <ul>
@@ -302,7 +2339,18 @@ html_template = """
     </main>
     
     <footer>
-        <img src="/static/images/grupo.jpg" alt="GRUPO DE INVESTIGACION">
+        {% if 'images/grupo-300.jpg' in manifiesto_assets %}
+        <picture>
+            <source type="image/webp" sizes="300px"
+                    srcset="{{ asset('images/grupo-300.webp') }} 300w, {{ asset('images/grupo-600.webp') }} 600w">
+            <img src="{{ asset('images/grupo-300.jpg') }}" sizes="300px"
+                 srcset="{{ asset('images/grupo-300.jpg') }} 300w, {{ asset('images/grupo-600.jpg') }} 600w"
+                 width="{{ manifiesto_assets['images/grupo-300.jpg'].ancho }}" height="{{ manifiesto_assets['images/grupo-300.jpg'].alto }}"
+                 loading="lazy" alt="GRUPO DE INVESTIGACION">
+        </picture>
+        {% else %}
+        <img src="{{ asset('images/grupo.jpg') }}" alt="GRUPO DE INVESTIGACION">
+        {% endif %}
         <p>Grupo de investigacion de la promocion 2024, Ingeniería de Sistemas e informática
         con el profesor Daza Vergaray</p>
         <p>&copy; 2025 Grupo 3. Todos los derechos reservados.</p>
@@ -319,162 +2367,9 @@ evaluacion_template = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Evaluación - Diagnóstico ERC</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: Arial, sans-serif;
-            background-color: #f5f5f5;
-            color: #333;
-        }
-        
-        .navbar {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1rem 2rem;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            position: fixed;
-            top: 0;
-            width: 100%;
-            z-index: 1000;
-        }
-        
-        .logo {
-            font-size: 1.5rem;
-            font-weight: bold;
-            color: white;
-        }
-        
-        .navbar ul {
-            display: flex;
-            list-style: none;
-            gap: 1.5rem;
-        }
-        
-        .navbar ul li a {
-            color: white;
-            text-decoration: none;
-            font-weight: 500;
-        }
-        
-        .container {
-            max-width: 800px;
-            margin: 100px auto 20px;
-            padding: 20px;
-            background: white;
-            border-radius: 10px;
-            box-shadow: 0 0 20px rgba(0,0,0,0.1);
-        }
-        
-        .main-title {
-            text-align: center;
-            color: #333;
-            margin-bottom: 30px;
-            font-size: 2rem;
-        }
-        
-        .form-group {
-            margin-bottom: 20px;
-        }
-        
-        .form-group label {
-            display: block;
-            margin-bottom: 5px;
-            font-weight: bold;
-            color: #555;
-        }
-        
-        .form-group input, .form-group select {
-            width: 100%;
-            padding: 10px;
-            border: 2px solid #ddd;
-            border-radius: 5px;
-            font-size: 16px;
-        }
-        
-        .form-group input:focus, .form-group select:focus {
-            border-color: #667eea;
-            outline: none;
-        }
-        
-        .btn-evaluar {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 15px 30px;
-            border: none;
-            border-radius: 25px;
-            font-size: 18px;
-            font-weight: bold;
-            cursor: pointer;
-            width: 100%;
-            margin-top: 20px;
-        }
-        
-        .btn-evaluar:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-        }
-        
-        .result-container {
-            margin-top: 30px;
-            padding: 20px;
-            background: #f8f9fa;
-            border-radius: 10px;
-            border-left: 5px solid #667eea;
-        }
-        
-        .result-success {
-            border-left-color: #28a745;
-            background-color: #d4edda;
-        }
-        
-        .result-warning {
-            border-left-color: #ffc107;
-            background-color: #fff3cd;
-        }
-        
-        .result-danger {
-            border-left-color: #dc3545;
-            background-color: #f8d7da;
-        }
-        
-        .btn-back {
-            display: inline-block;
-            background: #6c757d;
-            color: white;
-            padding: 10px 20px;
-            text-decoration: none;
-            border-radius: 5px;
-            margin-bottom: 20px;
-        }
-        
-        .warning-box {
-            background: #fff3cd;
-            border: 1px solid #ffeaa7;
-            border-radius: 5px;
-            padding: 15px;
-            margin-bottom: 20px;
-            border-left: 5px solid #f39c12;
-        }
-        
-        .image-container {
-            text-align: center;
-            margin: 50px 0;
-        }
-        
-        .image-container img {
-            max-width: 100%;
-            height: auto;
-            border-radius: 10px;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset('css/principal.css') }}">
 </head>
-<body>
+<body class="pagina-evaluacion">
     <nav class="navbar">
         <div class="logo">GRUPO 3</div>
         <ul>
@@ -502,6 +2397,16 @@ evaluacion_template = """
         </div>
         
         <form id="ckdForm" method="POST" action="/procesar_evaluacion">
+            <div class="form-group">
+                <label for="id_paciente">Identificador del paciente (opcional: guarda el resultado en su historial)</label>
+                <input type="text" id="id_paciente" name="id_paciente" maxlength="64">
+            </div>
+            
+            <div class="form-group">
+                <label for="fecha">Fecha del panel de laboratorio (opcional: por defecto, ahora)</label>
+                <input type="date" id="fecha" name="fecha">
+            </div>
+            
             <div class="form-group">
                 <label for="age">¿Cuál es su edad?</label>
                 <input type="number" id="age" name="age" min="0" max="120" value="30" required>
@@ -633,6 +2538,20 @@ evaluacion_template = """
             <h3>Resultado de la Evaluación</h3>
             <p><strong>{{ resultado.texto }}</strong></p>
             <p><strong>Exactitud del modelo:</strong> {{ resultado.probabilidad }}%</p>
+            {% if resultado.intervalo %}
+            <p><strong>Intervalo del {{ resultado.intervalo.nivel }}%:</strong> {{ resultado.intervalo.inferior }}% – {{ resultado.intervalo.superior }}%
+                <small>(entre réplicas bootstrap del modelo)</small></p>
+            {% endif %}
+            {% if resultado.similares %}
+            <br>
+            <p><strong>Pacientes más parecidos del dataset de referencia:</strong></p>
+            <ul style="margin-left: 20px;">
+                {% for vecino in resultado.similares %}
+                <li>Paciente {{ vecino.id }} (distancia {{ "%.2f"|format(vecino.distancia) }}):
+                    {% if vecino.erc == 1 %}con ERC{% elif vecino.erc == 0 %}sin ERC{% else %}sin diagnóstico{% endif %}</li>
+                {% endfor %}
+            </ul>
+            {% endif %}
             <br>
             <p><em>Nota: Este resultado no constituye un diagnóstico médico. Consulte a un profesional de la salud.</em></p>
         </div>
@@ -652,73 +2571,96 @@ def evaluar():
 
 @app.route('/procesar_evaluacion', methods=['POST'])
 def procesar_evaluacion():
+    cuerpo = repr(sorted(request.form.items(multi=True))).encode()
+    return ejecutar_idempotente('procesar_evaluacion', cuerpo, calcular_evaluacion)
+
+def calcular_evaluacion():
+    """Evalúa el formulario de la solicitud actual y devuelve la página renderizada"""
     try:
         if modelo is None:
-            return render_template_string(evaluacion_template, resultado={
+            return NoCacheable(render_template_string(evaluacion_template, resultado={
                 'texto': 'Error: Modelo no disponible',
                 'probabilidad': 0,
                 'clase': 'result-danger'
-            })
+            }))
         
-        # Obtener datos del formulario
-        datos = {
-            'sg': float(request.form['sg']),
-            'al': int(request.form['al']),
-            'su': int(request.form['su']),
-            'sc': float(request.form['sc']),
-            'bu': float(request.form['bu']),
-            'bgr': int(request.form['bgr']),
-            'hemo': float(request.form['hemo']),
-            'pcv': int(request.form['pcv']),
-            'rc': float(request.form['rc']),
-            'wc': int(request.form['wc']),
-            'dm': 1 if request.form['dm'] == 'Sí' else 0,
-            'htn': 1 if request.form['htn'] == 'Sí' else 0,
-            'ane': 1 if request.form['ane'] == 'Sí' else 0,
-            'appet': 0 if request.form['appet'] == 'bueno' else 1,
-            'rbc': 0 if request.form['rbc'] == 'normal' else 1,
-            'pc': 0 if request.form['pc'] == 'normal' else 1,
-            'age': int(request.form['age'])
-        }
-        
-        # Validar datos
-        errores = validar_datos(datos)
+        # Obtener y validar datos del formulario
+        with tramo('formulario'):
+            datos = {
+                'sg': float(request.form['sg']),
+                'al': int(request.form['al']),
+                'su': int(request.form['su']),
+                'sc': float(request.form['sc']),
+                'bu': float(request.form['bu']),
+                'bgr': int(request.form['bgr']),
+                'hemo': float(request.form['hemo']),
+                'pcv': int(request.form['pcv']),
+                'rc': float(request.form['rc']),
+                'wc': int(request.form['wc']),
+                'dm': 1 if request.form['dm'] == 'Sí' else 0,
+                'htn': 1 if request.form['htn'] == 'Sí' else 0,
+                'ane': 1 if request.form['ane'] == 'Sí' else 0,
+                'appet': 0 if request.form['appet'] == 'bueno' else 1,
+                'rbc': 0 if request.form['rbc'] == 'normal' else 1,
+                'pc': 0 if request.form['pc'] == 'normal' else 1,
+                'age': int(request.form['age'])
+            }
+            errores = validar_datos(datos)
         if errores:
-            return render_template_string(evaluacion_template, resultado={
+            return NoCacheable(render_template_string(evaluacion_template, resultado={
                 'texto': f'Datos fuera de rango: {", ".join(errores)}',
                 'probabilidad': 0,
                 'clase': 'result-warning'
-            })
+            }))
         
-        # Crear DataFrame
-        user_input = pd.DataFrame(datos, index=[0])
+        # Matriz de una fila en el orden del modelo
+        with tramo('matriz'):
+            user_input = np.array([[datos[col] for col in COLUMNAS_MODELO]], dtype=np.float64)
         
         # Realizar predicción
-        prediction = modelo.predict(user_input)
-        probability = modelo.predict_proba(user_input)[0]
+        with tramo('modelo'):
+            probability, entrada = registro_modelos.puntuar(user_input)
+        id_paciente = request.form.get('id_paciente', '').strip()
+        if id_paciente and historial_pacientes is not None:
+            historial_pacientes.registrar([id_paciente], fechas_panel([request.form.get('fecha') or None], 1),
+                                          probability, f"{entrada['nombre']}:{entrada['version']}", 'procesar_evaluacion')
+        
+        with tramo('intervalo'):
+            intervalo = registro_modelos.intervalos(user_input, entrada)
         
         # Preparar resultado
-        if prediction[0] == 1:
+        if probability[0] > 0.5:
             resultado = {
                 'texto': 'Alto riesgo de ERC',
-                'probabilidad': int(probability[1] * 100),
+                'probabilidad': int(probability[0] * 100),
                 'clase': 'result-danger'
             }
+            if intervalo is not None:
+                resultado['intervalo'] = {'inferior': int(intervalo[0, 0] * 100), 'superior': int(intervalo[0, 1] * 100)}
+            if indice_similares is not None:
+                with tramo('similares'):
+                    resultado['similares'] = indice_similares.vecinos(user_input, k=5)[0]
         else:
             resultado = {
                 'texto': 'Sin indicios de ERC',
-                'probabilidad': int(probability[0] * 100),
+                'probabilidad': int((1 - probability[0]) * 100),
                 'clase': 'result-success'
             }
+            if intervalo is not None:
+                resultado['intervalo'] = {'inferior': int((1 - intervalo[0, 1]) * 100),
+                                          'superior': int((1 - intervalo[0, 0]) * 100)}
+        if intervalo is not None:
+            resultado['intervalo']['nivel'] = int(round(app.config['INTERVALOS_NIVEL'] * 100))
         
-        return render_template_string(evaluacion_template, resultado=resultado)
+        with tramo('render'):
+            return render_template_string(evaluacion_template, resultado=resultado)
         
     except Exception as e:
-        return render_template_string(evaluacion_template, resultado={
+        return NoCacheable(render_template_string(evaluacion_template, resultado={
             'texto': f'Error al procesar la evaluación: {str(e)}',
             'probabilidad': 0,
             'clase': 'result-danger'
-        })
+        }))
 
 @app.route('/dataset-info')
 def dataset_info():
@@ -749,39 +2691,9 @@ def dataset_info():
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Información del Dataset - ERC</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body { font-family: Arial, sans-serif; background-color: #f5f5f5; color: #333; }
-            .navbar {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                padding: 1rem 2rem; display: flex; justify-content: space-between;
-                align-items: center; position: fixed; top: 0; width: 100%; z-index: 1000;
-            }
-            .logo { font-size: 1.5rem; font-weight: bold; color: white; }
-            .navbar ul { display: flex; list-style: none; gap: 1.5rem; }
-            .navbar ul li a { color: white; text-decoration: none; font-weight: 500; }
-            .container {
-                max-width: 1200px; margin: 100px auto 20px; padding: 20px;
-                background: white; border-radius: 10px; box-shadow: 0 0 20px rgba(0,0,0,0.1);
-            }
-            .main-title { text-align: center; color: #333; margin-bottom: 30px; font-size: 2rem; }
-            .stat-card {
-                background: #f8f9fa; padding: 20px; margin: 15px 0;
-                border-radius: 8px; border-left: 4px solid #667eea;
-            }
-            .stat-title { font-size: 1.2rem; font-weight: bold; margin-bottom: 10px; color: #333; }
-            .stat-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-top: 15px; }
-            .stat-item { background: white; padding: 15px; border-radius: 5px; border: 1px solid #ddd; }
-            .btn-back {
-                display: inline-block; background: #6c757d; color: white;
-                padding: 10px 20px; text-decoration: none; border-radius: 5px; margin-bottom: 20px;
-            }
-            table { width: 100%; border-collapse: collapse; margin-top: 15px; }
-            th, td { padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }
-            th { background-color: #f8f9fa; font-weight: bold; }
-        </style>
+        <link rel="stylesheet" href="{{ asset('css/principal.css') }}">
     </head>
-    <body>
+    <body class="pagina-dataset">
         <nav class="navbar">
             <div class="logo">GRUPO 3</div>
             <ul>
@@ -792,7 +2704,7 @@ def dataset_info():
             </ul>
         </nav>
         
-        <div class="container">
+        <div class="container ancho">
             <a href="/" class="btn-back">← Volver al Inicio</a>
             <h1 class="main-title">Información del Dataset: kidney_disease.csv</h1>
             
@@ -892,47 +2804,7 @@ def subir_csv():
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Evaluar CSV - ERC</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body { font-family: Arial, sans-serif; background-color: #f5f5f5; color: #333; }
-            .navbar {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                padding: 1rem 2rem; display: flex; justify-content: space-between;
-                align-items: center; position: fixed; top: 0; width: 100%; z-index: 1000;
-            }
-            .logo { font-size: 1.5rem; font-weight: bold; color: white; }
-            .navbar ul { display: flex; list-style: none; gap: 1.5rem; }
-            .navbar ul li a { color: white; text-decoration: none; font-weight: 500; }
-            .container {
-                max-width: 800px; margin: 100px auto 20px; padding: 20px;
-                background: white; border-radius: 10px; box-shadow: 0 0 20px rgba(0,0,0,0.1);
-            }
-            .main-title { text-align: center; color: #333; margin-bottom: 30px; font-size: 2rem; }
-            .upload-area {
-                border: 2px dashed #667eea; border-radius: 10px; padding: 40px;
-                text-align: center; background: #f8f9fa; margin: 20px 0;
-            }
-            .upload-area:hover { background: #e3f2fd; }
-            .btn-upload {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white; padding: 12px 30px; border: none; border-radius: 25px;
-                font-size: 16px; font-weight: bold; cursor: pointer; margin: 10px;
-            }
-            .btn-back {
-                display: inline-block; background: #6c757d; color: white;
-                padding: 10px 20px; text-decoration: none; border-radius: 5px; margin-bottom: 20px;
-            }
-            .warning-box {
-                background: #fff3cd; border: 1px solid #ffeaa7; border-radius: 5px;
-                padding: 15px; margin: 20px 0; border-left: 5px solid #f39c12;
-            }
-            .info-box {
-                background: #e8f4ff; border: 1px solid #bee5eb; border-radius: 5px;
-                padding: 15px; margin: 20px 0; border-left: 5px solid #3498db;
-            }
-            .file-input { margin: 15px 0; }
-            .file-input input[type="file"] { padding: 10px; border: 1px solid #ddd; border-radius: 5px; width: 100%; }
-        </style>
+        <link rel="stylesheet" href="{{ asset('css/principal.css') }}">
     </head>
     <body>
         <nav class="navbar">
@@ -957,6 +2829,8 @@ def subir_csv():
                 <h3>📋 Formato del archivo CSV requerido:</h3>
                 <p>El archivo debe contener las siguientes columnas:</p>
                 <p><strong>age, sg, al, su, sc, bu, bgr, hemo, pcv, rc, wc, dm, htn, ane, appet, rbc, pc</strong></p>
+                <p>Opcionales: <strong>id</strong> (identificador del paciente; guarda cada resultado en su historial)
+                y <strong>fecha</strong> (fecha del panel, AAAA-MM-DD).</p>
                 <br>
                 <p>Los valores categóricos deben estar codificados como:</p>
                 <ul style="margin-left: 20px;">
@@ -973,6 +2847,9 @@ def subir_csv():
                     <div class="file-input">
                         <input type="file" name="file" accept=".csv" required>
                     </div>
+                    <div class="file-input">
+                        <input type="text" name="cohorte" placeholder="Nombre de la cohorte (opcional: solo se vuelven a evaluar pacientes nuevos o modificados)" style="padding: 10px; border: 1px solid #ddd; border-radius: 5px; width: 100%;">
+                    </div>
                     <button type="submit" class="btn-upload">EVALUAR ARCHIVO CSV</button>
                 </div>
             </form>
@@ -992,70 +2869,108 @@ def subir_csv():
 @app.route('/procesar-csv', methods=['POST'])
 def procesar_csv():
     """Procesar archivo CSV subido"""
-    if 'file' not in request.files:
+    with tramo('multipart'):
+        archivos = request.files
+    if 'file' not in archivos:
         flash('No se seleccionó ningún archivo')
         return redirect(request.url)
     
-    file = request.files['file']
+    file = archivos['file']
     if file.filename == '':
         flash('No se seleccionó ningún archivo')
         return redirect(request.url)
     
     if file and allowed_file(file.filename):
-        try:
-            # Leer el archivo CSV
-            df = pd.read_csv(file)
-            
-            # Validar columnas requeridas
-            columnas_requeridas = ['age', 'sg', 'al', 'su', 'sc', 'bu', 'bgr', 'hemo', 'pcv', 'rc', 'wc', 'dm', 'htn', 'ane', 'appet', 'rbc', 'pc']
-            columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
-            
-            if columnas_faltantes:
-                error_msg = f"Columnas faltantes: {', '.join(columnas_faltantes)}"
-                return render_template_string(resultado_csv_template, 
-                                            error=error_msg, 
-                                            total_filas=0, 
-                                            resultados=[])
-            
-            # Realizar predicciones
-            if modelo is None:
-                return render_template_string(resultado_csv_template, 
-                                            error="Modelo no disponible", 
-                                            total_filas=0, 
-                                            resultados=[])
-            
-            predictions = modelo.predict(df[columnas_requeridas])
-            probabilities = modelo.predict_proba(df[columnas_requeridas])
-            
-            # Crear resultados
+        contenido = file.read()
+        # Solo hay re-scoring incremental si el cliente nombra la cohorte: deducirla del nombre del
+        # archivo mezclaría pacientes de distintos clientes que suben, p. ej., datos.csv
+        indicada = (request.form.get('cohorte') or request.headers.get('X-Cohorte') or '').strip()
+        cohorte = secure_filename(indicada)
+        if indicada and not cohorte:
+            flash('Nombre de cohorte no válido')
+            return redirect(url_for('subir_csv'))
+        respuesta = app.make_response(ejecutar_idempotente('procesar-csv', contenido + b'\0' + cohorte.encode(),
+                                                           lambda: calcular_resultado_csv(contenido, cohorte or None)))
+        if cohorte:
+            respuesta.headers['X-Cohorte'] = cohorte
+        return respuesta
+    
+    return redirect(url_for('subir_csv'))
+
+def calcular_resultado_csv(contenido, cohorte=None):
+    """Puntúa el contenido de un CSV y devuelve la página de resultados renderizada"""
+    try:
+        # Leer el archivo CSV
+        with tramo('parseo_csv'):
+            df = leer_csv(contenido)
+        
+        # Validar columnas requeridas
+        columnas_requeridas = ['age', 'sg', 'al', 'su', 'sc', 'bu', 'bgr', 'hemo', 'pcv', 'rc', 'wc', 'dm', 'htn', 'ane', 'appet', 'rbc', 'pc']
+        columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
+        
+        if columnas_faltantes:
+            error_msg = f"Columnas faltantes: {', '.join(columnas_faltantes)}"
+            return NoCacheable(render_template_string(resultado_csv_template, 
+                                        error=error_msg, 
+                                        total_filas=0, 
+                                        resultados=[]))
+        
+        # Realizar predicciones
+        if modelo is None:
+            return NoCacheable(render_template_string(resultado_csv_template, 
+                                        error="Modelo no disponible", 
+                                        total_filas=0, 
+                                        resultados=[]))
+        
+        # Preprocesamiento compartido por todos los modelos (principal y sombra)
+        with tramo('preprocesamiento'):
+            X, imputados = preparar_matriz(df, con_imputados=True)
+        resumen_cohorte = None
+        with tramo('modelo'):
+            if cohorte:
+                probabilities, resumen_cohorte = puntuar_cohorte(cohorte, df, X, imputados)
+                modelo_usado = resumen_cohorte['modelo']
+            else:
+                probabilities, entrada = registro_modelos.puntuar(X, hashlib.sha256(contenido).digest(),
+                                                                  imputados=imputados)
+                modelo_usado = f"{entrada['nombre']}:{entrada['version']}"
+        registrar_historial(df, probabilities, modelo_usado, 'procesar_csv')
+        with tramo('similares'):
+            agregar_similares(df, X)
+        hash_lote = guardar_lote(contenido, df, probabilities, modelo_usado)
+        predictions = (probabilities > 0.5).astype(int)
+        
+        # Crear resultados
+        with tramo('resultados'):
             resultados = []
             for i, (pred, prob) in enumerate(zip(predictions, probabilities)):
                 resultado = {
                     'fila': i + 1,
-                    'prediccion': 'Alto riesgo de ERC' if pred == 1 else 'Sin indicios de ERC',
-                    'probabilidad': int(prob[pred] * 100),
+                    'prediccion': ETIQUETAS_RIESGO[pred],
+                    'probabilidad': int((prob if pred == 1 else 1 - prob) * 100),
                     'clase': 'danger' if pred == 1 else 'success'
                 }
                 resultados.append(resultado)
-            
-            # Estadísticas generales
-            total_alto_riesgo = sum(1 for r in resultados if r['clase'] == 'danger')
-            total_sin_riesgo = len(resultados) - total_alto_riesgo
-            
+        
+        # Estadísticas generales
+        total_alto_riesgo = sum(1 for r in resultados if r['clase'] == 'danger')
+        total_sin_riesgo = len(resultados) - total_alto_riesgo
+        
+        with tramo('render'):
             return render_template_string(resultado_csv_template, 
                                         resultados=resultados,
                                         total_filas=len(df),
                                         total_alto_riesgo=total_alto_riesgo,
                                         total_sin_riesgo=total_sin_riesgo,
+                                        cohorte=resumen_cohorte,
+                                        hash_lote=hash_lote,
                                         error=None)
-            
-        except Exception as e:
-            return render_template_string(resultado_csv_template, 
-                                        error=f"Error al procesar el archivo: {str(e)}", 
-                                        total_filas=0, 
-                                        resultados=[])
-    
-    return redirect(url_for('subir_csv'))
+        
+    except Exception as e:
+        return NoCacheable(render_template_string(resultado_csv_template, 
+                                    error=f"Error al procesar el archivo: {str(e)}", 
+                                    total_filas=0, 
+                                    resultados=[]))
 
 # Template para mostrar resultados del CSV
 resultado_csv_template = """
@@ -1065,45 +2980,7 @@ resultado_csv_template = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Resultados CSV - ERC</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: Arial, sans-serif; background-color: #f5f5f5; color: #333; }
-        .navbar {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1rem 2rem; display: flex; justify-content: space-between;
-            align-items: center; position: fixed; top: 0; width: 100%; z-index: 1000;
-        }
-        .logo { font-size: 1.5rem; font-weight: bold; color: white; }
-        .navbar ul { display: flex; list-style: none; gap: 1.5rem; }
-        .navbar ul li a { color: white; text-decoration: none; font-weight: 500; }
-        .container {
-            max-width: 1200px; margin: 100px auto 20px; padding: 20px;
-            background: white; border-radius: 10px; box-shadow: 0 0 20px rgba(0,0,0,0.1);
-        }
-        .main-title { text-align: center; color: #333; margin-bottom: 30px; font-size: 2rem; }
-        .btn-back {
-            display: inline-block; background: #6c757d; color: white;
-            padding: 10px 20px; text-decoration: none; border-radius: 5px; margin-bottom: 20px;
-        }
-        .summary-card {
-            background: #f8f9fa; padding: 20px; margin: 20px 0;
-            border-radius: 8px; border-left: 4px solid #667eea;
-        }
-        .summary-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; margin-top: 15px; }
-        .summary-item { background: white; padding: 15px; border-radius: 5px; text-align: center; }
-        .summary-item.success { border-left: 4px solid #28a745; }
-        .summary-item.danger { border-left: 4px solid #dc3545; }
-        .summary-item.info { border-left: 4px solid #17a2b8; }
-        table { width: 100%; border-collapse: collapse; margin-top: 20px; }
-        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
-        th { background-color: #f8f9fa; font-weight: bold; }
-        .row-success { background-color: #d4edda; }
-        .row-danger { background-color: #f8d7da; }
-        .error-box {
-            background: #f8d7da; border: 1px solid #f5c6cb; border-radius: 5px;
-            padding: 15px; margin: 20px 0; border-left: 5px solid #dc3545;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset('css/principal.css') }}">
 </head>
 <body>
     <nav class="navbar">
@@ -1116,7 +2993,7 @@ resultado_csv_template = """
         </ul>
     </nav>
     
-    <div class="container">
+    <div class="container ancho">
         <a href="/subir-csv" class="btn-back">← Volver a Subir CSV</a>
         <h1 class="main-title">Resultados de Evaluación CSV</h1>
         
@@ -1144,6 +3021,22 @@ resultado_csv_template = """
             </div>
         </div>
         
+        {% if cohorte %}
+        <div class="summary-card">
+            <h3>🔁 Cohorte {{ cohorte.cohorte }}</h3>
+            <p>{{ cohorte.reutilizadas }} de {{ cohorte.filas }} pacientes sin cambios desde la carga anterior
+            ({{ "%.1f"|format(cohorte.fraccion_omitida * 100) }}% omitido); {{ cohorte.puntuadas }} puntuados.
+            Tiempo ahorrado: {{ "%.3f"|format(cohorte.segundos_ahorrados) }} s.</p>
+        </div>
+        {% endif %}
+        
+        <div class="summary-card">
+            <h3>🖨️ Informes por Paciente</h3>
+            <p>Un informe imprimible (HTML y PDF) por paciente, con sus valores, el riesgo y los valores fuera de rango.</p>
+            <p><a href="/informes/{{ hash_lote }}.zip">Descargar informes de pacientes de alto riesgo (.zip)</a> ·
+            <a href="/informes/{{ hash_lote }}.zip?todos=1">Todos los pacientes (.zip)</a></p>
+        </div>
+        
         <div class="summary-card">
             <h3>📋 Resultados Detallados</h3>
             <table>
@@ -1186,6 +3079,509 @@ resultado_csv_template = """
 </html>
 """
 
+@app.route('/evaluar-cohorte', methods=['GET', 'POST'])
+def evaluar_cohorte():
+    """Evalúa el modelo sobre un CSV etiquetado (POST) o el dataset de referencia (GET) para varios umbrales"""
+    if modelo is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if file is None or file.filename == '' or not allowed_file(file.filename):
+            return jsonify({'error': 'Debe enviar un archivo CSV etiquetado en el campo "file"'}), 400
+        contenido = file.read()
+    else:
+        with open(DATASET_REF_PATH, 'rb') as f:
+            contenido = f.read()
+
+    try:
+        hash_dataset, evaluacion = evaluar_dataset(contenido)
+    except Exception as e:
+        return jsonify({'error': f'Error al evaluar el dataset: {str(e)}'}), 400
+    return respuesta_evaluacion(hash_dataset, evaluacion)
+
+@app.route('/evaluar-cohorte/<hash_dataset>')
+def consultar_evaluacion(hash_dataset):
+    """Consulta umbrales adicionales sobre una evaluación ya calculada, sin volver a puntuar"""
+    with cache_evaluaciones_lock:
+        evaluacion = cache_evaluaciones.get(hash_dataset)
+    if evaluacion is None:
+        return jsonify({'error': 'Evaluación no encontrada, vuelva a enviar el dataset'}), 404
+    return respuesta_evaluacion(hash_dataset, evaluacion)
+
+@app.route('/metricas/idempotencia')
+def metricas_idempotencia():
+    """Trabajo ahorrado por la deduplicación de solicitudes repetidas"""
+    return jsonify(almacen_idempotencia.estado())
+
+@app.route('/informes/<hash_lote>.zip')
+def informes_lote(hash_lote):
+    """Zip en streaming con un informe HTML y PDF por paciente de un lote subido a /procesar-csv
+    (?todos=1 para incluir a los pacientes sin indicios de ERC)"""
+    with cache_lotes_lock:
+        lote = cache_lotes.get(hash_lote)
+    if lote is None:
+        return jsonify({'error': 'Lote no encontrado, vuelva a subir el CSV'}), 404
+    df, probabilidades, modelo_usado = lote
+    with tramo('datos_informes'):
+        pacientes = pacientes_informe(df, probabilidades, request.args.get('todos') == '1')
+    if not pacientes:
+        return jsonify({'error': 'El lote no tiene pacientes de alto riesgo'}), 404
+    bloques = informes.zip_informes(pacientes, contexto_informes(modelo_usado), app.config['INFORMES_PROCESOS'],
+                                    app.config['INFORMES_FILAS_POR_TAREA'])
+    response = Response(stream_with_context(bloques), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=informes-{hash_lote[:12]}.zip'
+    return response
+
+@app.route('/api/procesar-csv', methods=['POST'])
+def api_procesar_csv():
+    """Resultados de un CSV para integraciones: ?formato=csv|binario&precision=float64|float32,
+    en streaming y comprimidos según Accept-Encoding. Con formato=csv&intervalos=1 agrega las
+    columnas ic_inferior e ic_superior (intervalo percentil del ensamble bootstrap)."""
+    if modelo is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    file = request.files.get('file')
+    if file is None or file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'Debe enviar un archivo CSV en el campo "file"'}), 400
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'binario'):
+        return jsonify({'error': f'Formato no soportado: {formato}'}), 400
+    precision = request.args.get('precision', app.config['PRECISION_LOTES'])
+    if precision not in PRECISIONES:
+        return jsonify({'error': f'Precisión no soportada: {precision}'}), 400
+    intervalos = request.args.get('intervalos') == '1'
+    if intervalos and formato != 'csv':
+        return jsonify({'error': 'Los intervalos solo están disponibles con formato=csv'}), 400
+
+    contenido = file.read()
+    try:
+        df = leer_csv(contenido)
+    except Exception as e:
+        return jsonify({'error': f'Error al leer el archivo: {str(e)}'}), 400
+    columnas_faltantes = [col for col in COLUMNAS_MODELO if col not in df.columns]
+    if columnas_faltantes:
+        return jsonify({'error': f"Columnas faltantes: {', '.join(columnas_faltantes)}"}), 400
+
+    tamano_bloque = app.config['TAMANO_BLOQUE_STREAMING']
+    clave_ruteo = hashlib.sha256(contenido).digest()
+    if intervalos:
+        entrada = registro_modelos.elegir(clave_ruteo)
+        if entrada['bootstrap'] is None:
+            return jsonify({'error': f"El modelo {entrada['nombre']}:{entrada['version']} no tiene ensamble "
+                                     f"bootstrap (ver `python entrenar.py --bootstrap`)"}), 400
+    if formato == 'binario':
+        bloques, mimetype = bloques_resultados_binarios(df, tamano_bloque, clave_ruteo, PRECISIONES[precision]), 'application/octet-stream'
+    else:
+        bloques, mimetype = bloques_resultados_csv(df, tamano_bloque, clave_ruteo, PRECISIONES[precision],
+                                                   intervalos), 'text/csv'
+    codificacion = negociar_codificacion(request.headers.get('Accept-Encoding', ''))
+    response = Response(stream_with_context(comprimir_stream(bloques, codificacion)), mimetype=mimetype)
+    if codificacion:
+        response.headers['Content-Encoding'] = codificacion
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/cargas', methods=['POST'])
+def crear_carga():
+    """Inicia una carga por fragmentos: {"nombre": "laboratorio.csv", "sha256": "<opcional, del archivo completo>"}.
+
+    Protocolo: PUT /api/cargas/<id>/fragmentos/<n> con el cuerpo crudo de cada fragmento y
+    X-Checksum-Sha256; GET /api/cargas/<id> para saber qué fragmentos faltan al reanudar;
+    POST /api/cargas/<id>/completar {"total_fragmentos": N}; GET /api/cargas/<id>/resultados.
+    """
+    if modelo is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    cuerpo = request.get_json(silent=True) or {}
+    nombre = str(cuerpo.get('nombre', 'carga.csv'))
+    if not allowed_file(nombre):
+        return jsonify({'error': 'Solo se aceptan archivos CSV'}), 400
+    sha256 = cuerpo.get('sha256')
+    if sha256 is not None:
+        sha256 = str(sha256).lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            return jsonify({'error': 'sha256 debe ser un hash SHA-256 en hexadecimal'}), 400
+    id_carga = almacen_cargas.crear(secure_filename(nombre), sha256)
+    response = jsonify(almacen_cargas.estado(id_carga))
+    response.status_code = 201
+    response.headers['Location'] = url_for('estado_carga', id_carga=id_carga)
+    return response
+
+@app.route('/api/cargas/<id_carga>', methods=['GET', 'DELETE'])
+def estado_carga(id_carga):
+    """Fragmentos recibidos (en rangos) y filas ya puntuadas (GET), o borrado de la carga (DELETE)"""
+    try:
+        if request.method == 'DELETE':
+            almacen_cargas.eliminar(id_carga)
+            return jsonify({'id': id_carga, 'eliminada': True})
+        return jsonify(almacen_cargas.estado(id_carga))
+    except KeyError:
+        return jsonify({'error': 'Carga no encontrada'}), 404
+
+@app.route('/api/cargas/<id_carga>/fragmentos/<int:numero>', methods=['PUT'])
+def subir_fragmento(id_carga, numero):
+    """Guarda el fragmento `numero` (cuerpo crudo) y puntúa lo que ya se puede puntuar"""
+    sha256 = request.headers.get('X-Checksum-Sha256', '').lower()
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return jsonify({'error': 'Falta el encabezado X-Checksum-Sha256 con el SHA-256 del fragmento'}), 400
+    try:
+        with tramo('fragmento'):
+            almacen_cargas.guardar_fragmento(id_carga, numero, request.stream, sha256)
+        with tramo('scoring'):
+            almacen_cargas.puntuar_pendientes(id_carga)
+        estado = almacen_cargas.estado(id_carga)
+    except KeyError:
+        return jsonify({'error': 'Carga no encontrada'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if estado['error']:
+        return jsonify(estado), 400
+    return jsonify(estado)
+
+@app.route('/api/cargas/<id_carga>/completar', methods=['POST'])
+def completar_carga(id_carga):
+    """Cierra la carga: {"total_fragmentos": N}. Responde 409 con los fragmentos que falten"""
+    cuerpo = request.get_json(silent=True) or {}
+    try:
+        total = int(cuerpo['total_fragmentos'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Debe indicar total_fragmentos'}), 400
+    if not 1 <= total <= app.config['CARGAS_MAX_FRAGMENTOS']:
+        return jsonify({'error': f"total_fragmentos debe estar entre 1 y {app.config['CARGAS_MAX_FRAGMENTOS']}"}), 400
+    try:
+        faltantes = almacen_cargas.completar(id_carga, total)
+        estado = almacen_cargas.estado(id_carga)
+    except KeyError:
+        return jsonify({'error': 'Carga no encontrada'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if faltantes:
+        return jsonify({'error': 'Faltan fragmentos', 'faltantes': rangos_consecutivos(faltantes)}), 409
+    if estado['error']:
+        return jsonify(estado), 400
+    return jsonify(estado)
+
+@app.route('/api/cargas/<id_carga>/resultados')
+def resultados_carga(id_carga):
+    """CSV de resultados puntuado hasta ahora (completo si X-Carga-Completa es true), en streaming"""
+    try:
+        _, bloques = almacen_cargas.resultados(id_carga)
+        estado = almacen_cargas.estado(id_carga)
+    except KeyError:
+        return jsonify({'error': 'Carga no encontrada'}), 404
+    codificacion = negociar_codificacion(request.headers.get('Accept-Encoding', ''))
+    response = Response(stream_with_context(comprimir_stream(bloques, codificacion)), mimetype='text/csv')
+    if codificacion:
+        response.headers['Content-Encoding'] = codificacion
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Carga-Completa'] = 'true' if estado['completada'] else 'false'
+    response.headers['X-Filas-Puntuadas'] = str(estado['filas_puntuadas'])
+    return response
+
+@app.route('/metricas/cargas')
+def metricas_cargas():
+    """Fragmentos, bytes y filas puntuadas de las cargas por fragmentos"""
+    return jsonify(almacen_cargas.estado_global())
+
+def instante_parametro(nombre, defecto):
+    """Parámetro de fecha ISO (AAAA-MM-DD o fecha y hora; sin zona horaria se toma UTC) en segundos epoch"""
+    valor = request.args.get(nombre)
+    if not valor:
+        return defecto
+    instante = pd.Timestamp(valor)
+    if instante is pd.NaT:
+        raise ValueError(f'{nombre}: fecha vacía')
+    return (instante.tz_localize('UTC') if instante.tzinfo is None else instante).timestamp()
+
+def fecha_iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='seconds')
+
+@app.route('/api/pacientes/<paciente>/historial')
+def historial_paciente(paciente):
+    """Trayectoria de riesgo de un paciente: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (opcionales)"""
+    if historial_pacientes is None:
+        return jsonify({'error': 'Historial no disponible'}), 503
+    try:
+        desde = instante_parametro('desde', 0.0)
+        hasta = instante_parametro('hasta', float('inf'))
+    except ValueError as e:
+        return jsonify({'error': f'Fecha no válida: {str(e)}'}), 400
+    filas = historial_pacientes.historial(paciente, desde, hasta)
+    return jsonify({
+        'paciente': paciente,
+        'predicciones': [{'fecha': fecha_iso(ts), 'probabilidad': round(p, 4), 'prediccion': ETIQUETAS_RIESGO[int(p > 0.5)],
+                          'modelo': modelo_usado, 'origen': origen} for ts, p, modelo_usado, origen in filas],
+        'cambio': round(filas[-1][1] - filas[0][1], 4) if len(filas) > 1 else None,
+    })
+
+@app.route('/api/pacientes/riesgo-alto')
+def pacientes_riesgo_alto():
+    """Pacientes con la mayor probabilidad de ERC en los últimos ?dias=30 (máxima por paciente), ?limite=50"""
+    if historial_pacientes is None:
+        return jsonify({'error': 'Historial no disponible'}), 503
+    try:
+        dias = float(request.args.get('dias', 30))
+        limite = int(request.args.get('limite', 50))
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros no válidos: {str(e)}'}), 400
+    if not 0 < dias <= 36500:
+        return jsonify({'error': 'dias debe estar entre 0 y 36500'}), 400
+    if not 1 <= limite <= 1000:
+        return jsonify({'error': 'limite debe estar entre 1 y 1000'}), 400
+    desde = time.time() - dias * 86400
+    return jsonify({
+        'dias': dias,
+        'desde': fecha_iso(desde),
+        'pacientes': [{'paciente': paciente, 'probabilidad': round(p, 4), 'fecha': fecha_iso(ts)}
+                      for paciente, p, ts in historial_pacientes.mayor_riesgo(desde, limite)],
+    })
+
+@app.route('/metricas/historial')
+def metricas_historial():
+    """Lotes y filas escritas en el historial de pacientes"""
+    if historial_pacientes is None:
+        return jsonify({'error': 'Historial no disponible'}), 503
+    return jsonify(historial_pacientes.estado())
+
+@app.route('/api/puntuar', methods=['POST'])
+def api_puntuar():
+    """Probabilidad de ERC de vectores ya codificados, sin formulario ni HTML, para integraciones
+    que puntúan de a un paciente sobre conexiones keep-alive.
+
+    application/octet-stream: una o más tramas del canal binario (ver leer_tramas), respondidas
+    en el mismo formato; los errores vuelven como trama TRAMA_ERROR. JSON: {"pacientes": [{variable: valor, ...}, ...]} ->
+    {"probabilidades": [...]}, con null en los pacientes que no pasan la validación; con
+    ?intervalos=1 agrega "intervalos": [[inferior, superior], ...] y su "nivel" (null si el
+    modelo que puntuó no tiene ensamble bootstrap).
+    """
+    if modelo is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    max_filas = app.config['CANAL_BINARIO_MAX_FILAS']
+    if request.mimetype == 'application/octet-stream':
+        # Los errores también van como trama, para que los clientes binarios no tengan que leer JSON
+        if 'intervalos' in request.args:
+            return Response(trama_error('El canal binario no devuelve intervalos; use JSON con ?intervalos=1'),
+                            status=400, mimetype='application/octet-stream')
+        cuerpo = request.get_data()
+        try:
+            X, filas, consumidos = leer_tramas(cuerpo, max_filas)
+        except ValueError as e:
+            return Response(trama_error(str(e)), status=400, mimetype='application/octet-stream')
+        if consumidos != len(cuerpo) or not filas:
+            return Response(trama_error('El cuerpo debe contener tramas completas <uint32 n><float32 x[n][17]>'),
+                            status=400, mimetype='application/octet-stream')
+        return Response(responder_tramas(puntuar_vectores(X), filas), mimetype='application/octet-stream')
+
+    cuerpo = request.get_json(silent=True)
+    pacientes = cuerpo.get('pacientes') if isinstance(cuerpo, dict) else None
+    if not isinstance(pacientes, list) or not 1 <= len(pacientes) <= max_filas:
+        return jsonify({'error': f'Debe enviar "pacientes": una lista de 1 a {max_filas} pacientes'}), 400
+    try:
+        X = np.array([[paciente.get(col, np.nan) for col in COLUMNAS_MODELO] for paciente in pacientes],
+                     dtype=np.float64)
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Datos no válidos: {str(e)}'}), 400
+    if request.args.get('intervalos') != '1':
+        p = puntuar_vectores(X)
+        return jsonify({'probabilidades': [None if np.isnan(x) else round(float(x), 4) for x in p]})
+    p, extremos = puntuar_vectores(X, intervalos=True)
+    return jsonify({
+        'probabilidades': [None if np.isnan(x) else round(float(x), 4) for x in p],
+        'intervalos': [None if np.isnan(i[0]) else [round(float(i[0]), 4), round(float(i[1]), 4)] for i in extremos],
+        'nivel': app.config['INTERVALOS_NIVEL'],
+    })
+
+@app.route('/modelos')
+def modelos():
+    """Modelos registrados, reparto de tráfico, modelo en sombra y costo de scoring de cada uno"""
+    return jsonify(registro_modelos.estado())
+
+@app.route('/analitica')
+def analitica():
+    """Desglose de riesgo desde los cubos: ?cubo=referencia|puntuados&por=edad,htn&dm=1"""
+    nombre = request.args.get('cubo', 'referencia')
+    if nombre not in cubos:
+        return jsonify({'error': f'Cubo desconocido: {nombre}'}), 400
+    por = [d for d in request.args.get('por', '').split(',') if d]
+    filtros = {d: request.args[d] for d in DIMENSIONES_CUBO if d in request.args}
+    desconocidas = [d for d in por if d not in DIMENSIONES_CUBO]
+    invalidos = [f'{d}={v}' for d, v in filtros.items() if v not in DIMENSIONES_CUBO[d]]
+    if desconocidas or invalidos:
+        return jsonify({'error': 'Dimensiones o filtros no válidos: ' + ', '.join(desconocidas + invalidos),
+                        'dimensiones': DIMENSIONES_CUBO}), 400
+    return jsonify({'cubo': nombre, 'por': por, 'filtros': filtros,
+                    'grupos': cubos[nombre].consultar(por, filtros)})
+
+@app.route('/pacientes-similares', methods=['POST'])
+def pacientes_similares():
+    """k pacientes de referencia más parecidos: JSON {"pacientes": [{variable: valor, ...}], "k": 5},
+    con hasta CANAL_BINARIO_MAX_FILAS pacientes por solicitud"""
+    if indice_similares is None:
+        return jsonify({'error': 'Índice de pacientes similares no disponible'}), 503
+    cuerpo = request.get_json(silent=True)
+    pacientes = cuerpo.get('pacientes') if isinstance(cuerpo, dict) else None
+    max_filas = app.config['CANAL_BINARIO_MAX_FILAS']
+    if not isinstance(pacientes, list) or not 1 <= len(pacientes) <= max_filas:
+        return jsonify({'error': f'Debe enviar "pacientes": una lista de 1 a {max_filas} pacientes con las '
+                                 f'variables del modelo'}), 400
+    try:
+        k = int(cuerpo.get('k', 5))
+        df = pd.DataFrame(pacientes).reindex(columns=COLUMNAS_MODELO)
+        X = preparar_matriz(df)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Datos no válidos: {str(e)}'}), 400
+    if not 1 <= k <= 100:
+        return jsonify({'error': 'k debe estar entre 1 y 100'}), 400
+    return jsonify({'k': k, 'similares': indice_similares.vecinos(X, k)})
+
+def grilla_sensibilidad(base, barridos):
+    """Matriz con una fila por punto de la grilla: copia del paciente base con las variables barridas reemplazadas"""
+    valores = [np.linspace(b['min'], b['max'], b['puntos']) for b in barridos]
+    mallas = np.meshgrid(*valores, indexing='ij')
+    X = np.repeat(base, mallas[0].size, axis=0)
+    for barrido, malla in zip(barridos, mallas):
+        X[:, COLUMNAS_MODELO.index(barrido['variable'])] = malla.ravel()
+    return X, valores
+
+@app.route('/sensibilidad', methods=['POST'])
+def sensibilidad():
+    """Curva o superficie de riesgo al barrer una o dos variables del paciente:
+    JSON {"paciente": {variable: valor, ...}, "barrido": [{"variable": "sc", "min": 0.5, "max": 5, "puntos": 100}]}"""
+    if modelo is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    cuerpo = request.get_json(silent=True) or {}
+    paciente = cuerpo.get('paciente')
+    barridos = cuerpo.get('barrido')
+    if not isinstance(paciente, dict) or not isinstance(barridos, list) or not 1 <= len(barridos) <= 2:
+        return jsonify({'error': 'Debe enviar un "paciente" y un "barrido" de una o dos variables'}), 400
+    try:
+        errores = validar_datos(paciente)
+        base = preparar_matriz(pd.DataFrame([paciente]).reindex(columns=COLUMNAS_MODELO))
+        normalizados = []
+        for b in barridos:
+            variable = b['variable']
+            if variable not in RANGOS_VALIDOS:
+                errores.append(f"{variable}: solo se pueden barrer {', '.join(RANGOS_VALIDOS)}")
+                continue
+            min_val, max_val = RANGOS_VALIDOS[variable]
+            desde, hasta = float(b.get('min', min_val)), float(b.get('max', max_val))
+            puntos = int(b.get('puntos', 50))
+            if not min_val <= desde < hasta <= max_val:
+                errores.append(f"{variable}: el barrido debe estar dentro del rango válido ({min_val}-{max_val})")
+            if not 2 <= puntos <= 200:
+                errores.append(f"{variable}: puntos debe estar entre 2 y 200")
+            normalizados.append({'variable': variable, 'min': desde, 'max': hasta, 'puntos': puntos})
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({'error': f'Datos no válidos: {str(e)}'}), 400
+    if len({b['variable'] for b in normalizados}) != len(normalizados):
+        errores.append('Las variables barridas deben ser distintas')
+    if errores:
+        return jsonify({'error': f'Datos fuera de rango: {", ".join(errores)}'}), 400
+
+    # Toda la grilla se puntúa en una sola llamada vectorizada, con el mismo modelo que el paciente base
+    X, valores = grilla_sensibilidad(base, normalizados)
+    clave_ruteo = base.tobytes()
+    p_base, entrada = registro_modelos.puntuar(base, clave_ruteo, hipotetico=True)
+    p, _ = registro_modelos.puntuar(X, clave_ruteo, hipotetico=True)
+    return jsonify({
+        'modelo': f"{entrada['nombre']}:{entrada['version']}",
+        'probabilidad_base': round(float(p_base[0]), 4),
+        'variables': [b['variable'] for b in normalizados],
+        'valores': [np.round(v, 4).tolist() for v in valores],
+        'probabilidad': np.round(p.reshape([b['puntos'] for b in normalizados]), 4).tolist(),
+    })
+
+@app.route('/metricas/auditoria')
+def metricas_auditoria():
+    """Estado del buffer de auditoría y volumen escrito"""
+    if registro_modelos.auditoria is None:
+        return jsonify({'activa': False})
+    return jsonify(dict(registro_modelos.auditoria.estado(), activa=True))
+
+@app.route('/metricas/admision')
+def metricas_admision():
+    """Profundidad de cola, solicitudes activas y rechazos por carril"""
+    return jsonify({nombre: carril.estado() for nombre, carril in carriles.items()})
+
+def autorizar_admin():
+    """None si la solicitud trae el token de administración; si no, la respuesta de error"""
+    token = app.config['PERFILADO_TOKEN']
+    if not token:
+        return jsonify({'error': 'Perfilado deshabilitado (configure PERFILADO_TOKEN)'}), 404
+    enviado = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(enviado.encode(), token.encode()):
+        return jsonify({'error': 'No autorizado'}), 401
+    return None
+
+def admin_perfilado():
+    """Estado (GET), activación (POST {"segundos": 30, "fraccion": 0.1, "intervalo_ms": 5}) y parada (DELETE) del perfilado"""
+    error = autorizar_admin()
+    if error is not None:
+        return error
+    if request.method == 'POST':
+        cuerpo = request.get_json(silent=True) or {}
+        try:
+            segundos = float(cuerpo.get('segundos', 30))
+            fraccion = float(cuerpo.get('fraccion', 1.0))
+            intervalo_ms = float(cuerpo.get('intervalo_ms', 5))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Datos no válidos: {str(e)}'}), 400
+        if not 0 < segundos <= app.config['PERFILADO_SEGUNDOS_MAX']:
+            return jsonify({'error': f"segundos debe estar entre 0 y {app.config['PERFILADO_SEGUNDOS_MAX']}"}), 400
+        if not 0 < fraccion <= 1:
+            return jsonify({'error': 'fraccion debe estar entre 0 y 1'}), 400
+        if not 1 <= intervalo_ms <= 1000:
+            return jsonify({'error': 'intervalo_ms debe estar entre 1 y 1000'}), 400
+        perfilador.activar(segundos, fraccion, intervalo_ms / 1000)
+    elif request.method == 'DELETE':
+        perfilador.desactivar()
+    return jsonify(perfilador.estado())
+
+def admin_flamegraph():
+    """Último perfil en pilas colapsadas (flamegraph.pl, speedscope, inferno)"""
+    error = autorizar_admin()
+    if error is not None:
+        return error
+    return Response(perfilador.colapsado(), mimetype='text/plain')
+
+if app.config['PERFILADO_TOKEN']:
+    app.add_url_rule('/admin/perfilado', view_func=admin_perfilado, methods=['GET', 'POST', 'DELETE'])
+    app.add_url_rule('/admin/perfilado/flamegraph', view_func=admin_flamegraph)
+
+SUFIJOS_PRECOMPRIMIDOS = {'gzip': '.gz', 'br': '.br', 'zstd': '.zst'}
+
+@app.route('/assets/<path:archivo>')
+def servir_asset(archivo):
+    """Asset con huella: inmutable y, si el cliente la acepta, en su versión precomprimida"""
+    ruta = os.path.join(app.root_path, ASSETS_FOLDER, archivo)
+    disponibles = {c: os.path.isfile(ruta + sufijo) for c, sufijo in SUFIJOS_PRECOMPRIMIDOS.items()}
+    codificacion = negociar_codificacion(request.headers.get('Accept-Encoding', ''), disponibles)
+    respuesta = send_from_directory(ASSETS_FOLDER, archivo + SUFIJOS_PRECOMPRIMIDOS.get(codificacion, ''),
+                                    mimetype=mimetypes.guess_type(archivo)[0] or 'application/octet-stream',
+                                    max_age=app.config['ASSETS_MAX_AGE'])
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    if any(disponibles.values()):
+        respuesta.headers['Vary'] = 'Accept-Encoding'
+    respuesta.headers['Cache-Control'] = f"public, max-age={app.config['ASSETS_MAX_AGE']}, immutable"
+    return respuesta
+
+@app.after_request
+def comprimir_respuesta(response):
+    """Comprime las páginas HTML y respuestas JSON ya generadas si el cliente lo acepta"""
+    if (response.is_streamed or response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('text/html', 'application/json')):
+        return response
+    datos = response.get_data()
+    if len(datos) < app.config['TAMANO_MINIMO_COMPRESION']:
+        return response
+    codificacion = negociar_codificacion(request.headers.get('Accept-Encoding', ''))
+    if codificacion:
+        response.set_data(b''.join(comprimir_stream([datos], codificacion)))
+        response.headers['Content-Encoding'] = codificacion
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 if __name__ == '__main__':
     app.run(debug=True, use_reloader=False)
   
\ No newline at end of file
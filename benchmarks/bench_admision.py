@@ -0,0 +1,112 @@
+"""Prueba de carga: latencia interactiva mientras se procesan lotes grandes.
+
+Levanta la app en un servidor con hilos, lanza clientes que suben CSV grandes a
+/procesar-csv sin parar y mide la latencia de /procesar_evaluacion, con el control
+de admisión desactivado y activado.
+
+Uso: python benchmarks/bench_admision.py [segundos] [clientes_lote] [filas_lote]
+"""
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import app as aplicacion  # noqa: E402
+
+FORMULARIO = {'sg': 1.02, 'al': 1, 'su': 0, 'sc': 1.2, 'bu': 36, 'bgr': 121, 'hemo': 15.4, 'pcv': 44,
+              'wc': 7800, 'rc': 5.2, 'dm': 'No', 'htn': 'Sí', 'ane': 'No', 'appet': 'bueno',
+              'rbc': 'normal', 'pc': 'normal', 'age': 48}
+
+
+def cuerpo_multipart(contenido):
+    limite = uuid.uuid4().hex
+    cuerpo = (f'--{limite}\r\nContent-Disposition: form-data; name="file"; filename="lote.csv"\r\n'
+              f'Content-Type: text/csv\r\n\r\n').encode() + contenido + f'\r\n--{limite}--\r\n'.encode()
+    return cuerpo, f'multipart/form-data; boundary={limite}'
+
+
+def enviar(url, datos, tipo):
+    solicitud = urllib.request.Request(url, data=datos, headers={
+        'Content-Type': tipo,
+        'Idempotency-Key': uuid.uuid4().hex,  # evita aciertos de caché: se mide trabajo real
+        'X-Client-Id': uuid.uuid4().hex,
+    })
+    try:
+        with urllib.request.urlopen(solicitud, timeout=120) as respuesta:
+            respuesta.read()
+            return respuesta.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def escenario(base, segundos, clientes_lote, csv_lote, admision):
+    aplicacion.app.config['ADMISION_ACTIVA'] = admision
+    fin = time.monotonic() + segundos
+    latencias, estados_lote = [], []
+    cuerpo, tipo = cuerpo_multipart(csv_lote)
+    formulario = urllib.parse.urlencode(FORMULARIO).encode()
+
+    def cliente_lote():
+        while time.monotonic() < fin:
+            estados_lote.append(enviar(base + '/procesar-csv', cuerpo, tipo))
+
+    def cliente_interactivo():
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            estado = enviar(base + '/procesar_evaluacion', formulario, 'application/x-www-form-urlencoded')
+            if estado == 200:
+                latencias.append(time.perf_counter() - inicio)
+            time.sleep(0.05)
+
+    hilos = [threading.Thread(target=cliente_lote) for _ in range(clientes_lote)]
+    hilos += [threading.Thread(target=cliente_interactivo) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    lat = np.array(latencias) * 1000
+    rechazos = sum(1 for e in estados_lote if e in (429, 503))
+    print(f"admisión {'activada  ' if admision else 'desactivada'}: interactivo n={len(lat)} "
+          f"p50={np.percentile(lat, 50):.1f} ms p99={np.percentile(lat, 99):.1f} ms | "
+          f"lotes ok={estados_lote.count(200)} rechazados={rechazos}")
+
+
+def main():
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    clientes_lote = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    filas_lote = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+
+    # Sin límite de tasa por cliente: aquí se mide solo el aislamiento entre carriles
+    for limitador in aplicacion.limitadores.values():
+        limitador.tasa, limitador.rafaga = 1e6, 1e6
+
+    ref = aplicacion.dataset_ref[aplicacion.COLUMNAS_MODELO]
+    base = ref.apply(aplicacion.pd.to_numeric, errors='coerce').fillna(aplicacion.medias_ref)
+    csv_lote = base.sample(filas_lote, replace=True, random_state=0).to_csv(index=False).encode()
+
+    # Cada cliente simulado se identifica con X-Client-Id, como detrás de un proxy local
+    aplicacion.app.config['PROXIES_CONFIABLES'] = ['127.0.0.1']
+    servidor = make_server('127.0.0.1', 0, aplicacion.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{servidor.server_port}'
+    try:
+        for admision in (False, True):
+            escenario(url, segundos, clientes_lote, csv_lote, admision)
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
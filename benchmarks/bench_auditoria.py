@@ -0,0 +1,57 @@
+"""Benchmark del sobrecosto de la auditoría de predicciones en la latencia de scoring.
+
+Compara registro_modelos.puntuar sin auditoría y con auditoría (escribiendo en una
+carpeta temporal) para predicciones individuales y lotes de 100k filas.
+
+Uso: python benchmarks/bench_auditoria.py [solicitudes_individuales] [filas_lote]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def latencias(funcion, repeticiones):
+    tiempos = np.empty(repeticiones)
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos[i] = time.perf_counter() - inicio
+    return tiempos * 1e6
+
+
+def main():
+    individuales = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    filas_lote = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    registro = aplicacion.registro_modelos
+    ref = aplicacion.preparar_matriz(aplicacion.dataset_ref)
+    rng = np.random.default_rng(0)
+    fila = ref[:1]
+    lote = ref[rng.integers(0, len(ref), filas_lote)]
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        # Límite holgado: aquí se mide el costo de encolar, no la espera por backpressure
+        auditoria = aplicacion.AuditoriaPredicciones(carpeta, 4_000_000, 5, 1.0, 64 * 1024 * 1024, 3600)
+        auditoria.iniciar()
+        for nombre, sink in (('sin auditoría', None), ('con auditoría', auditoria)):
+            registro.auditoria = sink
+            ind = latencias(lambda: registro.puntuar(fila, b'bench'), individuales)
+            lot = latencias(lambda: registro.puntuar(lote, b'bench'), 20) / 1000
+            print(f"{nombre:<14} individual p50={np.percentile(ind, 50):7.1f} us p99={np.percentile(ind, 99):7.1f} us"
+                  f" | lote {filas_lote:,} p50={np.percentile(lot, 50):7.2f} ms")
+        auditoria.volcar()
+        estado = auditoria.estado()
+        print(f"escritas {estado['filas_escritas']:,} filas en {estado['bloques_escritos']} bloques, "
+              f"{estado['bytes_escritos'] / 1e6:.1f} MB, {estado['segundos_escritura']:.2f} s de escritura en segundo plano")
+    registro.auditoria = None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Benchmark del costo de la calibración por tabla (np.interp) frente al scoring sin calibrar.
+
+Uso: python benchmarks/bench_calibracion.py [tabla.json] [filas]
+     (la tabla se genera con `python entrenar.py --calibracion isotonica|platt`)
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def mejor_tiempo(funcion, repeticiones=5):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    ruta = sys.argv[1] if len(sys.argv) > 1 else 'CKD_LR_hp_calibracion.json'
+    filas = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    calibracion = aplicacion.cargar_calibracion(ruta)
+
+    rng = np.random.default_rng(0)
+    ref = aplicacion.preparar_matriz(aplicacion.dataset_ref)
+    X = ref[rng.integers(0, len(ref), filas)] * rng.normal(1.0, 0.05, (filas, ref.shape[1]))
+
+    t_modelo = mejor_tiempo(lambda: aplicacion.modelo.predict_proba(X))
+    p = aplicacion.modelo.predict_proba(X)[:, 1]
+    t_tabla = mejor_tiempo(lambda: aplicacion.calibrar(p, calibracion))
+
+    print(f"{filas:,} filas, calibración {calibracion['metodo']} ({len(calibracion['x'])} nodos)")
+    print(f"predict_proba:        {t_modelo * 1000:9.2f} ms")
+    print(f"calibración (interp): {t_tabla * 1000:9.2f} ms  (+{100 * t_tabla / t_modelo:.1f} %)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Scoring de a un paciente: formulario, JSON y canal binario sobre conexiones persistentes.
+
+Levanta la aplicación (servidor de desarrollo de werkzeug con HTTP/1.1 keep-alive) y
+servidor_binario.py en procesos aparte y envía pacientes de a uno, siempre sobre la misma
+conexión: formulario a /procesar_evaluacion (página HTML), JSON y tramas binarias a
+/api/puntuar, y tramas por TCP al canal binario, esperando cada respuesta o con varias
+tramas en vuelo (pipelining). Informa solicitudes por segundo y CPU del servidor por
+predicción (de /proc), y la diferencia de probabilidades frente al modelo en float64.
+
+Uso: python benchmarks/bench_canal_binario.py [solicitudes_http] [solicitudes_socket]
+"""
+import http.client
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+from servidor_binario import ClienteBinario  # noqa: E402
+
+PUERTO_HTTP = 8791
+PUERTO_BINARIO = 8792
+EN_VUELO = 64
+
+SERVIDOR_HTTP = f"""
+import logging
+from werkzeug.serving import WSGIRequestHandler
+import app
+app.app.config['ADMISION_ACTIVA'] = False
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+app.app.run(port={PUERTO_HTTP}, threaded=True)
+"""
+
+ENTEROS = {'al', 'su', 'bgr', 'pcv', 'wc', 'age'}
+
+
+def esperar_puerto(puerto, segundos=60):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'El servidor no escucha en el puerto {puerto}')
+
+
+def cpu_proceso(pid):
+    """Segundos de CPU (usuario + sistema) de todos los hilos del proceso"""
+    with open(f'/proc/{pid}/stat') as f:
+        campos = f.read().rsplit(')', 1)[1].split()
+    return (int(campos[11]) + int(campos[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def pacientes(n, rng):
+    """Filas del dataset de referencia imputadas, con las enteras y categóricas redondeadas y
+    'bu' al azar para que ningún formulario se repita (y no lo sirva la caché de idempotencia)"""
+    X = aplicacion.preparar_matriz(aplicacion.dataset_ref)[rng.integers(0, len(aplicacion.dataset_ref), n)]
+    columnas = aplicacion.COLUMNAS_MODELO
+    for j, col in enumerate(columnas):
+        if col in ENTEROS or aplicacion.COLUMNAS_CATEGORICAS[j]:
+            X[:, j] = np.round(X[:, j])
+    X[:, columnas.index('bu')] = np.round(rng.uniform(10, 150, n), 1)
+    return np.clip(X, *aplicacion.LIMITES_MODELO)
+
+
+def formulario(x):
+    datos = dict(zip(aplicacion.COLUMNAS_MODELO, x))
+    campos = {col: (int(v) if col in ENTEROS else float(v)) for col, v in datos.items()
+              if col in aplicacion.RANGOS_VALIDOS}
+    campos.update({col: 'Sí' if datos[col] else 'No' for col in ('dm', 'htn', 'ane')})
+    campos['appet'] = 'pobre' if datos['appet'] else 'bueno'
+    campos.update({col: 'anormal' if datos[col] else 'normal' for col in ('rbc', 'pc')})
+    return urlencode(campos)
+
+
+def medir(pid, n, funcion):
+    cpu, inicio = cpu_proceso(pid), time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+    return n / segundos, (cpu_proceso(pid) - cpu) / n * 1e6, resultado
+
+
+def via_http(X, ruta, cuerpo, tipo, leer):
+    conexion = http.client.HTTPConnection('127.0.0.1', PUERTO_HTTP)
+    salida = []
+    for x in X:
+        conexion.request('POST', ruta, body=cuerpo(x), headers={'Content-Type': tipo})
+        respuesta = conexion.getresponse()
+        datos = respuesta.read()
+        assert respuesta.status == 200, datos[:200]
+        salida.append(leer(datos))
+    conexion.close()
+    return np.array(salida, dtype=np.float64)
+
+
+def via_socket(X, en_vuelo):
+    cliente = ClienteBinario(('127.0.0.1', PUERTO_BINARIO))
+    salida = np.empty(len(X))
+    for i in range(min(en_vuelo, len(X))):
+        cliente.enviar(X[i])
+    for i in range(len(X)):
+        salida[i] = cliente.recibir()[0]
+        if i + en_vuelo < len(X):
+            cliente.enviar(X[i + en_vuelo])
+    cliente.cerrar()
+    return salida
+
+
+def main():
+    n_http = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_socket = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = np.random.default_rng(0)
+    X = pacientes(max(n_http, n_socket), rng)
+    referencia = aplicacion.modelo.predict_proba(X)[:, 1]
+    trama = lambda x: struct.pack('<I', 1) + x.astype('<f4').tobytes()  # noqa: E731
+
+    procesos = [subprocess.Popen([sys.executable, '-W', 'ignore', '-c', SERVIDOR_HTTP],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+                subprocess.Popen([sys.executable, '-W', 'ignore', 'servidor_binario.py', '--puerto', str(PUERTO_BINARIO)],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    try:
+        esperar_puerto(PUERTO_HTTP)
+        esperar_puerto(PUERTO_BINARIO)
+        pid_http, pid_binario = procesos[0].pid, procesos[1].pid
+        Xh = X[:n_http]
+        escenarios = [
+            ('formulario /procesar_evaluacion', pid_http, n_http, lambda: via_http(
+                Xh, '/procesar_evaluacion', formulario, 'application/x-www-form-urlencoded', lambda d: np.nan)),
+            ('JSON /api/puntuar', pid_http, n_http, lambda: via_http(
+                Xh, '/api/puntuar', lambda x: json.dumps({'pacientes': [dict(zip(aplicacion.COLUMNAS_MODELO, x.tolist()))]}),
+                'application/json', lambda d: json.loads(d)['probabilidades'][0])),
+            ('binario /api/puntuar', pid_http, n_http, lambda: via_http(
+                Xh, '/api/puntuar', trama, 'application/octet-stream', lambda d: np.frombuffer(d[4:], '<f4')[0])),
+            ('socket, 1 en vuelo', pid_binario, n_socket, lambda: via_socket(X[:n_socket], 1)),
+            (f'socket, {EN_VUELO} en vuelo', pid_binario, n_socket, lambda: via_socket(X[:n_socket], EN_VUELO)),
+        ]
+        via_socket(X[:200], 1)  # calentamiento
+        via_http(Xh[:50], '/api/puntuar', trama, 'application/octet-stream', lambda d: 0)
+        print(f"Un paciente por solicitud sobre una conexión persistente ({n_http:,} solicitudes HTTP, "
+              f"{n_socket:,} por socket)")
+        for nombre, pid, n, funcion in escenarios:
+            tasa, cpu, p = medir(pid, n, funcion)
+            # La página del formulario solo muestra un porcentaje entero: no se compara
+            diferencia = '' if np.isnan(p).all() else f"  dif. máx. {np.max(np.abs(p - referencia[:n])):.1e}"
+            print(f"  {nombre:<33} {tasa:9,.0f} solicitudes/s  {cpu:7.0f} µs de CPU del servidor por predicción"
+                  + diferencia)
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+            proceso.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Carga por fragmentos de un CSV de varios GB: throughput, memoria y reanudación.
+
+Arma un CSV periódico a partir de las filas de kidney_disease.csv (sin escribirlo a
+disco), lo sube a /api/cargas en fragmentos de tamaño fijo que cortan líneas a la
+mitad, simula una caída del proceso a mitad de la subida (se pierde el estado en
+memoria y se reanuda con GET /api/cargas/<id>) y un fragmento corrupto. Informa el
+throughput, cuántas filas ya estaban puntuadas al terminar de subir, cuánto tarda
+completar y el pico de memoria residente, que no debe crecer con el tamaño del archivo.
+
+Uso: python benchmarks/bench_cargas.py [gigabytes] [mb_por_fragmento]
+"""
+import hashlib
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def pico_memoria_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class CsvPeriodico:
+    """Fragmentos de un CSV infinito: la cabecera y luego las filas de referencia repetidas"""
+
+    def __init__(self, ruta, tamano_fragmento):
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+        fin_cabecera = contenido.index(b'\n') + 1
+        self.cabecera, self.cuerpo = contenido[:fin_cabecera], contenido[fin_cabecera:]
+        self.tamano = tamano_fragmento
+        self.repetido = self.cuerpo * (tamano_fragmento // len(self.cuerpo) + 2)
+        self.filas_por_periodo = self.cuerpo.count(b'\n')
+
+    def fragmento(self, numero, total_bytes):
+        inicio = numero * self.tamano
+        fin = min(inicio + self.tamano, total_bytes)
+        if inicio < len(self.cabecera):
+            return (self.cabecera + self.repetido)[inicio:fin]
+        desde = (inicio - len(self.cabecera)) % len(self.cuerpo)
+        return self.repetido[desde:desde + fin - inicio]
+
+    def filas(self, total_bytes):
+        completos, resto = divmod(total_bytes - len(self.cabecera), len(self.cuerpo))
+        parcial = self.cuerpo[:resto]
+        return completos * self.filas_por_periodo + parcial.count(b'\n') + (1 if parcial and not parcial.endswith(b'\n') else 0)
+
+
+def subir(cliente, id_carga, fuente, numero, total_bytes):
+    datos = fuente.fragmento(numero, total_bytes)
+    respuesta = cliente.put(f'/api/cargas/{id_carga}/fragmentos/{numero}', data=datos,
+                            headers={'X-Checksum-Sha256': hashlib.sha256(datos).hexdigest()})
+    if respuesta.status_code != 200:
+        raise RuntimeError(f'Fragmento {numero}: {respuesta.status_code} {respuesta.get_json()}')
+    return len(datos)
+
+
+def main():
+    gigabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    mb_fragmento = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    cliente = aplicacion.app.test_client()
+    fuente = CsvPeriodico(aplicacion.DATASET_REF_PATH, int(mb_fragmento * 1024 * 1024))
+    total_bytes = int(gigabytes * 1024 ** 3)
+    total_fragmentos = -(-total_bytes // fuente.tamano)
+
+    limite = aplicacion.app.config['MAX_CONTENT_LENGTH']
+    respuesta = cliente.post('/api/procesar-csv', data={'file': (fuente.fragmento(0, limite + 1), 'grande.csv')},
+                             content_type='multipart/form-data')
+    print(f"/api/procesar-csv con {(limite + 1) / 1e6:.1f} MB: HTTP {respuesta.status_code} "
+          f"({respuesta.get_json()['error']})")
+
+    id_carga = cliente.post('/api/cargas', json={'nombre': 'grande.csv'}).get_json()['id']
+    print(f"Carga {id_carga}: {total_bytes / 1e9:.2f} GB en {total_fragmentos} fragmentos de {mb_fragmento:g} MiB")
+    memoria_inicial = memoria_10 = pico_memoria_mb()
+    inicio = time.perf_counter()
+    caida = total_fragmentos // 2
+    enviados = 0
+    for numero in range(caida):
+        enviados += subir(cliente, id_carga, fuente, numero, total_bytes)
+        if numero == max(total_fragmentos // 10, 1):
+            memoria_10 = pico_memoria_mb()
+
+    # Caída del proceso: se pierde el estado en memoria y el cliente pregunta qué falta
+    aplicacion.almacen_cargas._cargas.clear()
+    estado = cliente.get(f'/api/cargas/{id_carga}').get_json()
+    recibidos = {n for a, b in estado['fragmentos_recibidos'] for n in range(a, b + 1)}
+    print(f"Reanudación tras la caída: {len(recibidos)} fragmentos ya recibidos, "
+          f"{estado['filas_puntuadas']:,} filas ya puntuadas")
+    corrupto = fuente.fragmento(caida, total_bytes)
+    respuesta = cliente.put(f'/api/cargas/{id_carga}/fragmentos/{caida}', data=corrupto[:-1] + b'#',
+                            headers={'X-Checksum-Sha256': hashlib.sha256(corrupto).hexdigest()})
+    print(f"Fragmento corrupto: HTTP {respuesta.status_code} ({respuesta.get_json()['error'][:60]}...)")
+    for numero in range(total_fragmentos):
+        if numero not in recibidos:
+            enviados += subir(cliente, id_carga, fuente, numero, total_bytes)
+    segundos_subida = time.perf_counter() - inicio
+    puntuadas_al_subir = cliente.get(f'/api/cargas/{id_carga}').get_json()['filas_puntuadas']
+
+    inicio_completar = time.perf_counter()
+    estado = cliente.post(f'/api/cargas/{id_carga}/completar', json={'total_fragmentos': total_fragmentos}).get_json()
+    segundos_completar = time.perf_counter() - inicio_completar
+    bytes_resultados = sum(len(b) for b in cliente.get(f'/api/cargas/{id_carga}/resultados').response)
+    filas = fuente.filas(total_bytes)
+
+    print(f"Subida y scoring: {segundos_subida:.1f} s, {enviados / segundos_subida / 1e6:.1f} MB/s, "
+          f"{estado['filas_puntuadas'] / segundos_subida / 1e6:.2f} M filas/s")
+    print(f"Filas puntuadas al terminar de subir: {puntuadas_al_subir:,} de {estado['filas_puntuadas']:,} "
+          f"({100 * puntuadas_al_subir / max(estado['filas_puntuadas'], 1):.2f} %); completar: {segundos_completar:.3f} s")
+    print(f"Resultado: completada={estado['completada']} error={estado['error']} "
+          f"filas={estado['filas_puntuadas']:,} (esperadas {filas:,}), resultados {bytes_resultados / 1e6:,.0f} MB")
+    print(f"Pico de memoria residente: {memoria_inicial:.0f} MB al empezar, {memoria_10:.0f} MB al 10 %, "
+          f"{pico_memoria_mb():.0f} MB al terminar")
+    cliente.delete(f'/api/cargas/{id_carga}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Historial de pacientes con millones de predicciones: escritura en lotes y latencia de consultas.
+
+Llena una base SQLite temporal con predicciones sintéticas (paneles repartidos en tres
+años, en orden cronológico y en lotes del tamaño de un CSV), con el mismo
+HistorialPacientes que usa la aplicación, y mide con el cliente de pruebas de Flask
+las consultas por paciente y el ranking de mayor riesgo para varias ventanas.
+
+Uso: python benchmarks/bench_historial.py [predicciones] [pacientes]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+ANOS = 3
+FILAS_POR_CARGA = 10_000
+
+
+def latencias(cliente, urls):
+    tiempos = np.empty(len(urls))
+    for i, url in enumerate(urls):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url)
+        tiempos[i] = time.perf_counter() - inicio
+        assert respuesta.status_code == 200, respuesta.get_json()
+    return tiempos * 1000
+
+
+def llenar(historial, predicciones, pacientes, rng):
+    fin = time.time()
+    inicio_periodo = fin - ANOS * 365 * 86400
+    inicio = time.perf_counter()
+    for desde in range(0, predicciones, FILAS_POR_CARGA):
+        filas = min(FILAS_POR_CARGA, predicciones - desde)
+        ts = np.sort(rng.uniform(inicio_periodo + (fin - inicio_periodo) * desde / predicciones,
+                                 inicio_periodo + (fin - inicio_periodo) * (desde + filas) / predicciones, filas))
+        historial.registrar(rng.integers(0, pacientes, filas).astype(str), ts, rng.beta(0.5, 1.5, filas),
+                            'lr:hp', 'procesar_csv')
+        if desde and desde % (predicciones // 10) < FILAS_POR_CARGA:
+            print(f"  {desde:>12,} filas  {desde / (time.perf_counter() - inicio):9,.0f} filas/s", flush=True)
+    historial.volcar()
+    return time.perf_counter() - inicio
+
+
+def main():
+    predicciones = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    pacientes = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    carpeta = tempfile.mkdtemp(prefix='historial-')
+    rng = np.random.default_rng(0)
+    try:
+        historial = aplicacion.HistorialPacientes(os.path.join(carpeta, 'historial.sqlite3'), 1.0,
+                                                  aplicacion.app.config['HISTORIAL_MAX_FILAS_PENDIENTES'])
+        historial.iniciar()
+        aplicacion.historial_pacientes = historial
+
+        print(f"Escritura de {predicciones:,} predicciones de {pacientes:,} pacientes en cargas de {FILAS_POR_CARGA:,}")
+        segundos = llenar(historial, predicciones, pacientes, rng)
+        tamano = sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta))
+        estado = historial.estado()
+        print(f"  {predicciones / segundos:,.0f} filas/s de punta a punta, {estado['lotes_escritos']} transacciones, "
+              f"{tamano / 1e6:,.0f} MB en disco ({tamano / predicciones:.0f} B por predicción)")
+
+        cliente = aplicacion.app.test_client()
+        ids = rng.integers(0, pacientes, 2000).astype(str)
+        latencias(cliente, [f'/api/pacientes/{p}/historial' for p in ids[:100]])  # calentamiento
+        consultas = [
+            ('historial completo', [f'/api/pacientes/{p}/historial' for p in ids]),
+            ('historial último año', [f'/api/pacientes/{p}/historial?desde={time.strftime("%Y-%m-%d", time.gmtime(time.time() - 365 * 86400))}'
+                                      for p in ids]),
+        ]
+        for dias in (0.01, 0.1, 1, 7, 30, 365):
+            consultas.append((f'riesgo alto {dias:g} días', [f'/api/pacientes/riesgo-alto?dias={dias}&limite=50'] * 50))
+        print("Latencia por consulta (cliente de pruebas, incluye Flask y JSON)")
+        for nombre, urls in consultas:
+            lat = latencias(cliente, urls)
+            print(f"  {nombre:<22} p50={np.percentile(lat, 50):7.2f} ms  p99={np.percentile(lat, 99):7.2f} ms")
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Informes por paciente de un lote de 10k pacientes: informes por segundo según el número de procesos.
+
+Sube a /procesar-csv un lote armado remuestreando las filas de kidney_disease.csv (con
+'id' propio) y descarga /informes/<hash>.zip con los pacientes de alto riesgo y con
+todos, en proceso y con un pool de procesos. Cada configuración se mide después de una
+descarga de calentamiento, así que no incluye el arranque del pool. Informa informes por
+segundo (cada uno es un HTML y un PDF), el tamaño del zip, cuánto tarda armar los datos
+de los pacientes y la CPU que queda en el proceso de la solicitud (armar los datos,
+enviar las tareas y escribir el zip): ese es el techo del pool con más núcleos.
+
+Uso: python benchmarks/bench_informes.py [pacientes] [procesos ...]
+"""
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app se importa dentro de main(): los procesos del pool (spawn) vuelven a ejecutar este
+# módulo y así no cargan los modelos
+aplicacion = None
+
+
+def lote(pacientes):
+    df = aplicacion.dataset_ref.sample(pacientes, replace=True, random_state=0).reset_index(drop=True)
+    df['id'] = [f'P{i:06d}' for i in range(pacientes)]
+    return df.to_csv(index=False, sep=';').encode()
+
+
+def descargar(cliente, url):
+    """(segundos, CPU de este proceso en segundos, zip)"""
+    inicio, cpu = time.perf_counter(), time.process_time()
+    respuesta = cliente.get(url)
+    datos = respuesta.get_data()
+    segundos, cpu = time.perf_counter() - inicio, time.process_time() - cpu
+    assert respuesta.status_code == 200, datos[:200]
+    return segundos, cpu, datos
+
+
+def main():
+    global aplicacion
+    import app as aplicacion
+    pacientes = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    configuraciones = [int(p) for p in sys.argv[2:]] or sorted({1, 2, os.cpu_count() or 1})
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    cliente = aplicacion.app.test_client()
+    contenido = lote(pacientes)
+    respuesta = cliente.post('/procesar-csv', data={'file': (io.BytesIO(contenido), 'lote.csv')},
+                             content_type='multipart/form-data')
+    hash_lote = re.search(rb'/informes/([0-9a-f]+)\.zip', respuesta.data).group(1).decode()
+    df, probabilidades, _ = aplicacion.cache_lotes[hash_lote]
+    print(f"Lote de {pacientes:,} pacientes ({int((probabilidades > 0.5).sum()):,} de alto riesgo), "
+          f"{os.cpu_count()} CPU")
+
+    for todos in (False, True):
+        inicio = time.perf_counter()
+        n = len(aplicacion.pacientes_informe(df, probabilidades, todos))
+        preparacion = time.perf_counter() - inicio
+        url = f'/informes/{hash_lote}.zip' + ('?todos=1' if todos else '')
+        print(f"{'Todos los pacientes' if todos else 'Alto riesgo'}: {n:,} informes "
+              f"(datos de los pacientes: {preparacion:.2f} s)")
+        for procesos in configuraciones:
+            aplicacion.app.config['INFORMES_PROCESOS'] = procesos
+            descargar(cliente, url)  # calentamiento: arranque del pool
+            segundos, cpu, datos = descargar(cliente, url)
+            archivos = len(zipfile.ZipFile(io.BytesIO(datos)).namelist())
+            assert archivos == 2 * n, archivos
+            print(f"  {procesos} proceso{'s' if procesos > 1 else ' '} {n / segundos:8,.0f} informes/s  "
+                  f"{segundos:6.2f} s  zip {len(datos) / 1e6:6.1f} MB  "
+                  f"CPU del proceso de la solicitud {cpu:5.2f} s (techo {n / cpu:7,.0f} informes/s)")
+
+
+if __name__ == '__main__':
+    main()
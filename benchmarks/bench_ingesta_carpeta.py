@@ -0,0 +1,176 @@
+"""Ingesta por carpeta: latencia desde que se deja el archivo hasta que aparece el resultado, throughput y reinicios.
+
+Levanta ingesta_carpeta.py sobre una carpeta temporal (con inotify y con sondeo) y mide:
+- latencia de archivos chicos dejados de a uno con escritura a .tmp y rename,
+- throughput con muchos archivos dejados de golpe,
+- un archivo grande escrito de a poco directo en entrada/ (durante 1,5 veces lo que tarda
+  puntuarlo dejado de una vez): cuánto tarda el resultado después del cierre,
+- exactamente una vez: mata el proceso con SIGKILL a mitad del lote, lo reinicia y
+  comprueba que cada entrada tiene un único resultado, idéntico al de puntuar el
+  archivo completo.
+Las filas se arman repitiendo kidney_disease.csv.
+
+Uso: python benchmarks/bench_ingesta_carpeta.py [archivos] [filas_por_archivo]
+"""
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+with open(aplicacion.DATASET_REF_PATH, 'rb') as f:
+    CABECERA, CUERPO = f.read().split(b'\n', 1)
+FILAS_CUERPO = CUERPO.count(b'\n')
+
+
+def csv_con_filas(filas):
+    return CABECERA + b'\n' + CUERPO * (filas // FILAS_CUERPO)
+
+
+def esperado(datos):
+    return b''.join(aplicacion.bloques_resultados_csv(aplicacion.leer_csv(datos), 10 ** 9, b''))
+
+
+class Daemon:
+    def __init__(self, carpeta, *opciones):
+        self.carpeta = carpeta
+        self.opciones = opciones
+        self.proceso = None
+
+    def iniciar(self):
+        self.proceso = subprocess.Popen([sys.executable, '-W', 'ignore', 'ingesta_carpeta.py', '--carpeta', self.carpeta,
+                                         *self.opciones], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Listo cuando reclama un archivo de prueba
+        while not os.path.isdir(os.path.join(self.carpeta, 'entrada')):
+            time.sleep(0.05)
+        self.dejar('listo.csv', csv_con_filas(FILAS_CUERPO))
+        self.esperar(['listo.resultados.csv'], 60)
+        os.remove(os.path.join(self.carpeta, 'salida', 'listo.resultados.csv'))
+
+    def detener(self, senal=signal.SIGTERM):
+        self.proceso.send_signal(senal)
+        self.proceso.wait()
+
+    def dejar(self, nombre, datos):
+        """Escribe a un .tmp y renombra, como haría un middleware cuidadoso; devuelve el instante del rename"""
+        temporal = os.path.join(self.carpeta, 'entrada', nombre + '.tmp')
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        instante = time.perf_counter()
+        os.rename(temporal, os.path.join(self.carpeta, 'entrada', nombre))
+        return instante
+
+    def esperar(self, nombres, limite=600):
+        """Instante en que aparece cada resultado"""
+        pendientes, instantes, fin = set(nombres), {}, time.time() + limite
+        while pendientes and time.time() < fin:
+            for nombre in list(pendientes):
+                if os.path.exists(os.path.join(self.carpeta, 'salida', nombre)):
+                    instantes[nombre] = time.perf_counter()
+                    pendientes.discard(nombre)
+            time.sleep(0.002)
+        if pendientes:
+            raise RuntimeError(f'Sin resultado para {sorted(pendientes)}')
+        return instantes
+
+
+def latencia(daemon, archivos):
+    datos = csv_con_filas(FILAS_CUERPO)
+    latencias = []
+    for i in range(archivos):
+        instante = daemon.dejar(f'chico{i}.csv', datos)
+        latencias.append(daemon.esperar([f'chico{i}.resultados.csv'])[f'chico{i}.resultados.csv'] - instante)
+        time.sleep(0.02)
+    return np.array(latencias) * 1000
+
+
+def throughput(daemon, archivos, filas):
+    datos = csv_con_filas(filas)
+    inicio = time.perf_counter()
+    drops = {f'lote{i}.resultados.csv': daemon.dejar(f'lote{i}.csv', datos) for i in range(archivos)}
+    llegadas = daemon.esperar(drops)
+    segundos = max(llegadas.values()) - inicio
+    latencias = np.array([llegadas[n] - drops[n] for n in drops])
+    return archivos * (filas // FILAS_CUERPO) * FILAS_CUERPO / segundos, len(datos) * archivos / segundos, latencias
+
+
+def cola_archivo(daemon, filas, segundos, bytes_por_escritura=64 * 1024):
+    """(segundos escribiendo, latencia tras el cierre) de un archivo escrito de a poco en entrada/
+    a ritmo constante durante unos segundos dados"""
+    datos = csv_con_filas(filas)
+    escrituras = -(-len(datos) // bytes_por_escritura)
+    inicio = time.perf_counter()
+    with open(os.path.join(daemon.carpeta, 'entrada', 'grande.csv'), 'wb') as f:
+        for i in range(escrituras):
+            f.write(datos[i * bytes_por_escritura:(i + 1) * bytes_por_escritura])
+            f.flush()
+            time.sleep(max(0.0, inicio + segundos * (i + 1) / escrituras - time.perf_counter()))
+        cierre = time.perf_counter()
+    llegada = daemon.esperar(['grande.resultados.csv'])['grande.resultados.csv']
+    return cierre - inicio, llegada - cierre
+
+
+def exactamente_una_vez(carpeta, archivos, filas):
+    daemon = Daemon(carpeta)
+    daemon.iniciar()
+    contenidos = {f'crash{i}.csv': csv_con_filas(filas * (1 + i % 3)) for i in range(archivos)}
+    for nombre, datos in contenidos.items():
+        daemon.dejar(nombre, datos)
+    time.sleep(1.0)
+    daemon.detener(signal.SIGKILL)
+    a_medias = sum(1 for n in os.listdir(os.path.join(carpeta, 'procesando')) if n.endswith('.~estado'))
+    listos = sum(1 for n in contenidos if os.path.exists(os.path.join(carpeta, 'salida', n[:-4] + '.resultados.csv')))
+    daemon.iniciar()
+    daemon.esperar([n[:-4] + '.resultados.csv' for n in contenidos])
+    daemon.detener()
+    resultados = [n for n in os.listdir(os.path.join(carpeta, 'salida')) if n.startswith('crash')]
+    correctos = sum(open(os.path.join(carpeta, 'salida', n[:-4] + '.resultados.csv'), 'rb').read() == esperado(d)
+                    for n, d in contenidos.items())
+    return listos, a_medias, len(resultados), correctos
+
+
+def main():
+    archivos = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    filas = int(sys.argv[2]) if len(sys.argv) > 2 else 25_000
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    raiz = tempfile.mkdtemp(prefix='bandeja-')
+    try:
+        for modo, opciones in (('inotify', ()), ('sondeo', ('--sondeo',))):
+            carpeta = os.path.join(raiz, modo)
+            daemon = Daemon(carpeta, *opciones)
+            daemon.iniciar()
+            try:
+                print(f"{modo} (quietud 2 s, intervalo 0.25 s, 2 hilos)")
+                lat = latencia(daemon, 50)
+                print(f"  archivo de {FILAS_CUERPO} filas dejado con rename: latencia p50={np.percentile(lat, 50):7.1f} ms"
+                      f"  p99={np.percentile(lat, 99):7.1f} ms")
+                filas_s, bytes_s, lat = throughput(daemon, archivos, filas)
+                print(f"  {archivos} archivos de {filas:,} filas de golpe: {filas_s:,.0f} filas/s ({bytes_s / 1e6:.1f} MB/s),"
+                      f" latencia por archivo p50={np.percentile(lat, 50):.2f} s  máx={lat.max():.2f} s")
+                filas_grande = archivos * filas // 4
+                instante = daemon.dejar('completo.csv', csv_con_filas(filas_grande))
+                de_una_vez = daemon.esperar(['completo.resultados.csv'])['completo.resultados.csv'] - instante
+                escribiendo, tras_cierre = cola_archivo(daemon, filas_grande, 1.5 * de_una_vez)
+                print(f"  archivo de {filas_grande:,} filas: dejado de una vez {de_una_vez:.2f} s hasta el resultado; "
+                      f"escrito de a poco en {escribiendo:.2f} s, resultado {tras_cierre * 1000:.0f} ms después del cierre")
+            finally:
+                daemon.detener()
+
+        listos, a_medias, resultados, correctos = exactamente_una_vez(os.path.join(raiz, 'reinicio'), 12, filas)
+        print(f"SIGKILL a mitad de 12 archivos: {listos} ya publicados, {a_medias} a medias en procesando/; "
+              f"tras reiniciar, {resultados} resultados, {correctos} idénticos a puntuar el archivo completo")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Intervalos de incertidumbre por ensamble bootstrap: latencia agregada sobre lotes de 1M filas.
+
+Ajusta el ensamble como `python entrenar.py --bootstrap B` (réplicas de CKD_LR_hp.pkl sobre
+remuestreos de kidney_disease.csv) y mide, para cada B:
+- el ajuste fuera de línea,
+- intervalos_bootstrap (un producto X @ W y un sort por bloque) sobre el lote, frente
+  al scoring solo, y la diferencia con np.percentile en float64,
+- la alternativa de recorrer las réplicas de a una y tomar np.percentile (sobre una parte
+  del lote, porque materializa B x filas probabilidades),
+- el costo para una sola fila (evaluación individual),
+- el tamaño de bloque de la matriz de logits (INTERVALOS_BLOQUE_BYTES).
+
+Uso: python benchmarks/bench_intervalos.py [filas] [B ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.special import expit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+import entrenar  # noqa: E402
+
+NIVEL = 0.90
+FILAS_RECORRIDO = 100_000
+
+
+def mejor_tiempo(funcion, repeticiones=3):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def recorrer_replicas(X, coeficientes, interceptos):
+    """Una réplica a la vez y np.percentile sobre la matriz B x filas de probabilidades"""
+    P = np.empty((len(interceptos), len(X)))
+    for i, (w, b) in enumerate(zip(coeficientes, interceptos)):
+        P[i] = expit(X @ w + b)
+    return np.percentile(P, [100 * (1 - NIVEL) / 2, 100 * (1 + NIVEL) / 2], axis=0).T
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tamanos = [int(b) for b in sys.argv[2:]] or [100, 1000]
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+
+    rng = np.random.default_rng(0)
+    ref = aplicacion.preparar_matriz(aplicacion.dataset_ref)
+    X = ref[rng.integers(0, len(ref), filas)] * rng.normal(1.0, 0.05, (filas, ref.shape[1]))
+    X_datos, y = entrenar.cargar_datos(aplicacion.DATASET_REF_PATH, 0)
+    X_imputada = entrenar.imputar_medias(X_datos)
+
+    compilado = aplicacion.registro_modelos.principal()['estimador_float32']
+    t_modelo = mejor_tiempo(lambda: aplicacion.modelo.predict_proba(X))
+    t_compilado = mejor_tiempo(lambda: compilado.predict_proba(X))
+    print(f"{filas:,} filas, intervalo del {NIVEL:.0%}, {os.cpu_count()} CPU")
+    print(f"  scoring solo: predict_proba {t_modelo * 1000:7.1f} ms, compilado float32 {t_compilado * 1000:7.1f} ms")
+
+    for replicas in tamanos:
+        inicio = time.perf_counter()
+        coeficientes, interceptos = entrenar.ajustar_bootstrap(aplicacion.modelo, X_imputada, y.to_numpy(),
+                                                               replicas, 42, -1)
+        ajuste = time.perf_counter() - inicio
+        ensamble = {'W': np.ascontiguousarray(coeficientes.T, dtype=np.float32), 'b': interceptos.astype(np.float32)}
+
+        t_intervalos = mejor_tiempo(lambda: aplicacion.intervalos_bootstrap(X, ensamble, NIVEL))
+        intervalos = aplicacion.intervalos_bootstrap(X, ensamble, NIVEL)
+        parte = X[:FILAS_RECORRIDO]
+        t_recorrido = mejor_tiempo(lambda: recorrer_replicas(parte, coeficientes, interceptos), 1)
+        diferencia = np.abs(intervalos[:FILAS_RECORRIDO] - recorrer_replicas(parte, coeficientes, interceptos)).max()
+        una_fila = X[:1]
+        t_fila = min(mejor_tiempo(lambda: aplicacion.intervalos_bootstrap(una_fila, ensamble, NIVEL), 1)
+                     for _ in range(200))
+
+        print(f"B={replicas}: ajuste fuera de línea {ajuste:.1f} s, ancho medio {np.mean(intervalos[:, 1] - intervalos[:, 0]):.3f}")
+        print(f"  intervalos {t_intervalos * 1000:8.1f} ms (+{t_intervalos / t_modelo:.1f}x el scoring; "
+              f"{t_intervalos / filas / replicas * 1e9:.2f} ns por fila y réplica, {filas / t_intervalos:,.0f} filas/s)")
+        print(f"  réplica por réplica + np.percentile: {FILAS_RECORRIDO / t_recorrido:,.0f} filas/s "
+              f"({t_recorrido / t_intervalos * filas / FILAS_RECORRIDO:.1f}x más lento); dif. máx. {diferencia:.1e}")
+        print(f"  una fila: {t_fila * 1e6:.0f} µs")
+        for bloque in (256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024):
+            t_bloque = mejor_tiempo(lambda: aplicacion.intervalos_bootstrap(X, ensamble, NIVEL, bloque), 2)
+            print(f"    bloque de {bloque // 1024:6,} KB ({max(1, bloque // (4 * replicas)):7,} filas): {t_bloque * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark del costo de puntuar en sombra un segundo modelo sobre el mismo lote.
+
+El preprocesamiento (preparar_matriz) se hace una vez; se compara el scoring
+solo con el modelo principal contra principal + retador en sombra. El retador
+puntúa en el hilo de sombra: se informa lo que agrega a la solicitud y, aparte,
+lo que tarda fuera de ella.
+
+Uso: python benchmarks/bench_modelos.py [filas] [repeticiones]
+"""
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def mejor_tiempo(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    registro = aplicacion.registro_modelos
+
+    # Retador: copia del modelo principal con coeficientes perturbados
+    retador = copy.deepcopy(aplicacion.modelo)
+    rng = np.random.default_rng(0)
+    retador.steps[-1][1].coef_ = retador.steps[-1][1].coef_ * rng.normal(1.0, 0.1, retador.steps[-1][1].coef_.shape)
+    registro.registrar('retador', 'bench', retador, 0)
+
+    ref = aplicacion.dataset_ref
+    df = ref.iloc[rng.integers(0, len(ref), filas)].reset_index(drop=True)
+
+    t_prep = mejor_tiempo(lambda: aplicacion.preparar_matriz(df), repeticiones)
+    X = aplicacion.preparar_matriz(df)
+
+    registro.sombra = None
+    t_principal = mejor_tiempo(lambda: registro.puntuar(X), repeticiones)
+    registro.sombra = 'retador'
+    t_sombra = mejor_tiempo(lambda: (registro.puntuar(X), registro.esperar_sombra()), repeticiones)
+    t_solicitud = mejor_tiempo(lambda: registro.puntuar(X), repeticiones)
+    registro.esperar_sombra()
+    metricas = registro.modelos['retador']['metricas']
+
+    print(f"{filas} filas, mejor de {repeticiones}")
+    print(f"preprocesamiento compartido: {t_prep * 1000:8.2f} ms")
+    print(f"solo principal:              {t_principal * 1000:8.2f} ms")
+    print(f"principal + sombra:          {t_sombra * 1000:8.2f} ms "
+          f"(+{(t_sombra - t_principal) * 1000:.2f} ms por el retador, esperando al hilo de sombra)")
+    print(f"solicitud con sombra:        {t_solicitud * 1000:8.2f} ms "
+          f"(+{(t_solicitud - t_principal) * 1000:.2f} ms; el retador tarda "
+          f"{metricas['segundos_sombra'] / metricas['lotes_sombra'] * 1000:.2f} ms por lote fuera de la solicitud)")
+    print(f"acuerdo principal/retador:   {metricas['acuerdo_sombra']:.4f}"
+          f" ({metricas['lotes_sombra_descartados']} lotes descartados por cola llena)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Peso de las páginas en la primera visita y en una visita repetida.
+
+Pide cada página con Accept-Encoding como un navegador, descarga los CSS e imágenes
+locales que enlaza (en un <picture>, la primera fuente WebP) y simula la visita
+repetida: los recursos con Cache-Control max-age vigente no se vuelven a pedir y
+el resto se revalida con If-None-Match / If-Modified-Since.
+
+Uso: python benchmarks/bench_paginas.py [accept_encoding]
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+PAGINAS = ['/', '/evaluar', '/dataset-info', '/subir-csv']
+
+
+def recursos(html):
+    """URLs locales que un navegador descargaría al mostrar la página"""
+    urls = re.findall(r'<link rel="stylesheet" href="(/[^"]+)"', html)
+    for picture in re.findall(r'<picture>(.*?)</picture>', html, re.S):
+        fuente = re.search(r'<source[^>]*type="image/webp"[^>]*srcset="(/[^" ]+)', picture)
+        urls.append(fuente.group(1) if fuente else re.search(r'<img[^>]*src="(/[^"]+)"', picture).group(1))
+    sin_picture = re.sub(r'<picture>.*?</picture>', '', html, flags=re.S)
+    urls += re.findall(r'<img[^>]*src="(/[^"]+)"', sin_picture)
+    return urls
+
+
+def en_cache(respuesta):
+    return (respuesta.cache_control.max_age or 0) > 0 and not respuesta.cache_control.no_cache
+
+
+def visita(cliente, pagina, encabezados, cache):
+    """(bytes, solicitudes) de una visita; `cache` guarda las respuestas de la visita anterior"""
+    total, solicitudes = len(cliente.get(pagina, headers=encabezados).data), 1
+    # Se vuelve a pedir sin compresión solo para leer los enlaces; no cuenta en el peso
+    for url in recursos(cliente.get(pagina).get_data(as_text=True)):
+        previa = cache.get(url)
+        if previa is not None and en_cache(previa):
+            continue
+        condicionales = dict(encabezados)
+        if previa is not None:
+            if previa.headers.get('ETag'):
+                condicionales['If-None-Match'] = previa.headers['ETag']
+            if previa.headers.get('Last-Modified'):
+                condicionales['If-Modified-Since'] = previa.headers['Last-Modified']
+        respuesta = cliente.get(url, headers=condicionales)
+        total += len(respuesta.data)
+        solicitudes += 1
+        if respuesta.status_code == 200:
+            cache[url] = respuesta
+    return total, solicitudes
+
+
+def main():
+    accept_encoding = sys.argv[1] if len(sys.argv) > 1 else 'gzip, deflate, br'
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    cliente = aplicacion.app.test_client()
+    encabezados = {'Accept-Encoding': accept_encoding}
+    totales = [0, 0]
+    for pagina in PAGINAS:
+        cache = {}
+        primera = visita(cliente, pagina, encabezados, cache)
+        repetida = visita(cliente, pagina, encabezados, cache)
+        totales[0] += primera[0]
+        totales[1] += repetida[0]
+        print(f"{pagina:<14} primera visita {primera[0]:>9,} B en {primera[1]} solicitudes | "
+              f"visita repetida {repetida[0]:>9,} B en {repetida[1]} solicitudes")
+    print(f"{'total':<14} primera visita {totales[0]:>9,} B                | visita repetida {totales[1]:>9,} B")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Sobrecosto del perfilado en /procesar_evaluacion: desactivado, activo sin muestrear y muestreando.
+
+Uso: python benchmarks/bench_perfilado.py [solicitudes]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+FORMULARIO = {'sg': 1.02, 'al': 1, 'su': 0, 'sc': 1.2, 'bu': 36, 'bgr': 121, 'hemo': 15.4, 'pcv': 44,
+              'wc': 7800, 'rc': 5.2, 'dm': 'No', 'htn': 'Sí', 'ane': 'No', 'appet': 'bueno',
+              'rbc': 'normal', 'pc': 'normal', 'age': 48}
+
+
+def latencias(cliente, solicitudes, desde):
+    tiempos = np.empty(solicitudes)
+    for i in range(solicitudes):
+        # wc distinto en cada solicitud: sin aciertos de idempotencia
+        formulario = dict(FORMULARIO, wc=2000 + (desde + i) % 28000)
+        inicio = time.perf_counter()
+        cliente.post('/procesar_evaluacion', data=formulario)
+        tiempos[i] = time.perf_counter() - inicio
+    return tiempos * 1000
+
+
+def main():
+    solicitudes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    aplicacion.app.config['ADMISION_ACTIVA'] = False
+    cliente = aplicacion.app.test_client()
+    perfilador = aplicacion.perfilador
+    latencias(cliente, 200, 0)  # calentamiento
+
+    repeticiones = 1_000_000
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        with aplicacion.tramo('x'):
+            pass
+    print(f"tramo() con el perfilado desactivado: {(time.perf_counter() - inicio) / repeticiones * 1e9:.0f} ns")
+
+    escenarios = [('desactivado', None), ('activo, fracción 0.01', 0.01), ('activo, fracción 1', 1.0)]
+    for n, (nombre, fraccion) in enumerate(escenarios):
+        if fraccion is not None:
+            perfilador.activar(600, fraccion, 0.005)
+        lat = latencias(cliente, solicitudes, 200 + n * solicitudes)
+        perfilador.desactivar()
+        print(f"{nombre:<22} p50={np.percentile(lat, 50):6.2f} ms  p99={np.percentile(lat, 99):6.2f} ms"
+              f"  media={lat.mean():6.2f} ms  muestras={perfilador.muestras}")
+
+
+if __name__ == '__main__':
+    main()
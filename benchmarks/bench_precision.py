@@ -0,0 +1,129 @@
+"""Paridad, throughput y memoria del scoring en precisión reducida.
+
+Regresión logística: sklearn en float64 frente a ModeloLinealCompilado en float64 y
+float32. Stacking (si se pasan los modelos base de entrenar.py): modelos base en
+float32 frente a int8 con el mismo meta-modelo. La paridad se mide sobre
+kidney_disease.csv y sobre datos sintéticos (remuestreo del dataset con ruido).
+
+Uso: python benchmarks/bench_precision.py [filas_sinteticas] [CKD_Stacking_bases_hp.pt]
+     (los modelos base se generan con `python entrenar.py --int8`)
+"""
+import io
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+import entrenar  # noqa: E402
+
+
+def medir(funcion, repeticiones=3):
+    """(mejor tiempo en s, pico de memoria asignada en bytes)"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(tiempos), pico
+
+
+def imprimir_paridad(nombre, resultado):
+    print(f"  {nombre:<28} " + '  '.join(f'{k}={v:.6g}' for k, v in resultado.items()))
+
+
+def sinteticos(ref, filas, rng):
+    return ref[rng.integers(0, len(ref), filas)] * rng.normal(1.0, 0.05, (filas, ref.shape[1]))
+
+
+def logistica(filas, rng):
+    modelo = aplicacion.modelo
+    variantes = {
+        'sklearn float64': (modelo, np.float64),
+        'compilado float64': (aplicacion.ModeloLinealCompilado(modelo, np.float64), np.float64),
+        'compilado float32': (aplicacion.compilar_float32(modelo), np.float32),
+    }
+    ref = aplicacion.preparar_matriz(aplicacion.dataset_ref)
+    y = aplicacion.obtener_etiquetas(aplicacion.dataset_ref)
+    con_etiqueta = ~np.isnan(y)
+    X = sinteticos(ref, filas, rng)
+
+    print("Regresión logística: paridad frente a sklearn float64")
+    p_ref = modelo.predict_proba(ref)[:, 1]
+    p_sint = modelo.predict_proba(X)[:, 1]
+    for nombre, (estimador, dtype) in list(variantes.items())[1:]:
+        p = estimador.predict_proba(ref.astype(dtype))[:, 1]
+        imprimir_paridad(f'{nombre} (dataset)', entrenar.paridad(p_ref[con_etiqueta], p[con_etiqueta], y[con_etiqueta]))
+        p = estimador.predict_proba(X.astype(dtype))[:, 1]
+        imprimir_paridad(f'{nombre} (sintético)', entrenar.paridad(p_sint, p))
+
+    print(f"Regresión logística: {filas:,} filas sintéticas")
+    for nombre, (estimador, dtype) in variantes.items():
+        Xd = X.astype(dtype)
+        t, pico = medir(lambda: estimador.predict_proba(Xd))
+        print(f"  {nombre:<18} {filas / t / 1e6:7.1f} M filas/s  matriz {Xd.nbytes / 1e6:6.0f} MB"
+              f"  memoria extra {pico / 1e6:6.0f} MB")
+    df = aplicacion.pd.DataFrame(X, columns=aplicacion.COLUMNAS_MODELO)
+    for dtype in (np.float64, np.float32):
+        t, pico = medir(lambda: aplicacion.preparar_matriz(df, dtype), 1)
+        print(f"  preparar_matriz {np.dtype(dtype).name:<8} {t * 1000:7.0f} ms  memoria extra {pico / 1e6:6.0f} MB")
+
+
+def stacking(ruta_bases, filas, rng):
+    if entrenar.torch is None or not os.path.exists(ruta_bases):
+        print(f"Stacking: se omite ({ruta_bases} no existe o torch no está instalado; ejecute entrenar.py --int8)")
+        return
+    torch = entrenar.torch
+    torch.set_num_threads(1)
+    bases, imputer, scaler = entrenar.cargar_bases(ruta_bases)
+    bases_int8 = {tipo: entrenar.cuantizar_int8(red) for tipo, red in bases.items()}
+    with open(os.path.join(os.path.dirname(ruta_bases) or '.', 'CKD_Stacking_lstmtansformer_hp.pkl'), 'rb') as f:
+        meta_modelo = pickle.load(f)
+
+    def puntuar(redes, X):
+        meta = np.column_stack([entrenar.predecir_red(redes['tab'], X), entrenar.predecir_red(redes['lstm'], X)])
+        return meta_modelo.predict_proba(meta)[:, 1]
+
+    crudo = aplicacion.dataset_ref[aplicacion.COLUMNAS_MODELO].apply(aplicacion.pd.to_numeric, errors='coerce')
+    y = aplicacion.obtener_etiquetas(aplicacion.dataset_ref)
+    con_etiqueta = ~np.isnan(y)
+    ref = scaler.transform(imputer.transform(crudo.to_numpy()))
+    X = scaler.transform(sinteticos(imputer.transform(crudo.to_numpy()), filas, rng)).astype(np.float32)
+
+    print("Stacking: paridad int8 frente a float32")
+    imprimir_paridad('int8 (dataset)', entrenar.paridad(puntuar(bases, ref)[con_etiqueta],
+                                                        puntuar(bases_int8, ref)[con_etiqueta], y[con_etiqueta]))
+    imprimir_paridad('int8 (sintético)', entrenar.paridad(puntuar(bases, X), puntuar(bases_int8, X)))
+
+    print(f"Stacking: {filas:,} filas sintéticas, 1 hilo")
+    for nombre, redes in (('float32', bases), ('int8', bases_int8)):
+        # torch no reserva memoria a través de tracemalloc: solo se informa el tamaño de los pesos
+        t, _ = medir(lambda: puntuar(redes, X), 1)
+        tamano = 0
+        for red in redes.values():
+            buffer = io.BytesIO()
+            torch.save(red.state_dict(), buffer)
+            tamano += len(buffer.getvalue())
+        print(f"  {nombre:<8} {filas / t / 1e3:7.1f} k filas/s  pesos {tamano / 1e3:6.0f} kB")
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    ruta_bases = sys.argv[2] if len(sys.argv) > 2 else 'CKD_Stacking_bases_hp.pt'
+    rng = np.random.default_rng(0)
+    logistica(filas, rng)
+    stacking(ruta_bases, min(filas, 200_000), rng)
+
+
+if __name__ == '__main__':
+    main()
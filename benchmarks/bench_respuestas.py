@@ -0,0 +1,63 @@
+"""Benchmark de bytes transmitidos y time-to-first-byte de los resultados por lotes.
+
+Compara la página HTML de /procesar-csv con la API en streaming /api/procesar-csv
+(formatos csv y binario) para cada codificación disponible, sobre 100k filas.
+
+Uso: python benchmarks/bench_respuestas.py [filas]
+"""
+import io
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def generar_csv(filas, semilla=0):
+    """Remuestrea el dataset de referencia (imputado) hasta el número de filas pedido"""
+    ref = aplicacion.dataset_ref[aplicacion.COLUMNAS_MODELO]
+    base = ref.apply(aplicacion.pd.to_numeric, errors='coerce').fillna(aplicacion.medias_ref)
+    rng = np.random.default_rng(semilla)
+    return base.iloc[rng.integers(0, len(base), filas)].to_csv(index=False).encode()
+
+
+def medir(cliente, ruta, contenido, codificacion):
+    cabeceras = {'Idempotency-Key': uuid.uuid4().hex}
+    if codificacion:
+        cabeceras['Accept-Encoding'] = codificacion
+    inicio = time.perf_counter()
+    respuesta = cliente.post(ruta, data={'file': (io.BytesIO(contenido), 'lote.csv')},
+                             content_type='multipart/form-data', headers=cabeceras, buffered=False)
+    ttfb = None
+    total_bytes = 0
+    for bloque in respuesta.response:
+        if ttfb is None:
+            ttfb = time.perf_counter() - inicio
+        total_bytes += len(bloque)
+    total = time.perf_counter() - inicio
+    respuesta.close()
+    return total_bytes, ttfb, total, respuesta.headers.get('Content-Encoding', 'identity')
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    contenido = generar_csv(filas)
+    cliente = aplicacion.app.test_client()
+    codificaciones = [None] + [c for c, ok in aplicacion.codificaciones_disponibles().items() if ok]
+
+    print(f"CSV de entrada: {filas} filas, {len(contenido) / 1e6:.1f} MB")
+    print(f"{'ruta':<34}{'encoding':<10}{'bytes':>12}{'ttfb (s)':>10}{'total (s)':>11}")
+    for ruta in ('/procesar-csv', '/api/procesar-csv?formato=csv', '/api/procesar-csv?formato=binario'):
+        for codificacion in codificaciones:
+            total_bytes, ttfb, total, usada = medir(cliente, ruta, contenido, codificacion)
+            print(f"{ruta:<34}{usada:<10}{total_bytes:>12,}{ttfb:>10.3f}{total:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
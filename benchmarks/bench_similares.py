@@ -0,0 +1,55 @@
+"""Benchmark del índice de pacientes similares: KD-tree frente a fuerza bruta.
+
+Construye conjuntos de referencia sintéticos (remuestreo del dataset con ruido) y mide
+el tiempo de construcción del índice y la latencia de consultas individuales y en lote.
+
+Uso: python benchmarks/bench_similares.py [k] [consultas_lote]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+def mejor_tiempo(funcion, repeticiones=5):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    consultas_lote = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    escalador = aplicacion.modelo.named_steps['scaler']
+    ref = aplicacion.preparar_matriz(aplicacion.dataset_ref)
+    rng = np.random.default_rng(0)
+    consultas = ref[rng.integers(0, len(ref), consultas_lote)] * rng.normal(1.0, 0.05, (consultas_lote, ref.shape[1]))
+
+    for filas in (10_000, 100_000, 1_000_000):
+        X = ref[rng.integers(0, len(ref), filas)] * rng.normal(1.0, 0.05, (filas, ref.shape[1]))
+        inicio = time.perf_counter()
+        indice = aplicacion.IndiceSimilares(escalador, X, np.arange(filas).astype(str), np.ones(filas))
+        t_construccion = time.perf_counter() - inicio
+        Z = escalador.transform(X)
+        Q = escalador.transform(consultas)
+
+        t_uno = mejor_tiempo(lambda: indice.consultar(consultas[:1], k), 20)
+        t_lote = mejor_tiempo(lambda: indice.consultar(consultas, k), 3)
+        t_fb_uno = mejor_tiempo(lambda: aplicacion.knn_por_bloques(Q[:1], Z, k), 5)
+        t_fb_lote = mejor_tiempo(lambda: aplicacion.knn_por_bloques(Q, Z, k), 1)
+        print(f"{filas:>9,} filas | construcción {t_construccion * 1000:8.1f} ms | "
+              f"KD-tree 1 consulta {t_uno * 1000:7.3f} ms, {consultas_lote} consultas {t_lote * 1000:8.1f} ms | "
+              f"fuerza bruta 1 consulta {t_fb_uno * 1000:7.2f} ms, {consultas_lote} consultas {t_fb_lote * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
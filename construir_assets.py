@@ -0,0 +1,133 @@
+"""Construcción de los assets estáticos que sirve app.py desde /assets.
+
+Copia cada asset a static/dist con una huella del contenido en el nombre
+(principal.3f9a1c2e.css), de modo que puede cachearse como inmutable, y guarda
+junto a los de texto sus versiones precomprimidas (.gz y, si están instalados
+brotli y zstandard, .br y .zst) para no comprimir en cada solicitud. De
+static/images/grupo.jpg genera variantes redimensionadas en JPEG progresivo y
+WebP para srcset.
+
+El mapa nombre lógico -> archivo con huella queda en static/dist/manifiesto.json,
+que app.py lee al arrancar. Los archivos de una construcción anterior que ya no
+aparecen en el manifiesto se eliminan.
+
+Uso: python construir_assets.py [--origen static] [--salida static/dist] [--anchos 300 600]
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+
+# brotli, zstandard y Pillow son opcionales: sin ellos se omiten los .br, .zst y las variantes de imagen
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Assets de texto (se precomprimen) e imágenes con variantes responsivas, relativos a --origen
+TEXTOS = ['css/principal.css']
+IMAGENES = ['images/grupo.jpg']
+EXTENSIONES_TEXTO = ('.css', '.js', '.svg')
+
+
+def huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()[:8]
+
+
+def escribir_con_huella(salida, nombre_logico, contenido):
+    """Escribe el contenido como <base>.<huella><ext> y devuelve el nombre del archivo"""
+    base, ext = os.path.splitext(os.path.basename(nombre_logico))
+    archivo = f'{base}.{huella(contenido)}{ext}'
+    with open(os.path.join(salida, archivo), 'wb') as f:
+        f.write(contenido)
+    if ext in EXTENSIONES_TEXTO:
+        # mtime fijo: misma entrada, mismos bytes comprimidos
+        with open(os.path.join(salida, archivo + '.gz'), 'wb') as f:
+            f.write(gzip.compress(contenido, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(os.path.join(salida, archivo + '.br'), 'wb') as f:
+                f.write(brotli.compress(contenido, quality=11, mode=brotli.MODE_TEXT))
+        if zstandard is not None:
+            with open(os.path.join(salida, archivo + '.zst'), 'wb') as f:
+                f.write(zstandard.ZstdCompressor(level=19).compress(contenido))
+    return archivo
+
+
+def variantes_imagen(ruta, anchos):
+    """{(ancho, alto, formato): bytes} con la imagen redimensionada a cada ancho (sin ampliar)"""
+    variantes = {}
+    with Image.open(ruta) as original:
+        original = original.convert('RGB')
+        for ancho in anchos:
+            ancho = min(ancho, original.width)
+            alto = round(original.height * ancho / original.width)
+            imagen = original.resize((ancho, alto), Image.LANCZOS)
+            for formato, opciones in (('jpg', {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True}),
+                                      ('webp', {'format': 'WEBP', 'quality': 78, 'method': 6})):
+                buffer = io.BytesIO()
+                imagen.save(buffer, **opciones)
+                variantes[(ancho, alto, formato)] = buffer.getvalue()
+    return variantes
+
+
+def construir(origen, salida, anchos):
+    os.makedirs(salida, exist_ok=True)
+    manifiesto = {}
+    for nombre in TEXTOS:
+        with open(os.path.join(origen, nombre), 'rb') as f:
+            manifiesto[nombre] = {'archivo': escribir_con_huella(salida, nombre, f.read())}
+
+    for nombre in IMAGENES:
+        if Image is None:
+            print(f'⚠️ Pillow no está instalado: se omiten las variantes de {nombre}')
+            continue
+        base, _ = os.path.splitext(nombre)
+        for (ancho, alto, formato), contenido in variantes_imagen(os.path.join(origen, nombre), anchos).items():
+            logico = f'{base}-{ancho}.{formato}'
+            manifiesto[logico] = {'archivo': escribir_con_huella(salida, logico, contenido),
+                                  'ancho': ancho, 'alto': alto}
+
+    vigentes = {'manifiesto.json'}
+    for entrada in manifiesto.values():
+        vigentes.update(entrada['archivo'] + sufijo for sufijo in ('', '.gz', '.br', '.zst'))
+    for archivo in os.listdir(salida):
+        if archivo not in vigentes:
+            os.remove(os.path.join(salida, archivo))
+
+    with open(os.path.join(salida, 'manifiesto.json'), 'w') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    return manifiesto
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera los assets con huella y precomprimidos que sirve app.py')
+    parser.add_argument('--origen', default='static')
+    parser.add_argument('--salida', default=os.path.join('static', 'dist'))
+    parser.add_argument('--anchos', type=int, nargs='+', default=[300, 600],
+                        help='anchos en píxeles de las variantes de imagen (1x y 2x del pie de página)')
+    args = parser.parse_args()
+
+    manifiesto = construir(args.origen, args.salida, args.anchos)
+    for nombre, entrada in sorted(manifiesto.items()):
+        ruta = os.path.join(args.salida, entrada['archivo'])
+        tamanos = [f'{os.path.getsize(ruta):,} B']
+        for sufijo in ('.gz', '.br', '.zst'):
+            if os.path.exists(ruta + sufijo):
+                tamanos.append(f'{sufijo[1:]} {os.path.getsize(ruta + sufijo):,} B')
+        print(f"{nombre:<26} -> {entrada['archivo']:<28} {', '.join(tamanos)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""Entrenamiento reproducible y sin interfaz de los modelos de ERC (extraído del notebook).
+
+Reconstruye a partir de kidney_disease.csv los artefactos que carga app.py:
+  - CKD_LR_hp.pkl: Pipeline(scaler, classifier) de regresión logística sobre las 17 variables
+  - CKD_Stacking_lstmtansformer_hp.pkl: meta-modelo del stacking TabTransformer + LSTM,
+    junto con CKD_Stacking_bases_hp.pt (pesos de los modelos base, imputer y scaler)
+
+Los folds de validación cruzada y la búsqueda de hiperparámetros corren en paralelo,
+las particiones y matrices preprocesadas se guardan en caché entre ejecuciones y las
+redes base se eligen por successive halving con early stopping. Los tiempos de cada
+etapa se escriben en tiempos_entrenamiento.json.
+
+Con --calibracion isotonica|platt además ajusta una calibración sobre predicciones
+out-of-fold y la compila a una tabla lineal por tramos (CKD_LR_hp_calibracion.json)
+que app.py aplica con np.interp.
+
+Con --bootstrap B además ajusta B réplicas de CKD_LR_hp.pkl (mismos hiperparámetros) sobre
+remuestreos con reemplazo, pliega cada una a X @ w + b y guarda la matriz B x 17 de
+coeficientes y los B interceptos en CKD_LR_hp_bootstrap.npz, con la que app.py calcula
+intervalos percentiles de la probabilidad.
+
+Con --int8 guarda también los modelos base cuantizados a int8 (cuantización dinámica
+de las capas Linear y LSTM) en CKD_Stacking_bases_hp_int8.pt e informa su paridad
+con los de float32 sobre el conjunto de prueba.
+
+Uso: python entrenar.py [--datos kidney_disease.csv] [--salida .] [--n-jobs -1] [--sin-stacking]
+                        [--calibracion isotonica|platt] [--bootstrap 1000] [--int8]
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from joblib import Memory, Parallel, delayed
+from sklearn.base import clone
+from sklearn.impute import SimpleImputer
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score, roc_auc_score
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, cross_val_predict, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+# torch solo es necesario para los modelos base del stacking
+try:
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+except ImportError:
+    torch = None
+
+from esquema import COLUMNAS_MODELO
+from modelo_lineal import plegar_lineal
+
+tiempos = {}
+
+
+@contextmanager
+def etapa(nombre):
+    inicio = time.perf_counter()
+    yield
+    tiempos[nombre] = round(time.perf_counter() - inicio, 3)
+    print(f"⏱️  {nombre}: {tiempos[nombre]:.2f} s")
+
+
+# === DATOS (en caché entre ejecuciones) ===
+
+def cargar_datos(ruta, marca_tiempo):
+    """Limpieza del notebook: '?' a NaN, columnas numéricas y filas con etiqueta.
+    marca_tiempo solo invalida la caché cuando cambia el archivo."""
+    data = pd.read_csv(ruta, sep=';')
+    X = data[COLUMNAS_MODELO].replace(['?', '\t?'], np.nan).apply(pd.to_numeric, errors='coerce')
+    y = pd.to_numeric(data['classification'].replace(['?', '\t?'], np.nan), errors='coerce')
+    validas = y.notna().to_numpy()
+    return X[validas].reset_index(drop=True), y[validas].astype(int).reset_index(drop=True)
+
+
+def particiones(y, n_splits, semilla):
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=semilla)
+    return [(tr, va) for tr, va in skf.split(np.zeros(len(y)), y)]
+
+
+def imputar_medias(X):
+    """Imputación con las medias del dataset completo, igual que hace app.py al servir"""
+    return X.fillna(X.mean()).to_numpy(dtype=np.float64)
+
+
+def preprocesar_stacking(X, y, test_size, semilla):
+    """Split 80/20 del notebook con imputer + scaler ajustados solo en train"""
+    X_tr, X_te, y_tr, y_te = train_test_split(X, y, test_size=test_size, random_state=semilla, stratify=y)
+    imputer = SimpleImputer(strategy='mean')
+    scaler = StandardScaler()
+    X_tr = scaler.fit_transform(imputer.fit_transform(X_tr))
+    X_te = scaler.transform(imputer.transform(X_te))
+    return X_tr, X_te, y_tr.to_numpy(), y_te.to_numpy(), imputer, scaler
+
+
+# === REGRESIÓN LOGÍSTICA (CKD_LR_hp.pkl) ===
+
+def entrenar_lr(X, y, folds, n_jobs):
+    pipe = Pipeline([
+        ('scaler', StandardScaler()),
+        ('classifier', LogisticRegression(max_iter=1000))
+    ])
+    grid = GridSearchCV(pipe, {'classifier__C': [0.01, 0.1, 1, 10, 100]},
+                        scoring='f1_macro', cv=folds, n_jobs=n_jobs)
+    grid.fit(X, y)
+    print(f"   LR mejor C={grid.best_params_['classifier__C']} f1_macro={grid.best_score_:.4f}")
+    return grid.best_estimator_
+
+
+# === CALIBRACIÓN (tabla monótona lineal por tramos) ===
+
+def ajustar_calibracion(modelo, X, y, folds, metodo, n_jobs, puntos=129):
+    """Ajusta isotónica o Platt sobre probabilidades out-of-fold y la compila a nodos (x, y) para np.interp"""
+    p_oof = cross_val_predict(clone(modelo), X, y, cv=folds, method='predict_proba', n_jobs=n_jobs)[:, 1]
+    if metodo == 'isotonica':
+        iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(p_oof, y)
+        # La isotónica ya es lineal por tramos entre sus umbrales; se extiende a [0, 1]
+        xs = np.r_[0.0, iso.X_thresholds_, 1.0]
+        ys = np.r_[iso.y_thresholds_[0], iso.y_thresholds_, iso.y_thresholds_[-1]]
+    else:
+        # Platt sobre el logit de la probabilidad, muestreado más denso en los extremos
+        logit = lambda p: np.log(p / (1 - p))
+        eps = 1e-6
+        platt = LogisticRegression(C=1e6).fit(logit(np.clip(p_oof, eps, 1 - eps)).reshape(-1, 1), y)
+        xs = 1 / (1 + np.exp(-np.linspace(logit(eps), logit(1 - eps), puntos)))
+        xs = np.r_[0.0, xs, 1.0]
+        ys = platt.predict_proba(logit(np.clip(xs, eps, 1 - eps)).reshape(-1, 1))[:, 1]
+    xs, indices = np.unique(xs, return_index=True)
+    ys = np.maximum.accumulate(ys[indices])
+    return {'metodo': metodo, 'x': xs.tolist(), 'y': ys.tolist()}
+
+
+# === ENSAMBLE BOOTSTRAP (intervalos de incertidumbre) ===
+
+def _replica_bootstrap(modelo, X, y, semilla):
+    rng = np.random.default_rng(semilla)
+    indices = rng.integers(0, len(y), len(y))
+    while len(np.unique(y[indices])) < 2:
+        indices = rng.integers(0, len(y), len(y))
+    return plegar_lineal(clone(modelo).fit(X[indices], y[indices]))
+
+
+def ajustar_bootstrap(modelo, X, y, replicas, semilla, n_jobs):
+    """Réplicas del modelo ajustadas sobre remuestreos con reemplazo, apiladas en una matriz B x 17"""
+    plegadas = Parallel(n_jobs=n_jobs, batch_size=16)(
+        delayed(_replica_bootstrap)(modelo, X, y, semilla + i) for i in range(replicas))
+    return np.stack([w for w, _ in plegadas]), np.array([b for _, b in plegadas])
+
+
+# === MODELOS BASE DEL STACKING (mismas arquitecturas que el notebook) ===
+
+if torch is not None:
+    class TabTransformer(nn.Module):
+        def __init__(self, input_dim, num_heads=4, hidden_dim=128, num_layers=2):
+            super(TabTransformer, self).__init__()
+            self.embedding = nn.Linear(input_dim, hidden_dim)
+            encoder_layer = nn.TransformerEncoderLayer(
+                d_model=hidden_dim, nhead=num_heads,
+                dim_feedforward=hidden_dim, dropout=0.1, batch_first=True
+            )
+            self.transformer = nn.TransformerEncoder(encoder_layer, num_layers=num_layers)
+            self.output_layer = nn.Linear(hidden_dim, 1)
+
+        def forward(self, x):
+            x = self.embedding(x)
+            x = self.transformer(x)
+            return self.output_layer(x.mean(dim=1))
+
+    class LSTMClassifier(nn.Module):
+        def __init__(self, input_size, hidden_dim=64, num_layers=1):
+            super(LSTMClassifier, self).__init__()
+            self.lstm = nn.LSTM(input_size, hidden_dim, num_layers=num_layers, batch_first=True)
+            self.fc = nn.Linear(hidden_dim, 1)
+
+        def forward(self, x):
+            out, _ = self.lstm(x)
+            return self.fc(out[:, -1, :])
+
+    REDES = {'tab': TabTransformer, 'lstm': LSTMClassifier}
+
+
+def a_tensor(X):
+    return torch.tensor(np.asarray(X), dtype=torch.float32).unsqueeze(1)
+
+
+def entrenar_red(tipo, params, X, y, X_val, y_val, epocas, semilla, paciencia=5):
+    """Entrena full-batch como el notebook, con early stopping sobre la pérdida de validación"""
+    torch.manual_seed(semilla)
+    params = dict(params)
+    lr = params.pop('lr')
+    red = REDES[tipo](X.shape[1], **params)
+    optimizer = optim.Adam(red.parameters(), lr=lr)
+    criterio = nn.BCEWithLogitsLoss()
+    Xt, yt = a_tensor(X), torch.tensor(y, dtype=torch.float32).reshape(-1, 1)
+    Xv, yv = a_tensor(X_val), torch.tensor(y_val, dtype=torch.float32).reshape(-1, 1)
+
+    mejor_perdida, mejor_estado, sin_mejora, epocas_usadas = np.inf, None, 0, 0
+    for epoca in range(epocas):
+        red.train()
+        optimizer.zero_grad()
+        criterio(red(Xt), yt).backward()
+        optimizer.step()
+        red.eval()
+        with torch.no_grad():
+            perdida = criterio(red(Xv), yv).item()
+        epocas_usadas = epoca + 1
+        if perdida < mejor_perdida - 1e-4:
+            mejor_perdida, sin_mejora = perdida, 0
+            mejor_estado = {k: v.clone() for k, v in red.state_dict().items()}
+        else:
+            sin_mejora += 1
+            if sin_mejora >= paciencia:
+                break
+    red.load_state_dict(mejor_estado)
+    red.eval()
+    return red, mejor_perdida, epocas_usadas
+
+
+def predecir_red(red, X):
+    with torch.no_grad():
+        return torch.sigmoid(red(a_tensor(X))).numpy().ravel()
+
+
+def cuantizar_int8(red):
+    """Pesos de Linear y LSTM en int8; las activaciones se cuantizan al vuelo en cada lote"""
+    # El camino rápido del TransformerEncoder no admite capas cuantizadas
+    torch.backends.mha.set_fastpath_enabled(False)
+    return torch.ao.quantization.quantize_dynamic(red, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+
+
+def cargar_bases(ruta):
+    """Modelos base guardados por main(), en float32 o int8 según el archivo"""
+    datos = torch.load(ruta, weights_only=False)
+    bases = {}
+    for tipo in ('tab', 'lstm'):
+        params = {k: v for k, v in datos['params'][tipo].items() if k != 'lr'}
+        red = REDES[tipo](len(datos['columnas']), **params)
+        red.eval()
+        if datos.get('int8'):
+            red = cuantizar_int8(red)
+        red.load_state_dict(datos[tipo])
+        bases[tipo] = red
+    return bases, datos['imputer'], datos['scaler']
+
+
+def paridad(p_ref, p, y=None):
+    """Diferencias entre dos vectores de probabilidades (y AUC de ambos si hay etiquetas)"""
+    resultado = {
+        'max_abs': float(np.max(np.abs(p_ref - p))),
+        'media_abs': float(np.mean(np.abs(p_ref - p))),
+        'acuerdo_0.5': float(np.mean((p_ref > 0.5) == (p > 0.5))),
+    }
+    if y is not None:
+        resultado['auc_ref'] = float(roc_auc_score(y, p_ref))
+        resultado['auc'] = float(roc_auc_score(y, p))
+    return resultado
+
+
+def successive_halving(tipo, espacio, X, y, semilla, n_jobs, eta=3, epocas_min=10, epocas_max=90):
+    """Evalúa todas las configuraciones con pocas épocas y se queda con el mejor 1/eta en cada ronda"""
+    X_tr, X_val, y_tr, y_val = train_test_split(X, y, test_size=0.25, random_state=semilla, stratify=y)
+    candidatas, epocas = list(espacio), epocas_min
+    while True:
+        perdidas = Parallel(n_jobs=n_jobs)(
+            delayed(_perdida_config)(tipo, params, X_tr, y_tr, X_val, y_val, epocas, semilla)
+            for params in candidatas
+        )
+        orden = np.argsort(perdidas)
+        if len(candidatas) == 1 or epocas >= epocas_max:
+            mejor = candidatas[orden[0]]
+            print(f"   {tipo}: {mejor} (val BCE {perdidas[orden[0]]:.4f}, {epocas} épocas máx.)")
+            return mejor, epocas
+        candidatas = [candidatas[i] for i in orden[:max(1, len(candidatas) // eta)]]
+        epocas = min(epocas * eta, epocas_max)
+
+
+def _perdida_config(tipo, params, X_tr, y_tr, X_val, y_val, epocas, semilla):
+    torch.set_num_threads(1)
+    return entrenar_red(tipo, params, X_tr, y_tr, X_val, y_val, epocas, semilla)[1]
+
+
+def _fold_stacking(params, epocas, X, y, tr, va, semilla):
+    """Predicciones out-of-fold de los modelos base para entrenar el meta-modelo"""
+    torch.set_num_threads(1)
+    meta = np.zeros((len(va), 2))
+    for j, tipo in enumerate(('tab', 'lstm')):
+        red, _, _ = entrenar_red(tipo, params[tipo], X[tr], y[tr], X[va], y[va], epocas[tipo], semilla)
+        meta[:, j] = predecir_red(red, X[va])
+    return va, meta
+
+
+ESPACIO_REDES = {
+    'tab': [{'hidden_dim': h, 'num_layers': n, 'lr': lr}
+            for h in (32, 64, 128) for n in (1, 2) for lr in (1e-3, 3e-3)],
+    'lstm': [{'hidden_dim': h, 'lr': lr}
+             for h in (32, 64, 128) for lr in (1e-3, 3e-3, 1e-2)],
+}
+
+
+def entrenar_stacking(X, y, semilla, n_jobs, memoria):
+    with etapa('stacking_preprocesamiento'):
+        X_tr, X_te, y_tr, y_te, imputer, scaler = memoria.cache(preprocesar_stacking)(X, y, 0.2, semilla)
+        folds = memoria.cache(particiones)(y_tr, 5, semilla)
+
+    with etapa('stacking_halving_redes'):
+        params, epocas = {}, {}
+        for tipo in ('tab', 'lstm'):
+            params[tipo], epocas[tipo] = successive_halving(tipo, ESPACIO_REDES[tipo], X_tr, y_tr, semilla, n_jobs)
+
+    with etapa('stacking_folds_oof'):
+        meta_tr = np.zeros((len(y_tr), 2))
+        for va, meta in Parallel(n_jobs=n_jobs)(
+                delayed(_fold_stacking)(params, epocas, X_tr, y_tr, tr, va, semilla) for tr, va in folds):
+            meta_tr[va] = meta
+
+    with etapa('stacking_meta_grid'):
+        pipe = Pipeline([
+            ('imputer', SimpleImputer(strategy='mean')),
+            ('scaler', StandardScaler()),
+            ('clf', LogisticRegression(class_weight='balanced', max_iter=1000))
+        ])
+        grid = GridSearchCV(pipe, {'clf__C': [0.1, 1, 10], 'clf__solver': ['liblinear'], 'clf__penalty': ['l2']},
+                            scoring='f1_macro', cv=3, n_jobs=n_jobs)
+        grid.fit(meta_tr, y_tr)
+        meta_modelo = grid.best_estimator_
+
+    with etapa('stacking_modelos_base_finales'):
+        # Se reserva una parte del train solo para decidir cuándo parar
+        X_fit, X_es, y_fit, y_es = train_test_split(X_tr, y_tr, test_size=0.15, random_state=semilla, stratify=y_tr)
+        bases = {tipo: entrenar_red(tipo, params[tipo], X_fit, y_fit, X_es, y_es, epocas[tipo], semilla)[0]
+                 for tipo in ('tab', 'lstm')}
+
+    meta_te = np.column_stack([predecir_red(bases['tab'], X_te), predecir_red(bases['lstm'], X_te)])
+    proba_te = meta_modelo.predict_proba(meta_te)[:, 1]
+    print(f"   Stacking test: AUC={roc_auc_score(y_te, proba_te):.4f} "
+          f"f1_macro={f1_score(y_te, meta_modelo.predict(meta_te), average='macro'):.4f}")
+    return meta_modelo, bases, params, imputer, scaler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Entrena los modelos de ERC que usa app.py')
+    parser.add_argument('--datos', default='kidney_disease.csv')
+    parser.add_argument('--salida', default='.', help='directorio donde escribir los artefactos')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--cache', default='.cache_entrenamiento', help='caché de particiones y matrices')
+    parser.add_argument('--sin-stacking', action='store_true', help='entrena solo CKD_LR_hp.pkl')
+    parser.add_argument('--calibracion', choices=['isotonica', 'platt'],
+                        help='ajusta y compila una tabla de calibración para CKD_LR_hp.pkl')
+    parser.add_argument('--bootstrap', type=int, metavar='B',
+                        help='ajusta B réplicas bootstrap de CKD_LR_hp.pkl para intervalos de incertidumbre')
+    parser.add_argument('--int8', action='store_true',
+                        help='guarda además los modelos base del stacking cuantizados a int8')
+    args = parser.parse_args()
+
+    os.makedirs(args.salida, exist_ok=True)
+    memoria = Memory(args.cache, verbose=0)
+    np.random.seed(args.semilla)
+
+    with etapa('carga_datos'):
+        X, y = memoria.cache(cargar_datos)(args.datos, os.path.getmtime(args.datos))
+        folds = memoria.cache(particiones)(y.to_numpy(), 5, args.semilla)
+        X_imputada = memoria.cache(imputar_medias)(X)
+
+    with etapa('lr_grid_search'):
+        lr = entrenar_lr(X_imputada, y.to_numpy(), folds, args.n_jobs)
+    with open(os.path.join(args.salida, 'CKD_LR_hp.pkl'), 'wb') as f:
+        pickle.dump(lr, f)
+
+    if args.calibracion:
+        with etapa('lr_calibracion'):
+            tabla = ajustar_calibracion(lr, X_imputada, y.to_numpy(), folds, args.calibracion, args.n_jobs)
+        with open(os.path.join(args.salida, 'CKD_LR_hp_calibracion.json'), 'w') as f:
+            json.dump(tabla, f)
+        print(f"   Calibración {args.calibracion}: {len(tabla['x'])} nodos")
+
+    if args.bootstrap:
+        with etapa('lr_bootstrap'):
+            coeficientes, interceptos = ajustar_bootstrap(lr, X_imputada, y.to_numpy(), args.bootstrap,
+                                                          args.semilla, args.n_jobs)
+        np.savez(os.path.join(args.salida, 'CKD_LR_hp_bootstrap.npz'), coeficientes=coeficientes,
+                 interceptos=interceptos, columnas=np.array(COLUMNAS_MODELO))
+        print(f"   Bootstrap: {args.bootstrap} réplicas")
+
+    if args.sin_stacking:
+        pass
+    elif torch is None:
+        print("⚠️ torch no está instalado: se omite el stacking TabTransformer + LSTM")
+    else:
+        meta_modelo, bases, params, imputer, scaler = entrenar_stacking(X, y, args.semilla, args.n_jobs, memoria)
+        with open(os.path.join(args.salida, 'CKD_Stacking_lstmtansformer_hp.pkl'), 'wb') as f:
+            pickle.dump(meta_modelo, f)
+        torch.save({
+            'columnas': COLUMNAS_MODELO,
+            'params': params,
+            'tab': bases['tab'].state_dict(),
+            'lstm': bases['lstm'].state_dict(),
+            'imputer': imputer,
+            'scaler': scaler,
+        }, os.path.join(args.salida, 'CKD_Stacking_bases_hp.pt'))
+
+        if args.int8:
+            with etapa('stacking_int8'):
+                bases_int8 = {tipo: cuantizar_int8(red) for tipo, red in bases.items()}
+                _, X_te, _, y_te, _, _ = memoria.cache(preprocesar_stacking)(X, y, 0.2, args.semilla)
+                meta = {v: np.column_stack([predecir_red(b['tab'], X_te), predecir_red(b['lstm'], X_te)])
+                        for v, b in (('float32', bases), ('int8', bases_int8))}
+                p_ref, p_int8 = (meta_modelo.predict_proba(meta[v])[:, 1] for v in ('float32', 'int8'))
+                print(f"   Paridad int8 vs float32 (test): {paridad(p_ref, p_int8, y_te)}")
+            torch.save({
+                'columnas': COLUMNAS_MODELO,
+                'params': params,
+                'int8': True,
+                'tab': bases_int8['tab'].state_dict(),
+                'lstm': bases_int8['lstm'].state_dict(),
+                'imputer': imputer,
+                'scaler': scaler,
+            }, os.path.join(args.salida, 'CKD_Stacking_bases_hp_int8.pt'))
+
+    with open(os.path.join(args.salida, 'tiempos_entrenamiento.json'), 'w') as f:
+        json.dump(tiempos, f, indent=2)
+    print(f"✅ Artefactos escritos en {os.path.abspath(args.salida)} (total {sum(tiempos.values()):.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Esquema de las variables del modelo y del canal binario, compartido por app.py, servidor_binario.py
+y las herramientas fuera de línea.
+
+Solo define constantes: importarlo no carga modelos, no abre archivos ni arranca hilos, así
+que entrenar.py y generar_cohorte.py lo usan sin levantar la aplicación.
+"""
+
+import struct
+
+# Orden de columnas con el que se entrenó el modelo (ver notebook)
+COLUMNAS_MODELO = ['sg', 'al', 'su', 'sc', 'bu', 'bgr', 'hemo', 'pcv', 'rc', 'wc',
+                   'dm', 'htn', 'ane', 'appet', 'rbc', 'pc', 'age']
+
+# Rangos válidos de las variables numéricas, basados en el dataset de entrenamiento; las
+# demás columnas del modelo son categóricas codificadas 0/1
+RANGOS_VALIDOS = {
+    'age': (1, 120),
+    'sg': (1.005, 1.025),
+    'al': (0, 5),
+    'su': (0, 5),
+    'sc': (0.1, 20.0),
+    'bu': (1.0, 200.0),
+    'bgr': (50, 500),
+    'hemo': (3.0, 20.0),
+    'pcv': (10, 60),
+    'rc': (2.0, 8.0),
+    'wc': (2000, 30000)
+}
+
+# Canal binario: solicitud <uint32 n><float32 x[n][17]>, respuesta <uint32 n><float32 p[n]>, en
+# little-endian; una trama inválida recibe <uint32 TRAMA_ERROR><uint32 largo><mensaje utf-8>
+CABECERA_TRAMA = struct.Struct('<I')
+TRAMA_ERROR = 0xFFFFFFFF
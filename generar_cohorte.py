@@ -0,0 +1,240 @@
+"""Generador de cohortes sintéticas a partir de kidney_disease.csv para pruebas de carga y capacidad.
+
+Ajusta sobre el archivo de referencia:
+  - la marginal de cada variable: función cuantil empírica con los valores dentro de
+    los rangos de validar_datos (escalonada para las variables discretas);
+  - la dependencia entre variables con una cópula gaussiana (correlación de los
+    puntajes normales por rango), que conserva hemo/pcv/rc, sc/bu y la relación de
+    cada variable con la clasificación;
+  - los datos faltantes, remuestreando patrones completos de faltantes por fila.
+
+Genera por bloques en paralelo. Cada bloque usa su propia semilla derivada de
+--semilla (SeedSequence.spawn), así que la salida es idéntica para la misma semilla
+con cualquier número de procesos. Los bloques se escriben en orden a CSV (o a
+Parquet, si está instalado pyarrow) a medida que terminan.
+
+Uso: python generar_cohorte.py salida.csv --filas 10000000 [--semilla 0] [--formato csv|parquet]
+                              [--bloque 250000] [--n-jobs -1] [--sin-etiquetas] [--datos kidney_disease.csv]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.special import ndtr, ndtri
+
+# pyarrow es opcional: sin él solo se puede escribir CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from esquema import COLUMNAS_MODELO, RANGOS_VALIDOS
+
+# Variables con pocos valores distintos: se muestrean solo valores observados
+MAX_VALORES_DISCRETOS = 10
+
+
+def decimales(valores):
+    """Menor número de decimales (hasta 3) con el que se escriben todos los valores observados"""
+    for d in range(4):
+        if np.allclose(valores * 10 ** d, np.round(valores * 10 ** d)):
+            return d
+    return 3
+
+
+def ajustar(ruta, etiquetas=True):
+    """Parámetros del generador: marginales, correlación de la cópula y patrones de faltantes"""
+    data = pd.read_csv(ruta, sep=';')
+    columnas = COLUMNAS_MODELO + (['classification'] if etiquetas else [])
+    X = data[columnas].replace(['?', '\t?'], np.nan).apply(pd.to_numeric, errors='coerce')
+    if etiquetas:
+        X = X[X['classification'].notna()].reset_index(drop=True)
+
+    marginales = []
+    for columna in columnas:
+        valores = X[columna].dropna().to_numpy(dtype=np.float64)
+        if columna in RANGOS_VALIDOS:
+            minimo, maximo = RANGOS_VALIDOS[columna]
+            valores = valores[(valores >= minimo) & (valores <= maximo)]
+        valores = np.sort(valores)
+        marginales.append({
+            'valores': valores,
+            'probabilidades': (np.arange(len(valores)) + 0.5) / len(valores),
+            'discreta': len(np.unique(valores)) <= MAX_VALORES_DISCRETOS,
+            'decimales': decimales(valores),
+        })
+
+    # Puntajes normales por rango; la correlación por pares ignora los faltantes
+    puntajes = X.rank(method='average').div(X.notna().sum()).sub(0.5 / X.notna().sum())
+    correlacion = pd.DataFrame(ndtri(puntajes.to_numpy()), columns=columnas).corr().fillna(0).to_numpy()
+    np.fill_diagonal(correlacion, 1.0)
+    # La correlación por pares puede no ser semidefinida positiva: se proyecta antes de Cholesky
+    autovalores, autovectores = np.linalg.eigh(correlacion)
+    correlacion = autovectores @ np.diag(np.maximum(autovalores, 1e-6)) @ autovectores.T
+    d = np.sqrt(np.diag(correlacion))
+    correlacion = correlacion / np.outer(d, d)
+
+    patrones, conteos = np.unique(X[COLUMNAS_MODELO].isna().to_numpy(), axis=0, return_counts=True)
+    return {
+        'columnas': columnas,
+        'marginales': marginales,
+        'tablas': [tabla_textos(m) for m in marginales],
+        'correlacion': correlacion,
+        'cholesky': np.linalg.cholesky(correlacion),
+        'patrones_faltantes': patrones,
+        'probabilidad_patrones': conteos / conteos.sum(),
+    }
+
+
+def generar_bloque(modelo, inicio, filas, semilla):
+    """{columna: array} con `filas` pacientes sintéticos e ids desde `inicio`; NaN = faltante"""
+    rng = np.random.default_rng(semilla)
+    U = ndtr(rng.standard_normal((filas, len(modelo['columnas']))) @ modelo['cholesky'].T)
+    datos = {'id': np.arange(inicio, inicio + filas, dtype=np.int64)}
+    for j, (columna, m) in enumerate(zip(modelo['columnas'], modelo['marginales'])):
+        n = len(m['valores'])
+        if m['discreta']:
+            valores = m['valores'][np.minimum((U[:, j] * n).astype(np.intp), n - 1)]
+        else:
+            # Equivale a np.interp sobre m['probabilidades'], que están equiespaciadas:
+            # la posición se calcula en lugar de buscarla
+            posicion = np.clip(U[:, j] * n - 0.5, 0, n - 1)
+            i = np.minimum(posicion.astype(np.intp), n - 2)
+            valores = m['valores'][i] + (posicion - i) * (m['valores'][i + 1] - m['valores'][i])
+            valores = np.round(valores, m['decimales'])
+        datos[columna] = valores
+
+    faltantes = modelo['patrones_faltantes'][
+        rng.choice(len(modelo['patrones_faltantes']), size=filas, p=modelo['probabilidad_patrones'])]
+    for j, columna in enumerate(COLUMNAS_MODELO):
+        datos[columna][faltantes[:, j]] = np.nan
+    return datos
+
+
+def tabla_textos(m):
+    """Texto CSV de cada valor representable de la columna, como matriz de bytes rellena con ceros.
+
+    Los valores generados están redondeados a m['decimales'], así que round(v * escala) - base
+    indexa directamente la fila con su texto.
+    """
+    escala = 10 ** m['decimales']
+    base, tope = (int(round(v * escala)) for v in (m['valores'][0], m['valores'][-1]))
+    textos = []
+    for k in range(base, tope + 1):
+        texto = f"{k / escala:.{m['decimales']}f}"
+        if m['decimales']:
+            texto = texto.rstrip('0').rstrip('.')
+        textos.append(texto.encode())
+    tabla = np.zeros((len(textos), max(map(len, textos))), dtype=np.uint8)
+    for i, texto in enumerate(textos):
+        tabla[i, :len(texto)] = np.frombuffer(texto, dtype=np.uint8)
+    return {'base': base, 'escala': escala, 'tabla': tabla}
+
+
+def digitos(enteros):
+    """Dígitos ASCII de enteros no negativos, alineados a la derecha y rellenos con ceros (bytes nulos)"""
+    ancho = len(str(int(enteros.max()))) if len(enteros) else 1
+    potencias = 10 ** np.arange(ancho - 1, -1, -1, dtype=np.int64)
+    matriz = (enteros[:, None] // potencias % 10 + ord('0')).astype(np.uint8)
+    matriz[(enteros[:, None] < potencias) & (potencias > 1)] = 0
+    return matriz
+
+
+def bloque_csv(modelo, datos, cabecera):
+    """CSV del bloque sin formatear valor por valor: cada columna es una consulta a su tabla de
+    textos, las columnas se concatenan en una matriz de bytes y se quitan los bytes de relleno"""
+    filas = len(datos['id'])
+    separador = np.full((filas, 1), ord(','), dtype=np.uint8)
+    partes = [digitos(datos['id'])]
+    for columna, tabla in zip(modelo['columnas'], modelo['tablas']):
+        valores = datos[columna]
+        faltan = np.isnan(valores)
+        indices = np.rint(np.where(faltan, 0, valores) * tabla['escala']).astype(np.intp) - tabla['base']
+        textos = tabla['tabla'][np.clip(indices, 0, len(tabla['tabla']) - 1)]
+        textos[faltan] = 0
+        partes += [separador, textos]
+    partes.append(np.full((filas, 1), ord('\n'), dtype=np.uint8))
+    matriz = np.concatenate(partes, axis=1).ravel()
+    contenido = matriz[matriz != 0].tobytes()
+    if cabecera:
+        contenido = (','.join(['id'] + modelo['columnas']) + '\n').encode() + contenido
+    return contenido
+
+
+def serializar_bloque(modelo, inicio, filas, semilla, formato, cabecera):
+    """Genera el bloque en el proceso de trabajo y lo devuelve ya serializado"""
+    datos = generar_bloque(modelo, inicio, filas, semilla)
+    if formato == 'parquet':
+        return pa.table(datos)
+    return bloque_csv(modelo, datos, cabecera)
+
+
+def generar(modelo, salida, filas, semilla, formato='csv', tamano_bloque=250_000, n_jobs=-1):
+    """Escribe la cohorte en `salida` y devuelve el número de bytes escritos"""
+    inicios = list(range(0, filas, tamano_bloque))
+    semillas = np.random.SeedSequence(semilla).spawn(len(inicios))
+    bloques = Parallel(n_jobs=n_jobs, return_as='generator')(
+        delayed(serializar_bloque)(modelo, inicio, min(tamano_bloque, filas - inicio), s, formato, i == 0)
+        for i, (inicio, s) in enumerate(zip(inicios, semillas)))
+
+    if formato == 'parquet':
+        escritor = None
+        for tabla in bloques:
+            if escritor is None:
+                escritor = pq.ParquetWriter(salida, tabla.schema)
+            escritor.write_table(tabla)
+        if escritor is not None:
+            escritor.close()
+    else:
+        with open(salida, 'wb') as f:
+            for contenido in bloques:
+                f.write(contenido)
+    return os.path.getsize(salida)
+
+
+def comparar(modelo, df):
+    """Correlaciones clave y tasas de faltantes: referencia frente a la cohorte generada"""
+    columnas = modelo['columnas']
+    referencia = pd.DataFrame(modelo['correlacion'], index=columnas, columns=columnas)
+    generada = df[columnas].rank().corr()
+    for a, b in (('hemo', 'pcv'), ('hemo', 'rc'), ('pcv', 'rc'), ('sc', 'bu')):
+        print(f"   corr. de rangos {a}/{b}: referencia {referencia.loc[a, b]:+.2f}, generada {generada.loc[a, b]:+.2f}")
+    print(f"   faltantes por fila: media {df[COLUMNAS_MODELO].isna().sum(axis=1).mean():.2f} "
+          f"(referencia {modelo['patrones_faltantes'].sum(axis=1) @ modelo['probabilidad_patrones']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera cohortes sintéticas con el esquema de kidney_disease.csv')
+    parser.add_argument('salida')
+    parser.add_argument('--filas', type=int, default=1_000_000)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--formato', choices=['csv', 'parquet'])
+    parser.add_argument('--bloque', type=int, default=250_000, help='filas por bloque generado en paralelo')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--sin-etiquetas', action='store_true', help='omite la columna classification')
+    parser.add_argument('--datos', default='kidney_disease.csv')
+    args = parser.parse_args()
+
+    formato = args.formato or ('parquet' if args.salida.endswith('.parquet') else 'csv')
+    if formato == 'parquet' and pa is None:
+        parser.error('el formato parquet requiere pyarrow')
+
+    modelo = ajustar(args.datos, etiquetas=not args.sin_etiquetas)
+    inicio = time.perf_counter()
+    total_bytes = generar(modelo, args.salida, args.filas, args.semilla, formato, args.bloque, args.n_jobs)
+    segundos = time.perf_counter() - inicio
+    print(f"✅ {args.filas:,} filas en {args.salida} ({total_bytes / 1e6:,.1f} MB) en {segundos:.2f} s: "
+          f"{args.filas / segundos / 1e6:.2f} M filas/s")
+    primer_bloque = generar_bloque(modelo, 0, min(args.filas, args.bloque), np.random.SeedSequence(args.semilla).spawn(1)[0])
+    comparar(modelo, pd.DataFrame(primer_bloque))
+
+
+if __name__ == '__main__':
+    # Desde el módulo importado y no desde __main__, para que los procesos de joblib
+    # encuentren las funciones de los bloques por nombre
+    from generar_cohorte import main as principal
+    principal()
@@ -0,0 +1,346 @@
+"""Informes imprimibles por paciente (HTML y PDF) generados en paralelo y entregados como zip en streaming.
+
+app.py arma los datos de cada paciente (valores de entrada, riesgo y avisos de
+validar_datos) y este módulo los reparte en tareas a un pool de procesos. Cada proceso
+compila la plantilla HTML y la parte fija del PDF una sola vez, al arrancar, y devuelve
+los informes de su tarea. Los zips se escriben en orden a medida que llegan las tareas,
+sin armar el archivo completo en memoria. El módulo no importa app.py, así que los
+procesos del pool arrancan sin cargar los modelos, salvo que el programa principal sea
+app.py: spawn vuelve a importar __main__ en cada proceso, así que con `python app.py`
+(o con un __main__ leído de stdin, que no se puede volver a importar) los informes se
+renderizan en el mismo proceso. Para el pool, servir app.py desde un servidor WSGI.
+
+Uso: python informes.py pacientes.csv [--salida informes.zip] [--todos] [--procesos 4]
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from jinja2 import Environment
+
+# Variables del informe en el orden del formulario: (columna, nombre, unidad)
+VARIABLES = [
+    ('age', 'Edad', 'años'),
+    ('sg', 'Gravedad específica urinaria', ''),
+    ('al', 'Albúmina en orina', ''),
+    ('su', 'Azúcar en orina', ''),
+    ('sc', 'Creatinina sérica', 'mg/dl'),
+    ('bu', 'Urea', 'mg/dl'),
+    ('bgr', 'Glucosa en sangre', 'mg/dl'),
+    ('hemo', 'Hemoglobina', 'g/dl'),
+    ('pcv', 'Volumen celular empaquetado', '%'),
+    ('rc', 'Glóbulos rojos', 'millones/cmm'),
+    ('wc', 'Glóbulos blancos', 'células/cmm'),
+    ('dm', 'Diabetes', ''),
+    ('htn', 'Hipertensión', ''),
+    ('ane', 'Anemia', ''),
+    ('appet', 'Apetito', ''),
+    ('rbc', 'Glóbulos rojos (forma)', ''),
+    ('pc', 'Células del sedimento urinario', ''),
+]
+
+# Codificación de las categóricas, la misma que usa el formulario de evaluación
+CATEGORIAS = {
+    'dm': ('No', 'Sí'), 'htn': ('No', 'Sí'), 'ane': ('No', 'Sí'),
+    'appet': ('Bueno', 'Pobre'), 'rbc': ('Normal', 'Anormal'), 'pc': ('Normal', 'Anormal'),
+}
+
+ADVERTENCIA = ('Este informe es generado por un modelo de Machine Learning y tiene fines informativos '
+               'únicamente. No constituye un diagnóstico médico oficial; consulte con un profesional '
+               'de la salud.')
+
+PLANTILLA_HTML = """<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="UTF-8">
+<title>Informe ERC - {{ p.nombre }}</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; margin: 2cm; color: #222; }
+h1 { font-size: 20px; margin-bottom: 4px; }
+.riesgo { padding: 10px 14px; border-radius: 4px; color: #fff; font-weight: bold; margin: 16px 0; }
+.alto { background: #c0392b; } .bajo { background: #27ae60; }
+table { border-collapse: collapse; width: 100%; font-size: 13px; }
+th, td { border-bottom: 1px solid #ccc; padding: 5px 8px; text-align: left; }
+.fuera td { color: #c0392b; font-weight: bold; }
+.nota { font-size: 11px; color: #666; margin-top: 20px; }
+@media print { body { margin: 1cm; } }
+</style>
+</head>
+<body>
+<h1>Informe de riesgo de enfermedad renal crónica</h1>
+<p>Paciente: <strong>{{ p.id if p.id is not none else '—' }}</strong> · Fila {{ p.fila }} del lote
+{% if p.fecha %} · Panel del {{ p.fecha }}{% endif %}</p>
+<div class="riesgo {{ 'alto' if p.alto else 'bajo' }}">{{ p.etiqueta }} · probabilidad de ERC {{ p.porcentaje }} %</div>
+<table>
+<thead><tr><th>Variable</th><th>Valor</th><th>Rango válido</th><th>Observación</th></tr></thead>
+<tbody>
+{% for v in p.filas %}<tr{% if v.fuera %} class="fuera"{% endif %}><td>{{ v.nombre }}</td><td>{{ v.valor }}</td><td>{{ v.rango }}</td><td>{{ v.observacion }}</td></tr>
+{% endfor %}</tbody>
+</table>
+{% if p.errores %}<p><strong>Valores fuera de rango:</strong> {{ p.errores | join('; ') }}</p>{% endif %}
+<p class="nota">Modelo {{ c.modelo }} · generado el {{ c.generado }}<br>{{ advertencia }}</p>
+</body>
+</html>
+"""
+
+# Estado de cada proceso del pool, armado una sola vez por iniciar_trabajador
+_plantilla = None
+_pdf_fijo = None
+
+
+def iniciar_trabajador():
+    global _plantilla, _pdf_fijo
+    if _plantilla is None:
+        _plantilla = Environment(autoescape=True).from_string(PLANTILLA_HTML)
+        _pdf_fijo = compilar_pdf()
+
+
+@lru_cache(maxsize=16384)
+def _texto_pdf(texto):
+    """Cadena literal de PDF en WinAnsiEncoding (cp1252), con los caracteres especiales escapados.
+    Nombres, rangos y la mayoría de los valores se repiten entre pacientes: se codifican una vez por proceso."""
+    datos = texto.encode('cp1252', 'replace')
+    return b'(' + datos.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _partir(texto, ancho):
+    lineas, actual = [], ''
+    for palabra in texto.split():
+        if actual and len(actual) + 1 + len(palabra) > ancho:
+            lineas.append(actual)
+            actual = palabra
+        else:
+            actual = f'{actual} {palabra}' if actual else palabra
+    return lineas + [actual] if actual else lineas
+
+
+def compilar_pdf():
+    """Objetos fijos del PDF (catálogo, página A4 y fuentes) con sus desplazamientos y los
+    operadores de la advertencia; cada informe solo agrega su flujo de contenido"""
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+    ]
+    cabecera = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    desplazamientos = []
+    for numero, objeto in enumerate(objetos, 1):
+        desplazamientos.append(len(cabecera))
+        cabecera += b'%d 0 obj\n%s\nendobj\n' % (numero, objeto)
+    advertencia = b''.join(b'BT /F1 8 Tf 50 %d Td %s Tj ET\n' % (70 - 11 * i, _texto_pdf(linea))
+                           for i, linea in enumerate(_partir(ADVERTENCIA, 110)))
+    return bytes(cabecera), desplazamientos, advertencia
+
+
+def _pdf(p, c):
+    cabecera, desplazamientos, advertencia = _pdf_fijo
+    ops = [b'BT /F2 16 Tf 50 790 Td %s Tj ET\n' % _texto_pdf('Informe de riesgo de enfermedad renal crónica')]
+    linea = f"Paciente: {p['id'] if p['id'] is not None else '-'}   Fila {p['fila']} del lote"
+    if p['fecha']:
+        linea += f"   Panel del {p['fecha']}"
+    ops.append(b'BT /F1 10 Tf 50 768 Td %s Tj ET\n' % _texto_pdf(linea))
+    ops.append(b'%s rg 50 728 495 26 re f\n' % (b'0.75 0.22 0.17' if p['alto'] else b'0.15 0.68 0.38'))
+    ops.append(b'1 g BT /F2 12 Tf 60 737 Td %s Tj ET 0 g\n'
+               % _texto_pdf(f"{p['etiqueta']} - probabilidad de ERC {p['porcentaje']} %"))
+    y = 700
+    for x, titulo in ((50, 'Variable'), (250, 'Valor'), (350, 'Rango válido'), (450, 'Observación')):
+        ops.append(b'BT /F2 10 Tf %d %d Td %s Tj ET\n' % (x, y, _texto_pdf(titulo)))
+    ops.append(b'0.6 G 50 %d m 545 %d l S\n' % (y - 5, y - 5))
+    for v in p['filas']:
+        y -= 18
+        fuente, color = (b'/F2', b'0.75 0.22 0.17 rg') if v['fuera'] else (b'/F1', b'0 g')
+        ops.append(b'%s BT %s 10 Tf 50 %d Td %s Tj 200 0 Td %s Tj 100 0 Td %s Tj 100 0 Td %s Tj ET\n' % (
+            color, fuente, y, _texto_pdf(v['nombre']), _texto_pdf(v['valor']), _texto_pdf(v['rango']),
+            _texto_pdf(v['observacion'])))
+    ops.append(b'0 g BT /F1 8 Tf 50 95 Td %s Tj ET\n' % _texto_pdf(f"Modelo {c['modelo']} - generado el {c['generado']}"))
+    ops.append(advertencia)
+    flujo = zlib.compress(b''.join(ops), 1)
+    contenido = b'6 0 obj\n<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream\nendobj\n' % (len(flujo), flujo)
+    xref = len(cabecera) + len(contenido)
+    entradas = b''.join(b'%010d 00000 n \n' % d for d in desplazamientos + [len(cabecera)])
+    return b''.join([cabecera, contenido, b'xref\n0 7\n0000000000 65535 f \n', entradas,
+                     b'trailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % xref])
+
+
+def _valor(columna, valor):
+    if valor is None:
+        return 'Sin dato'
+    if columna in CATEGORIAS and valor in (0, 1):
+        return CATEGORIAS[columna][int(valor)]
+    return f'{valor:g}'
+
+
+def renderizar_informes(pacientes, contexto):
+    """Informes de una tarea: lista de (nombre de archivo sin extensión, HTML, PDF)"""
+    iniciar_trabajador()
+    rangos = contexto['rangos']
+    salida = []
+    for paciente in pacientes:
+        fuera = set(paciente['fuera_de_rango'])
+        filas = []
+        for columna, nombre, unidad in VARIABLES:
+            valor = paciente['valores'].get(columna)
+            minimo, maximo = rangos.get(columna, (None, None))
+            filas.append({
+                'nombre': f'{nombre} ({unidad})' if unidad else nombre,
+                'valor': _valor(columna, valor),
+                'rango': f'{minimo:g} - {maximo:g}' if minimo is not None else '',
+                'observacion': ('Fuera de rango' if columna in fuera
+                                else 'Imputado con la media de referencia' if valor is None else ''),
+                'fuera': columna in fuera,
+            })
+        p = dict(paciente, filas=filas, alto=paciente['probabilidad'] > 0.5,
+                 porcentaje=round(paciente['probabilidad'] * 100),
+                 etiqueta='Alto riesgo de ERC' if paciente['probabilidad'] > 0.5 else 'Sin indicios de ERC')
+        nombre = f"fila-{paciente['fila']:06d}"
+        if paciente['id'] is not None:
+            nombre += '-' + re.sub(r'[^A-Za-z0-9_.-]', '_', paciente['id'])[:64]
+        p['nombre'] = nombre
+        html = _plantilla.render(p=p, c=contexto, advertencia=ADVERTENCIA).encode()
+        salida.append((nombre, html, _pdf(p, contexto)))
+    return salida
+
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+
+RUTA_APP = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'))
+
+
+def pool_disponible():
+    """False si los procesos spawn no arrancarían limpios: cada uno vuelve a importar __main__,
+    que con `python app.py` carga de nuevo modelos, historial, auditoría e índices, y que
+    leído de stdin no se puede volver a importar"""
+    principal = sys.modules.get('__main__')
+    nombre = getattr(getattr(principal, '__spec__', None), 'name', None)
+    if nombre is not None:
+        return nombre != 'app'
+    archivo = getattr(principal, '__file__', None)
+    if archivo is None:
+        return True
+    return archivo != '<stdin>' and os.path.realpath(archivo) != RUTA_APP
+
+
+def ejecutor(procesos):
+    """Pool compartido por todas las solicitudes. Usa spawn: hacer fork de un servidor con hilos
+    puede heredar locks tomados por otros hilos."""
+    global _ejecutor
+    with _ejecutor_lock:
+        if _ejecutor is None:
+            _ejecutor = ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=iniciar_trabajador)
+        return _ejecutor
+
+
+def _descartar_ejecutor():
+    global _ejecutor
+    with _ejecutor_lock:
+        _ejecutor = None
+
+
+def renderizar(pacientes, contexto, procesos, filas_por_tarea):
+    """Informes por tareas, en orden. Con un solo proceso, o si el pool no puede arrancar
+    (ver pool_disponible), se renderiza aquí mismo; si no, se mantienen hasta 2 tareas por
+    proceso en vuelo para acotar la memoria."""
+    tareas = (pacientes[i:i + filas_por_tarea] for i in range(0, len(pacientes), filas_por_tarea))
+    if procesos <= 1 or not pool_disponible():
+        for tarea in tareas:
+            yield renderizar_informes(tarea, contexto)
+        return
+    pool = ejecutor(procesos)
+    en_vuelo = deque()
+    try:
+        for tarea in tareas:
+            en_vuelo.append(pool.submit(renderizar_informes, tarea, contexto))
+            if len(en_vuelo) >= 2 * procesos:
+                yield en_vuelo.popleft().result()
+        while en_vuelo:
+            yield en_vuelo.popleft().result()
+    except BrokenProcessPool:
+        _descartar_ejecutor()
+        raise
+    finally:
+        for futuro in en_vuelo:
+            futuro.cancel()
+
+
+class _SalidaZip:
+    """Destino sin seek para ZipFile: guarda lo escrito hasta que el generador lo entrega"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _entrada_zip(nombre, fecha, compresion):
+    info = zipfile.ZipInfo(nombre, fecha)
+    info.compress_type = compresion
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def zip_informes(pacientes, contexto, procesos, filas_por_tarea):
+    """Bytes del zip con un HTML y un PDF por paciente, entregados tarea por tarea. El PDF
+    ya viene comprimido (FlateDecode) y se guarda sin volver a comprimir."""
+    salida = _SalidaZip()
+    fecha = time.localtime()[:6]
+    with zipfile.ZipFile(salida, 'w') as archivo:
+        for informes in renderizar(pacientes, contexto, procesos, filas_por_tarea):
+            for nombre, html, pdf in informes:
+                archivo.writestr(_entrada_zip(f'{nombre}.html', fecha, zipfile.ZIP_DEFLATED), html, compresslevel=1)
+                archivo.writestr(_entrada_zip(f'{nombre}.pdf', fecha, zipfile.ZIP_STORED), pdf)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Informes por paciente de un CSV puntuado con el modelo de app.py')
+    parser.add_argument('csv')
+    parser.add_argument('--salida', default='informes.zip')
+    parser.add_argument('--todos', action='store_true', help='un informe por paciente, no solo los de alto riesgo')
+    parser.add_argument('--procesos', type=int, default=None, help='por defecto, INFORMES_PROCESOS de app.py')
+    args = parser.parse_args()
+
+    # La aplicación se importa aquí para que los procesos del pool no carguen los modelos
+    import app as aplicacion
+    with open(args.csv, 'rb') as f:
+        df = aplicacion.leer_csv(f.read())
+    X, imputados = aplicacion.preparar_matriz(df, con_imputados=True)
+    probabilidades, entrada = aplicacion.registro_modelos.puntuar(X, imputados=imputados)
+    pacientes = aplicacion.pacientes_informe(df, probabilidades, args.todos)
+    contexto = aplicacion.contexto_informes(f"{entrada['nombre']}:{entrada['version']}")
+    procesos = args.procesos or aplicacion.app.config['INFORMES_PROCESOS']
+    inicio = time.perf_counter()
+    with open(args.salida, 'wb') as f:
+        for bloque in zip_informes(pacientes, contexto, procesos, aplicacion.app.config['INFORMES_FILAS_POR_TAREA']):
+            f.write(bloque)
+    segundos = time.perf_counter() - inicio
+    print(f"{len(pacientes):,} informes en {args.salida} ({segundos:.1f} s, {len(pacientes) / segundos:,.0f} informes/s)")
+
+
+if __name__ == '__main__':
+    main()
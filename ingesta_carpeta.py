@@ -0,0 +1,406 @@
+"""Ingesta continua por carpeta compartida: puntúa los CSV que el middleware del laboratorio deja en un directorio.
+
+Estructura de --carpeta (por defecto BANDEJA_FOLDER, dentro de UPLOAD_FOLDER):
+
+    entrada/     el middleware deja aquí los CSV; los nombres que empiezan con '.' o terminan
+                 en .tmp o .part se ignoran hasta que se renombran
+    procesando/  archivos reclamados, con su estado y sus resultados parciales
+    salida/      <nombre>.resultados.csv (fila,prediccion,probabilidad), publicado de una vez al terminar
+    procesados/  archivos de entrada ya puntuados
+    errores/     archivos que no se pudieron puntuar, junto a un .error.txt con el motivo
+
+Un archivo se reclama renombrándolo de entrada/ a procesando/. El rename es atómico, así que
+lo obtiene un solo consumidor, y si el middleware sigue escribiendo, sus escrituras llegan
+al mismo archivo. Mientras crece se puntúan sus líneas completas desde el último byte
+leído, sin volver a leer lo anterior, con el mismo parseo y registro de modelos que los
+CSV subidos por la web. El archivo está terminado cuando inotify informa que llegó por
+rename o que se cerró después de escribirlo; sin inotify (o si el daemon se reinició),
+cuando no crece durante --quietud segundos.
+
+Exactamente una vez: después de cada tramo se guarda el estado (bytes consumidos, filas y
+bytes de resultados confirmados, ya sincronizados a disco). Al reiniciar se descarta lo
+no confirmado y se sigue desde ahí. El resultado se publica en salida/ con un rename y
+recién después la entrada pasa a procesados/, así que cada archivo produce un único
+resultado aunque el proceso muera en cualquier punto. El historial de pacientes del tramo
+se escribe antes de guardar el estado; si el proceso muere entre ambos, el tramo se vuelve
+a puntuar y reemplaza las mismas filas (fechadas con el momento del reclamo).
+
+Uso: python ingesta_carpeta.py [--carpeta uploads/bandeja] [--hilos 2] [--quietud 2] [--sondeo]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import fcntl
+import json
+import os
+import secrets
+import select
+import signal
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as aplicacion
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+EVENTO = struct.Struct('iIII')
+
+# Archivos propios en procesando/, junto a cada archivo reclamado
+SUFIJO_ESTADO = '.~estado'
+SUFIJO_PARCIAL = '.~resultados'
+
+
+class Inotify:
+    """inotify de Linux por ctypes: (carpeta, nombre, máscara) de los cambios en las carpetas vigiladas"""
+
+    def __init__(self, carpetas):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.carpetas = {}
+        for carpeta in carpetas:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(carpeta), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch {carpeta}')
+            self.carpetas[wd] = carpeta
+
+    def leer(self):
+        eventos = []
+        while True:
+            try:
+                datos = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return eventos
+            posicion = 0
+            while posicion < len(datos):
+                wd, mascara, _, largo = EVENTO.unpack_from(datos, posicion)
+                inicio = posicion + EVENTO.size
+                eventos.append((self.carpetas.get(wd), os.fsdecode(datos[inicio:inicio + largo].rstrip(b'\0')), mascara))
+                posicion = inicio + largo
+
+
+class IngestaCarpeta:
+    BLOQUE_LECTURA = 8 * 1024 * 1024  # bytes por tramo: acota la memoria por archivo
+
+    def __init__(self, carpeta, hilos, quietud, intervalo, usar_inotify=True):
+        self.rutas = {nombre: os.path.join(carpeta, nombre)
+                      for nombre in ('entrada', 'procesando', 'salida', 'procesados', 'errores')}
+        for ruta in self.rutas.values():
+            os.makedirs(ruta, exist_ok=True)
+        self.quietud = quietud
+        self.intervalo = intervalo
+        # Se reclaman como mucho 2 archivos con bytes por leer por hilo: el resto queda en entrada/
+        # para otro consumidor. Los ya leídos que solo esperan la quietud no ocupan lugar
+        self.max_activos = 2 * hilos
+        self.ejecutor = ThreadPoolExecutor(hilos, thread_name_prefix='ingesta')
+        self.parar = threading.Event()
+        self._lock = threading.Lock()
+        self._activos = {}  # nombre en procesando/ -> {'estado', 'tamano', 'cambio', 'enviado', 'cerrado', 'ocupado'}
+        self._cerrados_en_entrada = set()
+        self._revisar_entrada = True
+        self._despertar_r, self._despertar_w = os.pipe()
+        os.set_blocking(self._despertar_r, False)
+        os.set_blocking(self._despertar_w, False)
+        self.inotify = None
+        if usar_inotify:
+            try:
+                self.inotify = Inotify([self.rutas['entrada'], self.rutas['procesando']])
+            except (OSError, AttributeError) as e:
+                print(f"inotify no disponible ({e}); se revisa la carpeta cada {intervalo} s", flush=True)
+        self.metricas = {'archivos': 0, 'errores': 0, 'filas': 0, 'segundos_scoring': 0.0}
+
+    # --- Rutas y estado ---
+
+    def _ruta(self, carpeta, nombre=''):
+        return os.path.join(self.rutas[carpeta], nombre)
+
+    def _guardar_estado(self, base, estado):
+        ruta = self._ruta('procesando', base + SUFIJO_ESTADO)
+        with open(ruta + '.tmp', 'w') as f:
+            json.dump(estado, f)
+        os.replace(ruta + '.tmp', ruta)
+
+    def _estado_nuevo(self, base):
+        nombre = base.split('__', 1)[1]
+        raiz = os.path.splitext(nombre)[0]
+        salida = f'{raiz}.resultados.csv'
+        with self._lock:
+            reservadas = {a['estado']['salida'] for a in self._activos.values()}
+        if salida in reservadas or os.path.exists(self._ruta('salida', salida)):
+            # El mismo nombre ya se procesó antes: el resultado lleva el identificador del reclamo
+            salida = f"{raiz}.{base.split('__', 1)[0]}.resultados.csv"
+        return {'nombre': nombre, 'salida': salida, 'reclamado': time.time(),
+                'consumido': 0, 'filas': 0, 'bytes_resultados': 0,
+                'columnas': None, 'sep': None, 'terminado': False, 'error': None}
+
+    def _activar(self, base, estado, cerrado):
+        ahora = time.monotonic()
+        with self._lock:
+            self._activos[base] = {'estado': estado, 'tamano': -1, 'cambio': ahora, 'enviado': -1,
+                                   'cerrado': cerrado, 'ocupado': False}
+
+    def _despertar(self):
+        try:
+            os.write(self._despertar_w, b'x')
+        except BlockingIOError:
+            pass
+
+    # --- Reclamo y reanudación ---
+
+    def reanudar(self):
+        """Retoma lo que quedó en procesando/ de una ejecución anterior"""
+        bases = set()
+        for nombre in os.listdir(self.rutas['procesando']):
+            if nombre.endswith(SUFIJO_ESTADO):
+                bases.add(nombre[:-len(SUFIJO_ESTADO)])
+            elif '__' in nombre and not nombre.endswith((SUFIJO_PARCIAL, '.tmp')):
+                bases.add(nombre)
+        for base in sorted(bases):
+            try:
+                with open(self._ruta('procesando', base + SUFIJO_ESTADO)) as f:
+                    estado = json.load(f)
+            except FileNotFoundError:
+                # Murió entre el reclamo y el primer estado
+                estado = self._estado_nuevo(base)
+                self._guardar_estado(base, estado)
+            if estado['error']:
+                self._descartar(base, estado)
+            elif estado['terminado']:
+                self._publicar(base, estado)
+            else:
+                self._activar(base, estado, cerrado=False)
+        if bases:
+            print(f"Reanudados {len(bases)} archivos de procesando/", flush=True)
+
+    def _reclamar(self):
+        with self._lock:
+            libres = self.max_activos - sum(1 for a in self._activos.values()
+                                            if a['ocupado'] or a['tamano'] != a['estado']['consumido'])
+        if libres <= 0:
+            return
+        candidatos = []
+        with os.scandir(self.rutas['entrada']) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith('.') or entrada.name.endswith(('.tmp', '.part')) or not entrada.is_file():
+                    continue
+                try:
+                    candidatos.append((entrada.stat().st_mtime, entrada.name))
+                except FileNotFoundError:
+                    continue
+        with self._lock:
+            self._cerrados_en_entrada.intersection_update(nombre for _, nombre in candidatos)
+        for _, nombre in sorted(candidatos)[:libres]:
+            base = f'{secrets.token_hex(6)}__{nombre}'
+            try:
+                os.rename(self._ruta('entrada', nombre), self._ruta('procesando', base))
+            except FileNotFoundError:
+                continue  # lo reclamó otro consumidor
+            estado = self._estado_nuevo(base)
+            self._guardar_estado(base, estado)
+            with self._lock:
+                cerrado = nombre in self._cerrados_en_entrada
+                self._cerrados_en_entrada.discard(nombre)
+            self._activar(base, estado, cerrado)
+
+    # --- Bucle principal ---
+
+    def _esperar(self):
+        descriptores = [self._despertar_r] + ([self.inotify.fd] if self.inotify else [])
+        select.select(descriptores, [], [], self.intervalo)
+        try:
+            while os.read(self._despertar_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        if self.inotify is None:
+            self._revisar_entrada = True
+            return
+        for carpeta, nombre, mascara in self.inotify.leer():
+            if carpeta == self.rutas['entrada'] or carpeta is None:
+                self._revisar_entrada = True
+                if mascara & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    with self._lock:
+                        self._cerrados_en_entrada.add(nombre)
+            elif mascara & IN_CLOSE_WRITE:
+                with self._lock:
+                    archivo = self._activos.get(nombre)
+                    if archivo is not None:
+                        archivo['cerrado'] = True
+
+    def ejecutar(self):
+        self.reanudar()
+        while not self.parar.is_set():
+            if self._revisar_entrada:
+                self._revisar_entrada = False
+                self._reclamar()
+            ahora = time.monotonic()
+            with self._lock:
+                activos = [(base, a) for base, a in self._activos.items() if not a['ocupado']]
+            for base, archivo in activos:
+                try:
+                    tamano = os.path.getsize(self._ruta('procesando', base))
+                except FileNotFoundError:
+                    tamano = archivo['tamano']
+                if tamano != archivo['tamano']:
+                    archivo['tamano'], archivo['cambio'] = tamano, ahora
+                terminado = archivo['cerrado'] or ahora - archivo['cambio'] >= self.quietud
+                if terminado or tamano > archivo['enviado']:
+                    archivo['ocupado'], archivo['enviado'] = True, tamano
+                    self.ejecutor.submit(self._avanzar, base, archivo, terminado)
+            self._esperar()
+        self.ejecutor.shutdown(wait=True)
+
+    # --- Trabajo por archivo (un solo hilo a la vez por archivo) ---
+
+    def _avanzar(self, base, archivo, terminado):
+        estado = archivo['estado']
+        finalizado = False
+        try:
+            with open(self._ruta('procesando', base), 'rb') as f:
+                while not self.parar.is_set():
+                    f.seek(estado['consumido'])
+                    datos = f.read(self.BLOQUE_LECTURA)
+                    if not datos:
+                        break
+                    if not (terminado and len(datos) < self.BLOQUE_LECTURA):
+                        # Solo líneas completas; la última puede seguir escribiéndose
+                        corte = datos.rfind(b'\n')
+                        if corte < 0:
+                            break
+                        datos = datos[:corte + 1]
+                    self._puntuar_tramo(base, estado, datos)
+            if terminado and not self.parar.is_set():
+                if estado['columnas'] is None:
+                    raise ValueError('El archivo está vacío')
+                estado['terminado'] = True
+                self._guardar_estado(base, estado)
+                self._publicar(base, estado)
+                finalizado = True
+        except Exception as e:
+            estado['error'] = str(e)
+            self._guardar_estado(base, estado)
+            self._descartar(base, estado)
+            finalizado = True
+        finally:
+            with self._lock:
+                if finalizado:
+                    self._activos.pop(base, None)
+                else:
+                    archivo['ocupado'] = False
+                # Quedó un lugar libre: puede haber archivos esperando en entrada/
+                self._revisar_entrada = True
+            self._despertar()
+
+    def _puntuar_tramo(self, base, estado, datos):
+        inicio = time.perf_counter()
+        consumidos = len(datos)
+        columnas, sep, resultados, filas = estado['columnas'], estado['sep'], b'', 0
+        if columnas is None:
+            columnas, sep, fin_cabecera = aplicacion.leer_cabecera_csv(datos)
+            datos = datos[fin_cabecera:]
+            resultados = aplicacion.CABECERA_RESULTADOS_CSV
+        puntuado = aplicacion.puntuar_lineas_csv(datos, columnas, sep, base.encode())
+        if puntuado is not None:
+            df, p, entrada = puntuado
+            resultados += aplicacion.csv_resultados(estado['filas'], p)
+            filas = len(p)
+            # Fechado con el momento del reclamo: si el tramo se vuelve a puntuar tras un reinicio, reemplaza las mismas filas
+            aplicacion.registrar_historial(df, p, f"{entrada['nombre']}:{entrada['version']}", 'ingesta_carpeta',
+                                           estado['reclamado'])
+            # registrar_historial solo encola: el historial del tramo se escribe antes de confirmarlo en
+            # el estado, porque un tramo confirmado no se vuelve a puntuar tras un reinicio
+            if aplicacion.historial_pacientes is not None:
+                aplicacion.historial_pacientes.volcar()
+
+        ruta = self._ruta('procesando', base + SUFIJO_PARCIAL)
+        with open(ruta, 'r+b' if os.path.exists(ruta) else 'wb') as f:
+            # Descarta lo escrito y no confirmado por un intento anterior interrumpido
+            f.seek(estado['bytes_resultados'])
+            f.write(resultados)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            bytes_resultados = f.tell()
+        estado.update(consumido=estado['consumido'] + consumidos, filas=estado['filas'] + filas,
+                      bytes_resultados=bytes_resultados, columnas=columnas, sep=sep)
+        self._guardar_estado(base, estado)
+        with self._lock:
+            self.metricas['filas'] += filas
+            self.metricas['segundos_scoring'] += time.perf_counter() - inicio
+
+    def _sincronizar_carpeta(self, carpeta):
+        fd = os.open(self.rutas[carpeta], os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _publicar(self, base, estado):
+        """Cada paso se puede repetir: tras un reinicio se retoma desde el primero que falte"""
+        parcial = self._ruta('procesando', base + SUFIJO_PARCIAL)
+        if os.path.exists(parcial):
+            os.truncate(parcial, estado['bytes_resultados'])
+            os.replace(parcial, self._ruta('salida', estado['salida']))
+            self._sincronizar_carpeta('salida')
+        if os.path.exists(self._ruta('procesando', base)):
+            os.replace(self._ruta('procesando', base), self._ruta('procesados', base))
+        os.remove(self._ruta('procesando', base + SUFIJO_ESTADO))
+        with self._lock:
+            self.metricas['archivos'] += 1
+        print(f"{estado['nombre']}: {estado['filas']:,} filas -> salida/{estado['salida']} "
+              f"({time.time() - estado['reclamado']:.2f} s desde el reclamo)", flush=True)
+
+    def _descartar(self, base, estado):
+        if os.path.exists(self._ruta('procesando', base)):
+            with open(self._ruta('errores', base + '.error.txt'), 'w') as f:
+                f.write(estado['error'] + '\n')
+            os.replace(self._ruta('procesando', base), self._ruta('errores', base))
+        for sufijo in (SUFIJO_PARCIAL, SUFIJO_ESTADO):
+            if os.path.exists(self._ruta('procesando', base + sufijo)):
+                os.remove(self._ruta('procesando', base + sufijo))
+        with self._lock:
+            self.metricas['errores'] += 1
+        print(f"{estado['nombre']}: error, movido a errores/ ({estado['error']})", flush=True)
+
+    def detener(self, *_):
+        self.parar.set()
+        self._despertar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Puntúa continuamente los CSV que aparecen en una carpeta compartida')
+    parser.add_argument('--carpeta', default=aplicacion.app.config['BANDEJA_FOLDER'])
+    parser.add_argument('--hilos', type=int, default=2, help='archivos puntuados en paralelo')
+    parser.add_argument('--quietud', type=float, default=2.0,
+                        help='segundos sin crecer para dar por terminado un archivo del que inotify no avisó el cierre')
+    parser.add_argument('--intervalo', type=float, default=0.25, help='segundos entre revisiones sin eventos')
+    parser.add_argument('--sondeo', action='store_true', help='revisar la carpeta periódicamente en lugar de usar inotify')
+    args = parser.parse_args()
+    if aplicacion.modelo is None:
+        parser.error('No hay modelo disponible')
+
+    os.makedirs(args.carpeta, exist_ok=True)
+    # Un solo daemon por carpeta: reanudar procesando/ solo es seguro si nadie más lo está usando
+    bloqueo = open(os.path.join(args.carpeta, '.ingesta.lock'), 'w')
+    try:
+        fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        parser.error(f'Ya hay un proceso de ingesta usando {args.carpeta}')
+
+    ingesta = IngestaCarpeta(args.carpeta, args.hilos, args.quietud, args.intervalo, usar_inotify=not args.sondeo)
+    signal.signal(signal.SIGTERM, ingesta.detener)
+    signal.signal(signal.SIGINT, ingesta.detener)
+    print(f"Vigilando {ingesta.rutas['entrada']} ({'inotify' if ingesta.inotify else 'sondeo'}, {args.hilos} hilos)",
+          flush=True)
+    ingesta.ejecutar()
+    print(f"Detenido: {ingesta.metricas['archivos']} archivos, {ingesta.metricas['filas']:,} filas, "
+          f"{ingesta.metricas['errores']} con error", flush=True)
+
+
+if __name__ == '__main__':
+    main()
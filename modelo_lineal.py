@@ -0,0 +1,40 @@
+"""Plegado de la regresión logística escalada a un único producto X @ w + b.
+
+Lo usan app.py (ModeloLinealCompilado, la versión float32 que sirve el modelo) y entrenar.py
+(las réplicas del ensamble bootstrap), así que ambos pliegan el escalador igual. Solo
+depende de numpy y scipy: importarlo no levanta la aplicación.
+"""
+import numpy as np
+from scipy.special import expit
+
+
+def plegar_lineal(pipeline):
+    """Pipeline(StandardScaler, LogisticRegression) como (w, b) en float64.
+
+    Escalar y aplicar la regresión es afín, así que w = coef / escala y
+    b = intercepto - (media / escala) @ coef.
+    """
+    escalador, clasificador = pipeline.steps[0][1], pipeline.steps[-1][1]
+    coef = clasificador.coef_.ravel()
+    media = escalador.mean_ if escalador.with_mean else np.zeros_like(coef)
+    escala = escalador.scale_ if escalador.with_std else np.ones_like(coef)
+    return coef / escala, clasificador.intercept_[0] - (media / escala) @ coef
+
+
+class ModeloLinealCompilado:
+    """Pipeline(StandardScaler, LogisticRegression) plegado en un único producto X @ w + b.
+
+    En float32 la matriz de entrada ocupa la mitad y se lee una sola vez, sin la copia
+    escalada intermedia.
+    """
+
+    def __init__(self, pipeline, dtype=np.float32):
+        w, b = plegar_lineal(pipeline)
+        self.dtype = dtype
+        self.w = w.astype(dtype)
+        self.b = dtype(b)
+        self.n_features_in_ = len(w)
+
+    def predict_proba(self, X):
+        p = expit(np.asarray(X, dtype=self.dtype) @ self.w + self.b)
+        return np.column_stack([1 - p, p])
@@ -0,0 +1,132 @@
+"""Servidor de scoring binario sobre conexiones persistentes, para integraciones de alta frecuencia.
+
+Cada conexión (TCP o socket Unix) queda abierta y transporta tramas en little-endian,
+con el mismo formato que POST /api/puntuar con Content-Type application/octet-stream:
+
+    solicitud: <uint32 n><float32 x[n][17]>   vectores en el orden de COLUMNAS_MODELO
+    respuesta: <uint32 n><float32 p[n]>       probabilidad de ERC, NaN si el vector no pasa la validación
+
+Las categóricas van codificadas como en el formulario (dm/htn/ane: 1 = Sí; appet: 1 = pobre;
+rbc/pc: 1 = anormal). El cliente puede enviar varias tramas sin esperar las respuestas
+(pipelining): el servidor puntúa juntas todas las tramas completas que tiene leídas, con el
+mismo registro de modelos y las mismas validaciones que la aplicación, y responde en orden.
+Una trama con más de CANAL_BINARIO_MAX_FILAS vectores recibe
+<uint32 0xFFFFFFFF><uint32 largo><mensaje utf-8> y se cierra la conexión.
+
+Uso: python servidor_binario.py [--host 127.0.0.1] [--puerto 8765] [--unix /tmp/erc.sock]
+"""
+import argparse
+import os
+import socket
+import socketserver
+
+import numpy as np
+
+from esquema import CABECERA_TRAMA, TRAMA_ERROR
+
+TAMANO_LECTURA = 256 * 1024
+
+
+class ManejadorBinario(socketserver.BaseRequestHandler):
+    def handle(self):
+        aplicacion = self.server.aplicacion
+        max_filas = aplicacion.app.config['CANAL_BINARIO_MAX_FILAS']
+        conexion = self.request
+        if conexion.family != socket.AF_UNIX:
+            conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        buffer = bytearray()
+        while True:
+            datos = conexion.recv(TAMANO_LECTURA)
+            if not datos:
+                return
+            buffer += datos
+            try:
+                X, filas, consumidos = aplicacion.leer_tramas(buffer, max_filas)
+            except ValueError as e:
+                conexion.sendall(aplicacion.trama_error(str(e)))
+                return
+            if filas:
+                conexion.sendall(aplicacion.responder_tramas(aplicacion.puntuar_vectores(X), filas))
+                del buffer[:consumidos]
+
+
+class ServidorTCP(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ServidorUnix(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ClienteBinario:
+    """Cliente del canal binario. enviar() y recibir() por separado permiten tener varias tramas en vuelo."""
+
+    def __init__(self, direccion):
+        """direccion: ruta de un socket Unix o tupla (host, puerto)"""
+        familia = socket.AF_UNIX if isinstance(direccion, str) else socket.AF_INET
+        self.conexion = socket.socket(familia, socket.SOCK_STREAM)
+        self.conexion.connect(direccion)
+        if familia == socket.AF_INET:
+            self.conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._entrada = self.conexion.makefile('rb')
+
+    def enviar(self, X):
+        X = np.ascontiguousarray(np.atleast_2d(X), dtype='<f4')
+        self.conexion.sendall(CABECERA_TRAMA.pack(len(X)) + X.tobytes())
+
+    def _leer(self, n):
+        datos = self._entrada.read(n)
+        if len(datos) < n:
+            raise ConnectionError('El servidor cerró la conexión')
+        return datos
+
+    def recibir(self):
+        (n,) = CABECERA_TRAMA.unpack(self._leer(CABECERA_TRAMA.size))
+        if n == TRAMA_ERROR:
+            (largo,) = CABECERA_TRAMA.unpack(self._leer(CABECERA_TRAMA.size))
+            raise ValueError(self._leer(largo).decode())
+        return np.frombuffer(self._leer(4 * n), dtype='<f4')
+
+    def puntuar(self, X):
+        self.enviar(X)
+        return self.recibir()
+
+    def cerrar(self):
+        self._entrada.close()
+        self.conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Canal binario de scoring de ERC sobre conexiones persistentes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--unix', help='escuchar en este socket Unix en lugar de TCP')
+    args = parser.parse_args()
+
+    # La aplicación se importa aquí para que ClienteBinario no cargue los modelos
+    import app as aplicacion
+    if aplicacion.modelo is None:
+        parser.error('No hay modelo disponible')
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        servidor, direccion = ServidorUnix(args.unix, ManejadorBinario), args.unix
+    else:
+        servidor = ServidorTCP((args.host, args.puerto), ManejadorBinario)
+        direccion = f'{args.host}:{servidor.server_address[1]}'
+    servidor.aplicacion = aplicacion
+    print(f"Canal binario escuchando en {direccion}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == '__main__':
+    main()